@@ -0,0 +1,487 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+from metrics import ADMISSION_REJECTED
+
+logger = logging.getLogger("payment.admission")
+
+# Подсказка клиенту, через сколько миллисекунд повторить вызов (ключ из дизайна повторов gRPC)
+RETRY_PUSHBACK_KEY = "grpc-retry-pushback-ms"
+# Метаданные с идентификатором клиента; без них клиентом считается адрес соединения
+CLIENT_ID_KEY = "client-id"
+DEFAULT_FUEL_STREAM_WORKERS = 256  # Одновременных потоковых сессий заправки (по колонке на сессию)
+MIN_RETRY = 0.005  # Границы подсказки для повтора (секунды)
+MAX_RETRY = 5.0
+SERVICE_TIME_WEIGHT = 0.1  # Вес нового замера в скользящем среднем времени обслуживания
+REJECTION_WINDOW = 0.5  # Окно замера частоты отказов (секунды)
+
+FUEL_METHODS = ("FuelSession", "ProcessFuelPayment")
+TRANSACTION_METHODS = ("CreateTransaction", "CreateTransactionBatch", "CreditAccount")
+LEDGER_METHODS = ("ListTransactions", "GetAccountAggregates")
+
+
+def _method_name(full_method):
+    return full_method.rsplit("/", 1)[-1]
+
+
+class Lane:
+    """
+    Полоса приоритета: методы со своим пулом потоков, ограниченной очередью
+    и лимитом одновременных вызовов одного клиента.
+    Вызовы с потоком запросов (сессии заправки) держат поток, пока клиент шлет кадры, поэтому
+    у них отдельный пул и своя очередь: долгие сессии не занимают потоки унарных вызовов
+    и не считаются ожидающими вызовами при сбросе нагрузки низших полос.
+    """
+
+    def __init__(self, name, methods, workers, max_queue, client_limit=0, stream_workers=None):
+        """
+        :param methods: Имена методов PaymentService, которые обслуживает полоса.
+        :param workers: Потоки полосы для вызовов с одним запросом.
+        :param max_queue: Сколько принятых вызовов может ждать свободный поток; сверх этого вызовы отклоняются.
+        :param client_limit: Одновременных вызовов одного клиента в полосе (0 - без ограничения).
+        :param stream_workers: Потоки для вызовов с потоком запросов, то есть одновременные сессии
+            (по умолчанию столько же, сколько workers).
+        """
+        self.name = name
+        self.methods = frozenset(methods)
+        self.workers = workers
+        self.stream_workers = stream_workers or workers
+        self.max_queue = max_queue
+        self.client_limit = client_limit
+        self.waiting = 0   # Вызовы с одним запросом, принятые и ждущие поток
+        self.running = 0   # Выполняются
+        self.streams_waiting = 0  # Сессии, ждущие поток
+        self.streams_running = 0
+        self.service_time = 0.0  # Скользящее среднее времени вызова (секунды)
+        self.retry_after = MIN_RETRY  # Последняя подсказка для повтора (секунды)
+        self._rejections = 0
+        self._rejection_rate = 0.0
+        self._window_start = time.monotonic()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stream_pool = None
+
+    @property
+    def pool(self):
+        # Пул создается при первом обращении: серверу grpc.aio он не нужен
+        if self._pool is None:
+            self._pool = _LaneExecutor(self, stream=False)
+        return self._pool
+
+    @property
+    def stream_pool(self):
+        if self._stream_pool is None:
+            self._stream_pool = _LaneExecutor(self, stream=True)
+        return self._stream_pool
+
+    def full(self, stream=False):
+        """
+        :return: True, если очередь вызовов этого вида заполнена.
+        """
+        return (self.streams_waiting if stream else self.waiting) >= self.max_queue
+
+    def queued(self, stream=False):
+        with self._lock:
+            if stream:
+                self.streams_waiting += 1
+            else:
+                self.waiting += 1
+
+    def dequeued(self, stream=False):
+        """
+        Снятие вызова, отмененного до того, как он получил поток.
+        """
+        with self._lock:
+            if stream:
+                self.streams_waiting -= 1
+            else:
+                self.waiting -= 1
+
+    def started(self, stream=False):
+        """
+        :return: Время начала вызова для finished().
+        """
+        with self._lock:
+            if stream:
+                self.streams_waiting -= 1
+                self.streams_running += 1
+            else:
+                self.waiting -= 1
+                self.running += 1
+        return time.perf_counter()
+
+    def finished(self, start, stream=False):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if stream:
+                # Длительность сессии зависит от клиента и не говорит о пропускной способности полосы
+                self.streams_running -= 1
+                return
+            self.running -= 1
+            self.service_time += (elapsed - self.service_time) * SERVICE_TIME_WEIGHT
+
+    def rejected(self):
+        """
+        Учет отказа и подсказка для повтора.
+        Отклоненные клиенты вернутся за местом в очереди вместе с новыми, поэтому подсказка -
+        это очередь плюс клиенты, ожидающие повтора (частота отказов на прошлую подсказку),
+        деленные на пропускную способность полосы. Пока клиенты возвращаются слишком рано,
+        частота отказов растет и подсказка увеличивается.
+        :return: Миллисекунды до повтора.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._rejections += 1
+            elapsed = now - self._window_start
+            if elapsed >= REJECTION_WINDOW:
+                self._rejection_rate = self._rejections / elapsed
+                self._rejections = 0
+                self._window_start = now
+            throughput = self.workers / max(self.service_time, 1e-6)
+            returning = self._rejection_rate * self.retry_after
+            self.retry_after = min(MAX_RETRY, max(MIN_RETRY, (self.waiting + 1 + returning) / throughput))
+            return int(self.retry_after * 1000)
+
+    def acquire_client(self, client):
+        """
+        :return: True, если у клиента есть свободное место в полосе.
+        """
+        with self._lock:
+            count = self._clients.get(client, 0)
+            if count >= self.client_limit:
+                return False
+            self._clients[client] = count + 1
+            return True
+
+    def release_client(self, client):
+        with self._lock:
+            count = self._clients.pop(client) - 1
+            if count:
+                self._clients[client] = count
+
+    def run(self, stream, fn, *args, **kwargs):
+        start = self.started(stream)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.finished(start, stream)
+
+
+class _LaneExecutor(futures.ThreadPoolExecutor):
+    """
+    Пул потоков полосы. gRPC отдает вызов в этот пул вместо общего, если он указан
+    в experimental_thread_pool обработчика; пул считает ожидающие и выполняющиеся вызовы.
+    """
+
+    def __init__(self, lane, stream):
+        workers = lane.stream_workers if stream else lane.workers
+        suffix = "-streams" if stream else ""
+        super().__init__(max_workers=workers, thread_name_prefix=f"lane-{lane.name}{suffix}")
+        self._lane = lane
+        self._stream = stream
+
+    def submit(self, fn, /, *args, **kwargs):
+        self._lane.queued(self._stream)
+        return super().submit(self._lane.run, self._stream, fn, *args, **kwargs)
+
+
+def default_lanes(fuel_workers=10, fuel_queue=100, transaction_workers=4, transaction_queue=50, client_limit=0,
+                  ledger_workers=2, ledger_queue=8, fuel_stream_workers=DEFAULT_FUEL_STREAM_WORKERS):
+    """
+    Полосы сервера в порядке приоритета: кадры заправки, транзакции, затем выборки леджера для сверки.
+    """
+    return [
+        Lane("fuel", FUEL_METHODS, fuel_workers, fuel_queue, stream_workers=fuel_stream_workers),
+        Lane("transactions", TRANSACTION_METHODS, transaction_workers, transaction_queue, client_limit),
+        Lane("ledger", LEDGER_METHODS, ledger_workers, ledger_queue),
+    ]
+
+
+class AdmissionController:
+    """
+    Допуск вызовов по полосам. Вызов отклоняется с RESOURCE_EXHAUSTED, если очередь его полосы
+    заполнена или вызовы более приоритетной полосы ждут поток: тогда нагрузка низших полос
+    сбрасывается, пока приоритетная не разберет очередь.
+    """
+
+    def __init__(self, lanes):
+        """
+        :param lanes: Полосы в порядке убывания приоритета.
+        """
+        self.lanes = list(lanes)
+        self._by_method = {}
+        for lane in self.lanes:
+            for method in lane.methods:
+                self._by_method[method] = lane
+        self._reject_pool = None
+
+    @property
+    def reject_pool(self):
+        # Отказы выполняются одним потоком: они дешевы, а потоки общего пула под перегрузкой
+        # только отнимали бы GIL у полос
+        if self._reject_pool is None:
+            self._reject_pool = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="admission-reject")
+        return self._reject_pool
+
+    def lane_for(self, method):
+        """
+        :return: Полоса метода или None, если метод обслуживается общим пулом без ограничений.
+        """
+        return self._by_method.get(_method_name(method))
+
+    def check(self, lane, stream=False):
+        """
+        Приоритет учитывает только ожидающие вызовы с одним запросом: открытые сессии
+        более приоритетной полосы - это работа клиентов, а не очередь сервера.
+        :param stream: Вызов с потоком запросов.
+        :return: Причина отказа или None, если вызов принят.
+        """
+        if lane.full(stream):
+            return "queue"
+        for other in self.lanes:
+            if other is lane:
+                return None
+            if other.waiting:
+                return "priority"
+        return None
+
+
+def client_key(context):
+    for key, value in context.invocation_metadata():
+        if key == CLIENT_ID_KEY:
+            return value
+    # Адрес без порта: все соединения одного хоста считаются одним клиентом
+    return context.peer().rsplit(":", 1)[0]
+
+
+def _rejection(lane, reason):
+    retry_ms = lane.rejected()
+    ADMISSION_REJECTED.labels(lane.name, reason).inc()
+    logger.debug("Call rejected: lane=%s, reason=%s, retry in %d ms", lane.name, reason, retry_ms)
+    return ((RETRY_PUSHBACK_KEY, str(retry_ms)),), f"{lane.name} lane is overloaded ({reason}), retry in {retry_ms} ms"
+
+
+def _reject(context, lane, reason):
+    trailing_metadata, details = _rejection(lane, reason)
+    context.set_trailing_metadata(trailing_metadata)
+    context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, details)
+
+
+def _rejecting(lane, reason, pool):
+    def behavior(request, context):
+        _reject(context, lane, reason)
+    behavior.experimental_thread_pool = pool
+    return behavior
+
+
+def _client_limited_unary(behavior, lane):
+    def wrapper(request, context):
+        client = client_key(context)
+        if not lane.acquire_client(client):
+            _reject(context, lane, "client")
+        try:
+            return behavior(request, context)
+        finally:
+            lane.release_client(client)
+    return wrapper
+
+
+def _client_limited_stream(behavior, lane):
+    def wrapper(request, context):
+        client = client_key(context)
+        if not lane.acquire_client(client):
+            _reject(context, lane, "client")
+        try:
+            yield from behavior(request, context)
+        finally:
+            lane.release_client(client)
+    return wrapper
+
+
+def _passthrough(behavior, lane):
+    # Обертка нужна только для атрибута пула: сам обработчик менять нельзя, он общий
+    def wrapper(request, context):
+        return behavior(request, context)
+    return wrapper
+
+
+def _lane_handler(handler, lane):
+    if lane.client_limit:
+        unary, stream = _client_limited_unary, _client_limited_stream
+    else:
+        unary = stream = _passthrough
+    if handler.unary_unary:
+        behavior, factory = unary(handler.unary_unary, lane), grpc.unary_unary_rpc_method_handler
+    elif handler.unary_stream:
+        behavior, factory = stream(handler.unary_stream, lane), grpc.unary_stream_rpc_method_handler
+    elif handler.stream_unary:
+        behavior, factory = unary(handler.stream_unary, lane), grpc.stream_unary_rpc_method_handler
+    else:
+        behavior, factory = stream(handler.stream_stream, lane), grpc.stream_stream_rpc_method_handler
+    behavior.experimental_thread_pool = lane.stream_pool if handler.request_streaming else lane.pool
+    return factory(behavior, handler.request_deserializer, handler.response_serializer)
+
+
+def _rejecting_handler(handler, behavior):
+    # Тип обработчика отказа совпадает с методом, иначе gRPC не сможет прочитать запрос
+    if handler.unary_unary:
+        factory = grpc.unary_unary_rpc_method_handler
+    elif handler.unary_stream:
+        factory = grpc.unary_stream_rpc_method_handler
+    elif handler.stream_unary:
+        factory = grpc.stream_unary_rpc_method_handler
+    else:
+        factory = grpc.stream_stream_rpc_method_handler
+    return factory(behavior, handler.request_deserializer, handler.response_serializer)
+
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """
+    Перехватчик сервера с пулом потоков: вызовы полос выполняются в пулах своих полос,
+    поэтому кадры заправки не ждут за транзакциями в общей очереди сервера.
+    Решение о допуске принимается до постановки вызова в очередь; отказ выполняется
+    в отдельном потоке и сразу возвращает RESOURCE_EXHAUSTED с подсказкой для повтора.
+    Должен стоять первым в списке перехватчиков, чтобы его пул не потерялся в чужой обертке.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self._handlers = {}  # Обернутые обработчики кэшируются по методу
+
+    def intercept_service(self, continuation, handler_call_details):
+        method = handler_call_details.method
+        lane = self.controller.lane_for(method)
+        if lane is None:
+            return continuation(handler_call_details)
+        handler = self._handlers.get(method)
+        if handler is None:
+            handler = continuation(handler_call_details)
+            if handler is None:
+                return None
+            handler = self._handlers[method] = _lane_handler(handler, lane)
+        reason = self.controller.check(lane, handler.request_streaming)
+        if reason is not None:
+            return _rejecting_handler(handler, _rejecting(lane, reason, self.controller.reject_pool))
+        return handler
+
+
+async def _async_reject(context, lane, reason):
+    trailing_metadata, details = _rejection(lane, reason)
+    context.set_trailing_metadata(trailing_metadata)
+    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, details)
+
+
+def _async_rejecting(lane, reason):
+    async def behavior(request, context):
+        await _async_reject(context, lane, reason)
+    return behavior
+
+
+@contextlib.asynccontextmanager
+async def _async_lane_slot(lane, slots, stream):
+    # Вызов считается ожидающим, пока ждет слот. Если клиент отменил вызов или истек дедлайн,
+    # он снимается из очереди: иначе ожидающий навсегда остался бы в полосе и check()
+    # отклонял бы все вызовы низших полос
+    lane.queued(stream)
+    try:
+        await slots.acquire()
+    except BaseException:
+        lane.dequeued(stream)
+        raise
+    start = lane.started(stream)
+    try:
+        yield
+    finally:
+        lane.finished(start, stream)
+        slots.release()
+
+
+def _async_lane_unary(behavior, lane, slots, stream):
+    async def wrapper(request, context):
+        # Между допуском и этим местом цикл событий успевает принять другие вызовы, поэтому очередь проверяется снова
+        if lane.full(stream):
+            await _async_reject(context, lane, "queue")
+        async with _async_lane_slot(lane, slots, stream):
+            if not lane.client_limit:
+                return await behavior(request, context)
+            client = client_key(context)
+            if not lane.acquire_client(client):
+                await _async_reject(context, lane, "client")
+            try:
+                return await behavior(request, context)
+            finally:
+                lane.release_client(client)
+    return wrapper
+
+
+def _async_lane_stream(behavior, lane, slots, stream):
+    async def wrapper(request, context):
+        if lane.full(stream):
+            await _async_reject(context, lane, "queue")
+        async with _async_lane_slot(lane, slots, stream):
+            client = None
+            if lane.client_limit:
+                client = client_key(context)
+                if not lane.acquire_client(client):
+                    await _async_reject(context, lane, "client")
+            try:
+                async for response in behavior(request, context):
+                    yield response
+            finally:
+                if client is not None:
+                    lane.release_client(client)
+    return wrapper
+
+
+class AsyncAdmissionInterceptor(grpc.aio.ServerInterceptor):
+    """
+    То же для сервера grpc.aio: потоков у полос нет, место в полосе - слот семафора,
+    а очередь полосы - вызовы, ожидающие слот. У вызовов с потоком запросов свой семафор на stream_workers слотов.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self._slots = {(lane.name, False): asyncio.Semaphore(lane.workers) for lane in controller.lanes}
+        self._slots.update({(lane.name, True): asyncio.Semaphore(lane.stream_workers) for lane in controller.lanes})
+        self._handlers = {}
+
+    async def intercept_service(self, continuation, handler_call_details):
+        method = handler_call_details.method
+        lane = self.controller.lane_for(method)
+        if lane is None:
+            return await continuation(handler_call_details)
+        handler = self._handlers.get(method)
+        if handler is None:
+            handler = await continuation(handler_call_details)
+            if handler is None:
+                return None
+            stream = handler.request_streaming
+            slots = self._slots[lane.name, stream]
+            if handler.unary_unary:
+                handler = grpc.unary_unary_rpc_method_handler(
+                    _async_lane_unary(handler.unary_unary, lane, slots, stream),
+                    handler.request_deserializer, handler.response_serializer)
+            elif handler.unary_stream:
+                handler = grpc.unary_stream_rpc_method_handler(
+                    _async_lane_stream(handler.unary_stream, lane, slots, stream),
+                    handler.request_deserializer, handler.response_serializer)
+            elif handler.stream_unary:
+                handler = grpc.stream_unary_rpc_method_handler(
+                    _async_lane_unary(handler.stream_unary, lane, slots, stream),
+                    handler.request_deserializer, handler.response_serializer)
+            else:
+                handler = grpc.stream_stream_rpc_method_handler(
+                    _async_lane_stream(handler.stream_stream, lane, slots, stream),
+                    handler.request_deserializer, handler.response_serializer)
+            self._handlers[method] = handler
+        reason = self.controller.check(lane, handler.request_streaming)
+        if reason is not None:
+            return _rejecting_handler(handler, _async_rejecting(lane, reason))
+        return handler
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import logging
+from concurrent import futures
+
+import grpc
+
+import payment_pb2_grpc
+from server import TRANSACTION_FAILED, PaymentService, decode_cursor
+from metrics import AsyncServerMetricsInterceptor
+from admission import AsyncAdmissionInterceptor
+
+logger = logging.getLogger("payment.aio_server")
+
+# Потоки для вызовов, которые ждут fsync леджера или авторизацию холда: их много одновременно,
+# чтобы ожидающие попадали в одну группу коммита
+DEFAULT_BLOCKING_WORKERS = 64
+
+
+class AsyncPaymentService(payment_pb2_grpc.PaymentServiceServicer):
+    """
+    Асинхронные обработчики PaymentService для grpc.aio.
+    Проверка подписей уходит в пул SignatureVerifier, дешевые вызовы (VerifyTransaction)
+    выполняются прямо в цикле событий. Запись в леджер с журналом ждет fsync, а кадры заправки -
+    проверку подписи открытия, авторизацию холда и запись итога, поэтому они идут в пул потоков.
+    """
+
+    def __init__(self, service=None, blocking_workers=DEFAULT_BLOCKING_WORKERS):
+        """
+        :param service: PaymentService с хранилищем, холдами и пулом проверки подписей.
+        :param blocking_workers: Размер пула для вызовов, блокирующих поток.
+        """
+        self.service = service or PaymentService()
+        self._executor = futures.ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="aio-blocking")
+
+    async def _blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(function, *args))
+
+    async def _commit(self, function, *args):
+        # Хранилище в памяти не блокирует: лишний переход в пул потоков не нужен
+        if not self.service.transactions.durable:
+            return function(*args)
+        return await self._blocking(function, *args)
+
+    async def CreateTransaction(self, request, context):
+        future = self.service.submit_verification(request)
+        if future is None:
+            return TRANSACTION_FAILED
+        try:
+            verified = await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.warning("Transaction failed: %s", e)
+            return TRANSACTION_FAILED
+        if not verified:
+            logger.warning("Transaction failed: invalid signature", extra={"sender_id": request.sender_id})
+            return TRANSACTION_FAILED
+        # Ключ идемпотентности занимается только запросом с проверенной подписью
+        original, first = self.service.claim_idempotency(request)
+        if not first:
+            if original is None:
+                return self.service.idempotency_conflict(request)
+            return await asyncio.wrap_future(original)
+        response = TRANSACTION_FAILED
+        try:
+            response = await self._commit(self.service.commit_transaction, request, verified)
+            return response
+        finally:
+            self.service.resolve_idempotency(request, response)
+
+    async def CreateTransactionBatch(self, request, context):
+        pending = [self.service.submit_verification(item) for item in request.transactions]
+        results = await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in pending if future is not None),
+            return_exceptions=True
+        )
+        results = iter(results)
+        accepted = []
+        for future in pending:
+            result = next(results) if future is not None else False
+            if isinstance(result, Exception):
+                logger.warning("Transaction failed: %s", result)
+                result = False
+            accepted.append(result)
+        return await self._commit(self.service.commit_batch, request, accepted)
+
+    async def CreditAccount(self, request, context):
+        if self.service.ring is None:
+            await context.abort(grpc.StatusCode.PERMISSION_DENIED, "Credits are accepted only by shard workers")
+        if self.service.credits is None or not self.service.credits.confirm(request):
+            logger.warning("Credit rejected: invalid peer signature, ID=%s, Receiver=%s",
+                           request.transaction_id, request.receiver_id)
+            await context.abort(grpc.StatusCode.PERMISSION_DENIED, "Credits are accepted only from shard workers")
+        return await self._commit(self.service.CreditAccount, request, context)
+
+    async def VerifyTransaction(self, request, context):
+        return self.service.VerifyTransaction(request, context)
+
+    async def ProcessFuelPayment(self, request, context):
+        return await self._blocking(self.service.ProcessFuelPayment, request, context)
+
+    async def ListTransactions(self, request, context):
+        try:
+            start_row = decode_cursor(request.cursor)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        for page in self.service.transaction_pages(request, start_row):
+            yield page
+
+    async def GetAccountAggregates(self, request, context):
+        try:
+            start_code = decode_cursor(request.cursor)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        for page in self.service.aggregate_pages(request, start_code):
+            yield page
+
+    async def FuelSession(self, request_iterator, context):
+        opened = set()
+        try:
+            async for frame in request_iterator:
+                ack = await self._blocking(self.service.process_frame, frame)
+                self.service.track_fuel_session(opened, frame, ack)
+                yield ack
+                if frame.is_finished:
+                    return
+        finally:
+            # Отмена вызова приходит в генератор как CancelledError: сессии без завершающего кадра закрываются.
+            # Ожидать пул здесь нельзя (отмененная задача не дождется), поэтому итог проводится в фоне
+            if opened:
+                self._executor.submit(self.service.abandon_fuel_sessions, opened)
+
+
+async def serve_aio(bind_address, service=None, max_concurrent_rpcs=None, options=(), with_metrics=False,
+                    admission=None):
+    """
+    Запуск сервера grpc.aio и ожидание его остановки.
+    :param admission: AdmissionController с полосами вызовов (None - без контроля допуска).
+    """
+    interceptors = [AsyncAdmissionInterceptor(admission)] if admission is not None else []
+    if with_metrics:
+        interceptors.append(AsyncServerMetricsInterceptor())
+    server = grpc.aio.server(interceptors=interceptors, maximum_concurrent_rpcs=max_concurrent_rpcs,
+                             options=options)
+    servicer = AsyncPaymentService(service)
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(servicer, server)
+    server.add_insecure_port(bind_address)
+    await server.start()
+    servicer.service.verifier.warm_up()
+    logger.info("Async server started on %s...", bind_address)
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(grace=None)
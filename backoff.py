@@ -0,0 +1,137 @@
+import random
+import time
+
+import grpc
+
+from admission import RETRY_PUSHBACK_KEY
+
+# Коды, при которых вызов не выполнялся и его можно безопасно повторить
+RETRYABLE_CODES = frozenset({grpc.StatusCode.RESOURCE_EXHAUSTED})
+
+
+def retry_pushback(error):
+    """
+    Подсказка сервера для повтора из трейлеров ответа.
+    :return: Секунды до повтора или None, если сервер подсказку не дал.
+    """
+    for key, value in error.trailing_metadata() or ():
+        if key == RETRY_PUSHBACK_KEY:
+            try:
+                return max(0, int(value)) / 1000
+            except ValueError:
+                return None
+    return None
+
+
+class RetryingStub:
+    """
+    Обертка над PaymentServiceStub: унарные вызовы, отклоненные сервером с RESOURCE_EXHAUSTED,
+    повторяются не раньше подсказки сервера и с экспоненциальной паузой со случайным разбросом,
+    чтобы клиенты не возвращались одновременно. Потоковые вызовы передаются без изменений,
+    постраничные выборки леджера с повторами читаются через pages().
+    """
+
+    def __init__(self, stub, max_attempts=5, base_delay=0.01, max_delay=1.0, retry_codes=RETRYABLE_CODES,
+                 sleep=time.sleep, rng=random.random):
+        """
+        :param stub: PaymentServiceStub.
+        :param max_attempts: Максимум попыток одного вызова, включая первую.
+        :param base_delay: Пауза перед первым повтором без подсказки сервера (секунды).
+        :param max_delay: Предел экспоненциальной паузы (секунды).
+        :param retry_codes: Коды ошибок, при которых вызов повторяется.
+        """
+        self._stub = stub
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = retry_codes
+        self._sleep = sleep
+        self._rng = rng
+        self.retries = 0  # Сколько повторов сделано через эту обертку
+
+    def __getattr__(self, name):
+        method = getattr(self._stub, name)
+        if isinstance(method, grpc.UnaryUnaryMultiCallable):
+            method = _RetryingCall(self, method)
+        setattr(self, name, method)
+        return method
+
+    def delay(self, attempt, error):
+        """
+        Пауза перед повтором.
+        :param attempt: Номер неудачной попытки, начиная с 1.
+        """
+        backoff = self._rng() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        pushback = retry_pushback(error)
+        return backoff if pushback is None else max(pushback, backoff)
+
+    def call(self, method, request, timeout=None, **kwargs):
+        """
+        Вызов с повторами в пределах timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt = 1
+        while True:
+            try:
+                return method(request, timeout=timeout, **kwargs)
+            except grpc.RpcError as e:
+                if e.code() not in self.retry_codes or attempt >= self.max_attempts:
+                    raise
+                pause = self.delay(attempt, e)
+                if deadline is not None:
+                    timeout = deadline - time.monotonic() - pause
+                    if timeout <= 0:
+                        raise
+                self._sleep(pause)
+                self.retries += 1
+                attempt += 1
+
+    def pages(self, name, request, timeout=None):
+        """
+        Чтение постраничной выборки леджера (ListTransactions, GetAccountAggregates) до конца.
+        Если поток оборвался с повторяемым кодом, чтение продолжается с курсора последней полученной
+        страницы, так что страницы не повторяются и не теряются.
+        :param name: Имя потокового метода.
+        :param request: Запрос с полем cursor; не изменяется.
+        :return: Генератор страниц.
+        """
+        method = getattr(self._stub, name)
+        request_type = type(request)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempt = 1
+        while True:
+            try:
+                for page in method(request, timeout=timeout):
+                    yield page
+                    if not page.cursor:
+                        return
+                    resumed = request_type()
+                    resumed.CopyFrom(request)
+                    resumed.cursor = page.cursor
+                    request = resumed
+                    attempt = 1
+                return
+            except grpc.RpcError as e:
+                if e.code() not in self.retry_codes or attempt >= self.max_attempts:
+                    raise
+                pause = self.delay(attempt, e)
+                if deadline is not None:
+                    timeout = deadline - time.monotonic() - pause
+                    if timeout <= 0:
+                        raise
+                self._sleep(pause)
+                self.retries += 1
+                attempt += 1
+
+
+class _RetryingCall:
+    def __init__(self, stub, method):
+        self._stub = stub
+        self._method = method
+
+    def __call__(self, request, timeout=None, **kwargs):
+        return self._stub.call(self._method, request, timeout, **kwargs)
+
+    def __getattr__(self, name):
+        # future() и with_call() остаются вызовами без повторов
+        return getattr(self._method, name)
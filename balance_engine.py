@@ -0,0 +1,208 @@
+import threading
+from array import array
+
+MINOR_UNITS = 100  # Копеек в рубле
+MAX_AMOUNT = 10 ** 12  # Предел суммы одной операции в рублях: сумма в копейках с запасом помещается в int64
+
+
+def to_minor(amount):
+    """
+    Перевод суммы в рублях в целые копейки.
+    """
+    return int(round(amount * MINOR_UNITS))
+
+
+def valid_amount(amount):
+    """
+    Проверка суммы из запроса до перевода в копейки: to_minor не принимает NaN и бесконечность.
+    :return: True, если сумма положительна и не больше MAX_AMOUNT (NaN и бесконечность не проходят сравнение).
+    """
+    return 0 < amount <= MAX_AMOUNT
+
+
+def from_minor(amount):
+    return amount / MINOR_UNITS
+
+
+class BalanceEngine:
+    """
+    Хранилище балансов множества счетов.
+    Балансы и холды лежат в массивах целых копеек, номер счета - индекс в массивах.
+    Счета распределены по полосам блокировок: операции над разными полосами
+    не конкурируют, а операции над несколькими счетами берут полосы по возрастанию номера,
+    поэтому взаимных блокировок не возникает.
+    """
+
+    def __init__(self, stripes=256):
+        """
+        :param stripes: Количество полос блокировок.
+        """
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._open_lock = threading.Lock()  # Только для открытия новых счетов
+        self._slots = {}                    # ID счета -> номер в массивах
+        self._accounts = []                 # Номер -> ID счета
+        self._available = array("q")        # Доступный остаток
+        self._held = array("q")             # Заблокированные холдами средства
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __contains__(self, account_id):
+        return account_id in self._slots
+
+    def open(self, account_id, balance=0):
+        """
+        Открытие счета. Для уже открытого счета ничего не меняет.
+        :param balance: Начальный баланс в копейках.
+        :return: True, если счет был открыт этим вызовом.
+        """
+        if account_id in self._slots:
+            return False
+        with self._open_lock:
+            if account_id in self._slots:
+                return False
+            self._available.append(balance)
+            self._held.append(0)
+            self._accounts.append(account_id)
+            # Счет становится виден последним, когда его ячейки уже есть в массивах
+            self._slots[account_id] = len(self._accounts) - 1
+            return True
+
+    def _slot(self, account_id):
+        slot = self._slots.get(account_id)
+        if slot is None:
+            raise KeyError(f"Unknown account: {account_id}")
+        return slot
+
+    def _lock(self, slot):
+        return self._locks[slot % len(self._locks)]
+
+    @staticmethod
+    def _check_amount(amount):
+        if amount <= 0:
+            raise ValueError(f"Invalid amount: {amount}. Amount must be positive.")
+
+    def balance(self, account_id):
+        """
+        :return: Кортеж (доступный остаток, сумма холдов) в копейках.
+        """
+        slot = self._slot(account_id)
+        with self._lock(slot):
+            return self._available[slot], self._held[slot]
+
+    def debit(self, account_id, amount):
+        """
+        Списание с доступного остатка.
+        :return: True, если средств хватило, иначе False.
+        """
+        self._check_amount(amount)
+        slot = self._slot(account_id)
+        with self._lock(slot):
+            if self._available[slot] < amount:
+                return False
+            self._available[slot] -= amount
+            return True
+
+    def credit(self, account_id, amount):
+        """
+        Зачисление на доступный остаток.
+        """
+        self._check_amount(amount)
+        slot = self._slot(account_id)
+        with self._lock(slot):
+            self._available[slot] += amount
+
+    def hold(self, account_id, amount):
+        """
+        Перевод средств из доступного остатка в холд.
+        :return: True, если средств хватило, иначе False.
+        """
+        self._check_amount(amount)
+        slot = self._slot(account_id)
+        with self._lock(slot):
+            if self._available[slot] < amount:
+                return False
+            self._available[slot] -= amount
+            self._held[slot] += amount
+            return True
+
+    def capture(self, account_id, amount, release=0):
+        """
+        Списание из холда и, одной операцией, возврат части холда в доступный остаток.
+        :param amount: Сумма списания.
+        :param release: Сумма, которая возвращается из холда.
+        :return: True, если холда хватило, иначе False.
+        """
+        if amount < 0 or release < 0:
+            raise ValueError(f"Invalid amount: {amount}, release: {release}. Amounts must not be negative.")
+        slot = self._slot(account_id)
+        with self._lock(slot):
+            if self._held[slot] < amount + release:
+                return False
+            self._held[slot] -= amount + release
+            self._available[slot] += release
+            return True
+
+    def release(self, account_id, amount):
+        """
+        Возврат средств из холда в доступный остаток.
+        :return: True, если холда хватило, иначе False.
+        """
+        return self.capture(account_id, 0, amount)
+
+    def transfer(self, sender_id, receiver_id, amount, from_held=False):
+        """
+        Атомарный перевод между счетами.
+        :param from_held: Списать с отправителя ранее выставленный холд, а не доступный остаток.
+        :return: True, если у отправителя хватило средств, иначе False.
+        """
+        self._check_amount(amount)
+        sender = self._slot(sender_id)
+        receiver = self._slot(receiver_id)
+        stripes = len(self._locks)
+        first, second = sorted((sender % stripes, receiver % stripes))
+        source = self._held if from_held else self._available
+        with self._locks[first]:
+            if second != first:
+                self._locks[second].acquire()
+            try:
+                if source[sender] < amount:
+                    return False
+                source[sender] -= amount
+                self._available[receiver] += amount
+                return True
+            finally:
+                if second != first:
+                    self._locks[second].release()
+
+    def transfer_many(self, transfers, from_held=False):
+        """
+        Пачка переводов под одним захватом блокировок.
+        Полосы всех счетов пачки берутся по возрастанию номера, переводы
+        применяются по порядку, каждый успешен или нет независимо от остальных.
+        :param transfers: Кортежи (sender_id, receiver_id, amount).
+        :param from_held: Списывать с холдов отправителей, а не с доступных остатков.
+        :return: Список результатов True/False в порядке переводов.
+        """
+        resolved = []
+        for sender_id, receiver_id, amount in transfers:
+            self._check_amount(amount)
+            resolved.append((self._slot(sender_id), self._slot(receiver_id), amount))
+        stripes = len(self._locks)
+        locks = sorted({slot % stripes for sender, receiver, _ in resolved for slot in (sender, receiver)})
+        for stripe in locks:
+            self._locks[stripe].acquire()
+        try:
+            source = self._held if from_held else self._available
+            available = self._available
+            results = []
+            for sender, receiver, amount in resolved:
+                ok = source[sender] >= amount
+                if ok:
+                    source[sender] -= amount
+                    available[receiver] += amount
+                results.append(ok)
+            return results
+        finally:
+            for stripe in reversed(locks):
+                self._locks[stripe].release()
@@ -1,12 +1,22 @@
+import logging
+
+from balance_engine import BalanceEngine, from_minor, to_minor
+
+logger = logging.getLogger("payment.accounts")
+
+
 class BankAccount:
-    def __init__(self, user_id, initial_balance=1000.0):
+    def __init__(self, user_id, initial_balance=1000.0, engine=None):
         """
         Инициализация банковского счета.
+        Баланс хранится в BalanceEngine, объект счета - только представление над ним.
         :param user_id: Идентификатор пользователя.
         :param initial_balance: Начальный баланс счета (по умолчанию 1000.0 рублей).
+        :param engine: Общее хранилище балансов (по умолчанию у счета свое).
         """
         self.user_id = user_id
-        self.balance = initial_balance
+        self.engine = engine if engine is not None else BalanceEngine(stripes=1)
+        self.engine.open(user_id, to_minor(initial_balance))
 
     def withdraw(self, amount):
         """
@@ -14,23 +24,23 @@ class BankAccount:
         :param amount: Сумма для снятия.
         :return: True, если снятие прошло успешно, иначе False.
         """
-        if amount <= 0:
-            print(f"Invalid amount: {amount}. Amount must be positive.")
+        if amount <= 0 or to_minor(amount) <= 0:
+            logger.warning("Invalid amount: %s. Amount must be positive.", amount)
             return False
-        if self.balance >= amount:
-            self.balance -= amount
-            print(f"Withdrawal successful: {amount:.2f} RUB deducted. New balance: {self.balance:.2f} RUB")
+        # Проверка остатка и списание выполняются атомарно под блокировкой счета
+        if self.engine.debit(self.user_id, to_minor(amount)):
+            logger.debug("Withdrawal successful: %.2f RUB deducted. New balance: %.2f RUB",
+                         amount, self.get_balance())
             return True
-        else:
-            print(f"Insufficient funds. Required: {amount:.2f} RUB, Available: {self.balance:.2f} RUB")
-            return False
+        logger.debug("Insufficient funds. Required: %.2f RUB, Available: %.2f RUB", amount, self.get_balance())
+        return False
 
     def get_balance(self):
         """
         Получение текущего баланса счета.
         :return: Текущий баланс.
         """
-        return self.balance
+        return from_minor(self.engine.balance(self.user_id)[0])
 
     def __str__(self):
-        return f"BankAccount(user_id={self.user_id}, balance={self.balance:.2f} RUB)"
\ No newline at end of file
+        return f"BankAccount(user_id={self.user_id}, balance={self.get_balance():.2f} RUB)"
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+Задержка кадров заправки под потоком транзакций.
+
+Сервер запускается отдельным процессом. Клиентские процессы заваливают его подписанными
+CreateTransaction в замкнутом цикле, а в это время колонка шлет кадры заправки: потоковой
+сессией FuelSession и унарными ProcessFuelPayment (каждый такой вызов заново проходит очередь
+сервера). Сравниваются сервер без нагрузки, сервер с --no-admission (общий пул и неограниченная
+очередь) и сервер с полосами приоритета и сбросом нагрузки. Клиенты транзакций повторяют
+отклоненные вызовы через RetryingStub по подсказке сервера.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_admission --clients 2 --concurrency 128 --frames 300
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from backoff import RetryingStub
+from benchmarks.bench_fuel import percentile
+from client import FuelSessionClient, load_private_key
+from signing import sign_fuel_session, sign_request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_ARGS = ["--in-memory", "--metrics-port", "0", "--key-reload-interval", "0", "--log-level", "WARNING",
+               "--initial-balance", "1e9"]
+FUEL_PRICE = 54.37
+WARM_UP = 1.0  # Секунды потока транзакций до первых кадров
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def signed_requests(count):
+    private_key = load_private_key(os.path.join(ROOT, "user1_private.pem"))
+    requests = []
+    for _ in range(count):
+        request = payment_pb2.TransactionRequest(sender_id="user1", receiver_id="user2", amount=0.01)
+        requests.append(sign_request(private_key, request).SerializeToString())
+    return requests
+
+
+def flood(address, requests, concurrency, attempts, ready, stop):
+    """
+    Замкнутый цикл CreateTransaction в одном клиентском процессе.
+    :param ready: Очередь, в которую процесс сообщает, что нагрузка пошла.
+    :param stop: Событие окончания нагрузки.
+    :return: Словарь счетчиков: ok, rejected (RESOURCE_EXHAUSTED после всех попыток), failed, retries,
+             и длительность нагрузки в секундах.
+    """
+    requests = [payment_pb2.TransactionRequest.FromString(data) for data in requests]
+    lock = threading.Lock()
+    totals = {"ok": 0, "rejected": 0, "failed": 0, "retries": 0}
+    # Событие менеджера опрашивается через IPC, поэтому потоки смотрят на локальную копию
+    stopped = threading.Event()
+
+    def worker(offset, stub):
+        index = offset
+        counts = {"ok": 0, "rejected": 0, "failed": 0}
+        while not stopped.is_set():
+            try:
+                outcome = "ok" if stub.CreateTransaction(requests[index % len(requests)], timeout=10).success \
+                    else "failed"
+            except grpc.RpcError as e:
+                outcome = "rejected" if e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED else "failed"
+            counts[outcome] += 1
+            index += concurrency
+        with lock:
+            for key, value in counts.items():
+                totals[key] += value
+            totals["retries"] += stub.retries
+
+    with grpc.insecure_channel(address) as channel:
+        base = payment_pb2_grpc.PaymentServiceStub(channel)
+        threads = [threading.Thread(target=worker, args=(n, RetryingStub(base, max_attempts=attempts)))
+                   for n in range(concurrency)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        ready.put(True)
+        stop.wait()
+        stopped.set()
+        for thread in threads:
+            thread.join()
+    totals["duration"] = time.monotonic() - start
+    return totals
+
+
+def fuel_latencies(stub, frames, interval):
+    """
+    :return: Кортеж (задержки кадров потоковой сессии, задержки унарных кадров, отказы унарных кадров).
+    """
+    private_key = load_private_key(os.path.join(ROOT, "user2_private.pem"))
+    session = FuelSessionClient(stub, FUEL_PRICE, account_id="user2", private_key=private_key)
+    session_id = uuid.uuid4().hex
+    opened_at, signature = sign_fuel_session(private_key, session_id, "user2")
+    unary, rejected = [], 0
+    for _ in range(frames):
+        session.send(0.1)
+        start = time.perf_counter()
+        try:
+            stub.ProcessFuelPayment(payment_pb2.FuelPaymentRequest(
+                fuel_price_per_liter=FUEL_PRICE, liters=0.1, session_id=session_id, account_id="user2",
+                opened_at=opened_at, signature=signature), timeout=10)
+            unary.append(time.perf_counter() - start)
+        except grpc.RpcError:
+            rejected += 1
+        time.sleep(interval)
+    stub.ProcessFuelPayment(payment_pb2.FuelPaymentRequest(session_id=session_id, is_finished=True,
+                                                           signature=signature), timeout=10)
+    session.finish()
+    return session.latencies[:-1], unary, rejected
+
+
+def run_once(label, server_args, requests, clients, concurrency, frames, interval, attempts):
+    port = free_port()
+    address = f"127.0.0.1:{port}"
+    process = subprocess.Popen([sys.executable, "server.py", "--bind", address] + SERVER_ARGS + server_args,
+                               cwd=ROOT)
+    try:
+        with grpc.insecure_channel(address) as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            # fork при открытом канале gRPC подвешивает дочерний процесс, поэтому клиенты запускаются через spawn
+            context = multiprocessing.get_context("spawn")
+            with context.Manager() as manager, \
+                    futures.ProcessPoolExecutor(max_workers=clients or 1, mp_context=context) as pool:
+                ready, stop = manager.Queue(), manager.Event()
+                pending = [pool.submit(flood, address, requests[n::clients], concurrency, attempts, ready, stop)
+                           for n in range(clients)]
+                # Кадры идут, только когда все клиенты запустились: их старт сам по себе нагружает ядро
+                for _ in range(clients):
+                    ready.get()
+                if clients:
+                    time.sleep(WARM_UP)
+                start = time.monotonic()
+                stream, unary, fuel_rejected = fuel_latencies(stub, frames, interval)
+                fuel_time = time.monotonic() - start
+                stop.set()
+                results = [future.result() for future in pending]
+    finally:
+        process.terminate()
+        process.wait()
+
+    totals = {key: sum(result[key] for result in results) for key in ("ok", "rejected", "failed", "retries")}
+    duration = max((result["duration"] for result in results), default=0)
+    print(f"{label}:")
+    for name, latencies in (("fuel stream", stream), ("fuel unary", unary)):
+        print(f"  {name:>12}: p50 {percentile(latencies, 0.5) * 1e3:>8.2f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1e3:>8.2f} ms, max {max(latencies) * 1e3:>8.2f} ms")
+    print(f"  {'':>12}  {frames} frames in {fuel_time:.1f} s, unary frames rejected: {fuel_rejected}")
+    if clients:
+        print(f"  {'transactions':>12}: {totals['ok'] / duration:>8.0f} ok/s, rejected {totals['rejected']}, "
+              f"failed {totals['failed']}, retries {totals['retries']}")
+
+
+def run(clients, concurrency, frames, interval, signed_pool, attempts):
+    print(f"{os.cpu_count()} CPU cores, {clients} client processes x {concurrency} threads, "
+          f"fuel frame every {interval * 1e3:.0f} ms")
+    requests = signed_requests(signed_pool)
+    run_once("idle server", [], requests, 0, concurrency, frames, interval, attempts)
+    run_once("flood, --no-admission", ["--no-admission"], requests, clients, concurrency, frames, interval,
+             attempts)
+    run_once("flood, admission lanes", [], requests, clients, concurrency, frames, interval, attempts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fuel frame latency under a transaction flood")
+    parser.add_argument("--clients", type=int, default=2, help="transaction client processes")
+    parser.add_argument("--concurrency", type=int, default=128, help="threads per client process")
+    parser.add_argument("--frames", type=int, default=300, help="fuel frames of each kind")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between fuel frames")
+    parser.add_argument("--signed-pool", type=int, default=2000, help="pre-signed transactions")
+    parser.add_argument("--attempts", type=int, default=10, help="RetryingStub attempts per transaction")
+    args = parser.parse_args()
+    run(args.clients, args.concurrency, args.frames, args.interval, args.signed_pool, args.attempts)
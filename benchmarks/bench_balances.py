@@ -0,0 +1,73 @@
+"""
+Конкуренция за балансы: тысячи потоков переводят деньги между счетами,
+большая часть операций попадает в небольшой набор горячих счетов.
+Сравнивается одна общая блокировка (stripes=1) и полосы блокировок,
+после прогона проверяется, что общая сумма на счетах не изменилась.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_balances --threads 100 1000 4000
+"""
+import argparse
+import random
+import threading
+import time
+
+from balance_engine import BalanceEngine
+
+
+def run_once(stripes, threads, accounts, hot, hot_share, ops, batch):
+    engine = BalanceEngine(stripes=stripes)
+    for n in range(accounts):
+        engine.open(f"acc{n}", 1_000_000)
+    start_barrier = threading.Barrier(threads + 1)
+
+    def pick(rng):
+        if rng.random() < hot_share:
+            return f"acc{rng.randrange(hot)}"
+        return f"acc{rng.randrange(accounts)}"
+
+    def worker(seed):
+        rng = random.Random(seed)
+        plan = [[(pick(rng), pick(rng), rng.randint(1, 10_000)) for _ in range(batch)] for _ in range(ops)]
+        start_barrier.wait()
+        for transfers in plan:
+            if batch == 1:
+                engine.transfer(*transfers[0])
+            else:
+                engine.transfer_many(transfers)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(sum(engine.balance(f"acc{n}")) for n in range(accounts))
+    assert total == accounts * 1_000_000, "balances are not conserved"
+    return threads * ops * batch / elapsed
+
+
+def run(thread_counts, accounts, hot, hot_share, ops, batch):
+    # Тысячи потоков с маленьким стеком, чтобы не упереться в лимит памяти
+    threading.stack_size(256 * 1024)
+    print(f"{accounts} accounts, {hot} hot accounts take {hot_share:.0%} of operations, batch {batch}")
+    for threads in thread_counts:
+        single = run_once(1, threads, accounts, hot, hot_share, ops, batch)
+        striped = run_once(256, threads, accounts, hot, hot_share, ops, batch)
+        print(f"{threads:>6} threads: single lock {single:>10.0f} transfers/s, "
+              f"striped {striped:>10.0f} transfers/s ({(striped / single - 1) * 100:+.1f}%)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Balance engine contention benchmark")
+    parser.add_argument("--threads", type=int, nargs="+", default=[100, 1000, 2000])
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--hot", type=int, default=10, help="number of hot accounts")
+    parser.add_argument("--hot-share", type=float, default=0.8, help="share of operations on hot accounts")
+    parser.add_argument("--ops", type=int, default=200, help="operations per thread")
+    parser.add_argument("--batch", type=int, default=1, help="transfers per transfer_many call (1 uses transfer)")
+    args = parser.parse_args()
+    run(args.threads, args.accounts, args.hot, args.hot_share, args.ops, args.batch)
@@ -0,0 +1,121 @@
+"""
+Кадры заправки: унарный ProcessFuelPayment против потоковой сессии FuelSession.
+Сервер запускается в этом же процессе на localhost.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fuel --frames 5000
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from client import FuelPumpSimulator, FuelSessionClient, process_fuel_payment
+from server import PaymentService
+from signing import Ed25519Scheme, sign_fuel_session
+
+FUEL_PRICE = 54.37
+FRAME_LITERS = 0.3
+TICK = 0.05  # Шаг симуляции колонки (секунды модельного времени)
+PAYER = "pump"
+PAYER_BALANCE = 1e9  # Баланс нового счета в бенчмарках заправки, его хватает на любое число кадров
+
+
+def register_payer(service, account_id=PAYER):
+    """
+    Регистрация ключа плательщика в памяти сервиса: открытие сессии подписывается ключом счета.
+    :return: Закрытый ключ счета.
+    """
+    private_key = Ed25519Scheme.generate()
+    service.keys.register(account_id, private_key.public_key())
+    return private_key
+
+
+def pump_frames(frames, rate=None):
+    # Колонка выдает топливо в модельном времени; при заданном rate кадры идут с этой частотой
+    pump = FuelPumpSimulator(flow_rate_liters_per_second=6)
+    pump.is_pumping = True
+    buffer_liters = 0
+    sent = 0
+    next_at = time.monotonic()
+    while sent < frames:
+        buffer_liters += pump.get_fuel_consumed(TICK)
+        while buffer_liters >= FRAME_LITERS and sent < frames:
+            if rate:
+                next_at += 1 / rate
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            buffer_liters -= FRAME_LITERS
+            sent += 1
+            yield FRAME_LITERS
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(name, latencies, elapsed):
+    print(f"{name:>7}: {len(latencies) / elapsed:>9.0f} frames/s, "
+          f"p50 {statistics.median(latencies) * 1e3:.3f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.3f} ms, "
+          f"p999 {percentile(latencies, 0.999) * 1e3:.3f} ms")
+
+
+def bench_unary(stub, frames, rate, private_key):
+    latencies = []
+    start = time.perf_counter()
+    session_id = uuid.uuid4().hex
+    opened_at, signature = sign_fuel_session(private_key, session_id, PAYER)
+    for liters in pump_frames(frames, rate):
+        _, transfer_time = process_fuel_payment(stub, FUEL_PRICE, liters, session_id=session_id, account_id=PAYER,
+                                                opened_at=opened_at, signature=signature)
+        latencies.append(transfer_time)
+    process_fuel_payment(stub, FUEL_PRICE, 0, is_finished=True, session_id=session_id, signature=signature)
+    return latencies, time.perf_counter() - start
+
+
+def bench_stream(stub, frames, rate, private_key):
+    start = time.perf_counter()
+    session = FuelSessionClient(stub, FUEL_PRICE, account_id=PAYER, private_key=private_key)
+    for liters in pump_frames(frames, rate):
+        session.send(liters)
+    session.finish()
+    return session.latencies, time.perf_counter() - start
+
+
+def run(frames, rate):
+    service = PaymentService(initial_balance=PAYER_BALANCE)
+    private_key = register_payer(service)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(service, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel, \
+                open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            stub.ProcessFuelPayment(payment_pb2.FuelPaymentRequest(is_finished=True))  # Прогрев канала
+            unary = bench_unary(stub, frames, rate, private_key)
+            stream = bench_stream(stub, frames, rate, private_key)
+    finally:
+        server.stop(0)
+    report("unary", *unary)
+    report("stream", *stream)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Unary vs streaming fuel frames benchmark")
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=None,
+                        help="frames per second (default: as fast as possible)")
+    args = parser.parse_args()
+    run(args.frames, args.rate)
@@ -0,0 +1,105 @@
+"""
+Задержка кадров заправки на границе холда.
+
+Колонки отправляют кадры с постоянной частотой, авторизация холда у банка
+имитируется задержкой. Сравнивается доплата только при исчерпании холда
+(кадр ждет авторизацию) и заблаговременная фоновая доплата по порогу.
+В конце проверяется, что списанные и возвращенные суммы сходятся с балансами.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fuel_holds --pumps 20 --frames 60 --auth-latency 0.05
+"""
+import argparse
+import threading
+import time
+import uuid
+
+import payment_pb2
+from balance_engine import BalanceEngine, to_minor
+from benchmarks.bench_fuel import FUEL_PRICE, FRAME_LITERS, percentile
+from fuel_sessions import FuelSessionManager
+from server import PaymentService
+from signing import Ed25519Scheme, sign_fuel_session
+
+ACCOUNT_BALANCE = to_minor(1_000_000)
+
+
+def run_pump(service, account_id, private_key, frames, frame_rate, latencies, stalls):
+    session_id = uuid.uuid4().hex
+    opened_at, signature = sign_fuel_session(private_key, session_id, account_id)
+    next_at = time.monotonic()
+    for sequence in range(1, frames + 1):
+        next_at += 1 / frame_rate
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        start = time.perf_counter()
+        ack = service.process_frame(payment_pb2.FuelFrame(
+            session_id=session_id, sequence=sequence, fuel_price_per_liter=FUEL_PRICE,
+            liters=FRAME_LITERS, account_id=account_id, opened_at=opened_at, signature=signature
+        ))
+        latency = time.perf_counter() - start
+        assert ack.success, ack.message
+        # Первый кадр всегда ждет начальную авторизацию, он не относится к границе холда
+        if sequence > 1:
+            latencies.append(latency)
+            if latency > 0.005:
+                stalls.append(latency)
+    service.process_frame(payment_pb2.FuelFrame(session_id=session_id, sequence=frames + 1, is_finished=True,
+                                                signature=signature))
+
+
+def run_once(threshold, pumps, frames, frame_rate, auth_latency):
+    balances = BalanceEngine()
+
+    def authorize(account_id, amount):
+        time.sleep(auth_latency)  # Ответ банка на запрос холда
+        return balances.hold(account_id, amount)
+
+    fuel_sessions = FuelSessionManager(balances, top_up_threshold=threshold, authorizer=authorize,
+                                       max_workers=pumps)
+    service = PaymentService(balances=balances, fuel_sessions=fuel_sessions)
+    accounts = [f"pump{n}" for n in range(pumps)]
+    private_keys = {}
+    for account_id in accounts:
+        balances.open(account_id, ACCOUNT_BALANCE)
+        # Ключи плательщиков регистрируются в памяти: открытие сессии подписывается ключом счета
+        private_keys[account_id] = Ed25519Scheme.generate()
+        service.keys.register(account_id, private_keys[account_id].public_key())
+
+    latencies, stalls = [], []
+    threads = [threading.Thread(target=run_pump,
+                                args=(service, account_id, private_keys[account_id], frames, frame_rate,
+                                      latencies, stalls))
+               for account_id in accounts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    fuel_sessions.shutdown()
+
+    spent = sum(ACCOUNT_BALANCE - sum(balances.balance(account_id)) for account_id in accounts)
+    expected = pumps * to_minor(FUEL_PRICE * FRAME_LITERS * frames)
+    held = sum(balances.balance(account_id)[1] for account_id in accounts)
+    assert held == 0 and abs(spent - expected) <= pumps, (held, spent, expected)
+    return latencies, stalls
+
+
+def run(pumps, frames, frame_rate, auth_latency):
+    print(f"{pumps} pumps x {frames} frames at {frame_rate:.0f} frames/s, "
+          f"hold authorization takes {auth_latency * 1e3:.0f} ms")
+    for label, threshold in (("top-up on exhaustion", 1.0), ("background top-up at 50%", 0.5)):
+        latencies, stalls = run_once(threshold, pumps, frames, frame_rate, auth_latency)
+        print(f"{label:>26}: p50 {percentile(latencies, 0.5) * 1e3:.3f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1e3:.3f} ms, max {max(latencies) * 1e3:.1f} ms, "
+              f"stalled frames {len(stalls)} of {len(latencies)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fuel frame stalls across hold boundaries")
+    parser.add_argument("--pumps", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--frame-rate", type=float, default=20.0, help="frames per second per pump")
+    parser.add_argument("--auth-latency", type=float, default=0.05, help="seconds to authorize a hold")
+    args = parser.parse_args()
+    run(args.pumps, args.frames, args.frame_rate, args.auth_latency)
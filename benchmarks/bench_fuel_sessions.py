@@ -0,0 +1,85 @@
+"""
+Нагрузочный тест холдов: сотни колонок заправляются одновременно,
+у каждой своя сессия на сервере. В конце проверяется, что ни одно списание не потеряно.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fuel_sessions --pumps 300 --frames 50
+"""
+import argparse
+import contextlib
+import os
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import payment_pb2_grpc
+from client import process_fuel_payment
+from benchmarks.bench_fuel import FUEL_PRICE, FRAME_LITERS, PAYER_BALANCE, percentile, register_payer
+from server import PaymentService
+from signing import sign_fuel_session
+
+
+def run_pump(stub, service, account_id, private_key, frames, barrier, latencies, errors):
+    session_id = uuid.uuid4().hex
+    opened_at, signature = sign_fuel_session(private_key, session_id, account_id)
+    barrier.wait()
+    for _ in range(frames):
+        response, transfer_time = process_fuel_payment(stub, FUEL_PRICE, FRAME_LITERS, session_id=session_id,
+                                                       account_id=account_id, opened_at=opened_at,
+                                                       signature=signature)
+        latencies.append(transfer_time)
+        if not response.success:
+            errors.append(session_id)
+            return
+    hold = service.fuel_sessions.get(session_id)
+    if hold is None or abs(hold.total_cost - FUEL_PRICE * FRAME_LITERS * frames) > 1e-6:
+        errors.append(session_id)
+    process_fuel_payment(stub, FUEL_PRICE, 0, is_finished=True, session_id=session_id, signature=signature)
+
+
+def run(pumps, frames, workers):
+    service = PaymentService(initial_balance=PAYER_BALANCE)
+    accounts = [(f"pump{n}", register_payer(service, f"pump{n}")) for n in range(pumps)]
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(service, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    latencies = []
+    errors = []
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel, \
+                open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            barrier = threading.Barrier(pumps + 1)
+            threads = [
+                threading.Thread(target=run_pump,
+                                 args=(stub, service, account_id, private_key, frames, barrier, latencies, errors))
+                for account_id, private_key in accounts
+            ]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+    finally:
+        server.stop(0)
+
+    print(f"{pumps} pumps x {frames} frames, {workers} server workers")
+    print(f"throughput: {len(latencies) / elapsed:.0f} frames/s")
+    print(f"latency: p50 {percentile(latencies, 0.5) * 1e3:.2f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.2f} ms")
+    print(f"sessions with wrong totals: {len(errors)}, sessions left open: {len(service.fuel_sessions)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent fuel sessions load test")
+    parser.add_argument("--pumps", type=int, default=300)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    run(args.pumps, args.frames, args.workers)
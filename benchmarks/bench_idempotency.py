@@ -0,0 +1,96 @@
+"""
+Шторм повторов CreateTransaction с ключами идемпотентности и без них.
+
+Каждая транзакция отправляется несколько раз подряд, как клиентом, который
+не дождался ответа и повторил вызов с тем же запросом: повторы идут одновременно
+с первым вызовом и после него. Без ключа каждый повтор проверяет подпись,
+пишет новую транзакцию и снова списывает деньги; с ключом повторы ждут первый
+вызов или получают его ответ из кэша.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_idempotency --transactions 300 --attempts 4 --concurrency 32
+"""
+import argparse
+import time
+import uuid
+from concurrent import futures
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import payment_pb2
+from balance_engine import BalanceEngine, from_minor, to_minor
+from key_registry import KeyRegistry
+from metrics import SIGNATURE_VERIFY_SECONDS
+from server import PaymentService
+from signature_verifier import SignatureVerifier
+from signing import sign_request
+
+ACCOUNT_BALANCE = to_minor(1_000_000)
+
+
+def make_requests(keys, count, with_keys):
+    requests = []
+    for i in range(count):
+        sender_id, private_key = keys[i % len(keys)]
+        request = payment_pb2.TransactionRequest(
+            sender_id=sender_id, receiver_id=keys[(i + 1) % len(keys)][0], amount=float(i % 20 + 1),
+            idempotency_key=uuid.uuid4().hex if with_keys else ""
+        )
+        requests.append(sign_request(private_key, request))
+    return requests
+
+
+def run_once(keys, requests, attempts, concurrency):
+    balances = BalanceEngine()
+    registry = KeyRegistry(reload_interval=0)
+    for user_id, private_key in keys:
+        registry.register(user_id, private_key.public_key())
+        balances.open(user_id, ACCOUNT_BALANCE)
+    service = PaymentService(SignatureVerifier(), keys=registry, balances=balances)
+    verifies_before = SIGNATURE_VERIFY_SECONDS.snapshot()[2]
+    # Повторы одной транзакции стоят рядом в очереди и выполняются одновременно
+    calls = [request for request in requests for _ in range(attempts)]
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(lambda request: service.CreateTransaction(request, None), calls))
+    elapsed = time.perf_counter() - start
+    service.verifier.shutdown()
+    registry.close()
+
+    ids = {}
+    for request, response in zip(calls, responses):
+        assert response.success
+        ids.setdefault(id(request), set()).add(response.transaction_id)
+    moved = sum(balances.balance(user_id)[0] for user_id, _ in keys) - ACCOUNT_BALANCE * len(keys)
+    assert moved == 0, moved  # Переводы внутри набора счетов не меняют общую сумму
+    debited = sum(max(0, ACCOUNT_BALANCE - balances.balance(user_id)[0]) for user_id, _ in keys)
+    return {
+        "elapsed": elapsed,
+        "ledger": len(service.transactions),
+        "ids_per_request": max(len(found) for found in ids.values()),
+        "verifies": SIGNATURE_VERIFY_SECONDS.snapshot()[2] - verifies_before,
+        "net_debit": debited,
+    }
+
+
+def run(accounts, transactions, attempts, concurrency):
+    keys = [(f"storm{n}", rsa.generate_private_key(public_exponent=65537, key_size=2048))
+            for n in range(accounts)]
+    print(f"{transactions} transactions x {attempts} attempts, {concurrency} threads, {accounts} accounts")
+    for label, with_keys in (("no idempotency key", False), ("idempotency key", True)):
+        result = run_once(keys, make_requests(keys, transactions, with_keys), attempts, concurrency)
+        calls = transactions * attempts
+        print(f"{label:>19}: {calls / result['elapsed']:>7.0f} calls/s, "
+              f"ledger {result['ledger']} rows for {transactions} transactions, "
+              f"ids per transaction {result['ids_per_request']}, RSA verifies {result['verifies']}, "
+              f"net debit {from_minor(result['net_debit']):.2f} RUB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CreateTransaction retry storm with and without idempotency keys")
+    parser.add_argument("--accounts", type=int, default=16)
+    parser.add_argument("--transactions", type=int, default=300)
+    parser.add_argument("--attempts", type=int, default=4, help="calls per transaction (first call plus retries)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    run(args.accounts, args.transactions, args.attempts, args.concurrency)
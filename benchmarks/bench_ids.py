@@ -0,0 +1,125 @@
+"""
+Микробенчмарки горячего пути CreateTransaction: выдача ID, хранение подписи, ответы.
+
+Сравниваются прежние варианты (ID из длины списка под блокировкой, копия подписи
+в hex, новый TransactionResponse на каждый отказ) и текущие (IdAllocator без блокировки,
+подпись в исходных байтах, общий неизменяемый ответ), а также добавление в TransactionStore
+с подписью в hex и в байтах. Для каждого варианта выводится
+время на операцию и память, которая остается занятой после операции (tracemalloc).
+В конце проверяется, что ID из нескольких потоков уникальны и упорядочены в каждом потоке.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_ids --count 200000 --threads 8
+"""
+import argparse
+import os
+import threading
+import time
+import tracemalloc
+
+import payment_pb2
+from id_allocator import IdAllocator
+from server import TRANSACTION_FAILED
+from transaction_store import TransactionStore
+
+# Подпись RSA-2048 в запросе; чтение поля protobuf каждый раз дает новый объект bytes, как у сервера
+REQUEST = payment_pb2.TransactionRequest(sender_id="user1", receiver_id="user2", amount=10.0,
+                                         signature=os.urandom(256))
+
+
+def measure(operation, count):
+    """
+    :return: Кортеж (наносекунд на операцию, байт памяти, удерживаемых на операцию).
+    """
+    kept = []
+    start = time.perf_counter()
+    for _ in range(count):
+        kept.append(operation())
+    elapsed = time.perf_counter() - start
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(count):
+        kept.append(operation())
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed / count * 1e9, retained / count
+
+
+def legacy_ids():
+    lock = threading.Lock()
+    ids = []
+
+    def next_id():
+        with lock:
+            transaction_id = f"txn_{len(ids) + 1}"
+            ids.append(transaction_id)
+        return transaction_id
+    return next_id
+
+
+def threaded_rate(next_id, threads, count):
+    def worker():
+        for _ in range(count):
+            next_id()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return threads * count / (time.perf_counter() - start)
+
+
+def check_unique(threads, count):
+    allocator = IdAllocator(worker_id=3, prefix="s3-")
+    results = [[] for _ in range(threads)]
+
+    def worker(out):
+        for _ in range(count):
+            out.append(allocator.next_id())
+
+    workers = [threading.Thread(target=worker, args=(out,)) for out in results]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    all_ids = [transaction_id for out in results for transaction_id in out]
+    assert len(set(all_ids)) == len(all_ids), "duplicate ids"
+    for out in results:
+        assert out == sorted(out), "ids are not ordered within a thread"
+    return len(all_ids)
+
+
+def run(count, threads):
+    allocator = IdAllocator()
+    hex_store, raw_store = TransactionStore(), TransactionStore()
+    print(f"{count} operations, per operation: time and retained memory")
+    cases = (
+        ("id: len() under lock", legacy_ids()),
+        ("id: IdAllocator", allocator.next_id),
+        ("signature: hex copy", lambda: REQUEST.signature.hex()),
+        ("signature: raw bytes", lambda: REQUEST.signature),
+        ("store: hex signature", lambda: hex_store.append("user1", "user2", 10.0, REQUEST.signature.hex())),
+        ("store: raw signature", lambda: raw_store.append("user1", "user2", 10.0, REQUEST.signature)),
+        ("failure: new response", lambda: payment_pb2.TransactionResponse(success=False, transaction_id="")),
+        ("failure: shared response", lambda: TRANSACTION_FAILED),
+    )
+    for label, operation in cases:
+        nanoseconds, retained = measure(operation, count)
+        print(f"{label:>26}: {nanoseconds:>7.0f} ns, {retained:>6.0f} B retained")
+
+    per_thread = count // threads
+    print(f"{threads} threads x {per_thread} ids:")
+    print(f"{'len() under lock':>26}: {threaded_rate(legacy_ids(), threads, per_thread):>10.0f} ids/s")
+    print(f"{'IdAllocator':>26}: {threaded_rate(IdAllocator().next_id, threads, per_thread):>10.0f} ids/s")
+    print(f"unique and per-thread ordered: {check_unique(threads, per_thread)} ids")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Transaction id, signature and response allocation microbenchmarks")
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    run(args.count, args.threads)
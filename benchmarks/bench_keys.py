@@ -0,0 +1,80 @@
+"""
+Время запуска реестра ключей и задержка первого обращения к ключу
+в зависимости от числа плательщиков: каталог с файлами и файл хранилища.
+
+Чтобы не генерировать тысячи RSA-ключей, один и тот же открытый ключ
+раскладывается под разными именами пользователей.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_keys --counts 100 1000 10000 100000
+"""
+import argparse
+import base64
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from key_registry import KeyRegistry
+from signature_verifier import public_key_der
+
+
+def prepare(root, count, der):
+    key_dir = os.path.join(root, f"dir{count}")
+    os.makedirs(key_dir)
+    encoded = base64.b64encode(der)
+    keystore = os.path.join(root, f"keystore{count}.txt")
+    with open(keystore, "wb") as f:
+        for n in range(count):
+            with open(os.path.join(key_dir, f"user{n}_public.der"), "wb") as key_file:
+                key_file.write(der)
+            f.write(f"user{n} ".encode() + encoded + b"\n")
+    return key_dir, keystore
+
+
+def measure(count, samples, **registry_args):
+    start = time.perf_counter()
+    registry = KeyRegistry(reload_interval=60, **registry_args)
+    startup = time.perf_counter() - start
+    # Индекс хранилища строится фоновым потоком; его время выводится отдельно от запуска
+    if registry.keystore:
+        while registry._keystore_index is None:
+            time.sleep(0.001)
+    indexed = time.perf_counter() - start
+
+    latencies = []
+    for n in random.Random(count).sample(range(count), min(samples, count)):
+        start = time.perf_counter()
+        assert registry.get(f"user{n}") is not None
+        latencies.append(time.perf_counter() - start)
+    registry.close()
+    latencies.sort()
+    return startup, indexed, latencies[len(latencies) // 2], latencies[-1]
+
+
+def run(counts, samples):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    der = public_key_der(private_key.public_key())
+    root = tempfile.mkdtemp(prefix="bench_keys")
+    try:
+        print(f"{'keys':>8} {'source':>9} {'startup ms':>11} {'ready ms':>9} {'first get p50 us':>17} {'max us':>9}")
+        for count in counts:
+            key_dir, keystore = prepare(root, count, der)
+            for source, registry_args in (("directory", {"key_dir": key_dir}),
+                                          ("keystore", {"key_dir": root, "keystore": keystore})):
+                startup, indexed, p50, worst = measure(count, samples, **registry_args)
+                print(f"{count:>8} {source:>9} {startup * 1e3:>11.3f} {indexed * 1e3:>9.1f} "
+                      f"{p50 * 1e6:>17.1f} {worst * 1e6:>9.1f}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Key registry startup and first-use latency")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--samples", type=int, default=200, help="first-use lookups per run")
+    args = parser.parse_args()
+    run(args.counts, args.samples)
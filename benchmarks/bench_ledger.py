@@ -0,0 +1,85 @@
+"""
+Журнал леджера: коммиты в секунду при разных размерах группы fsync
+и время перезапуска (восстановления) для большого леджера.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_ledger --threads 64 --records 10000000
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from ledger_log import LedgerLog, encode_record
+from transaction_store import TransactionStore
+
+SIGNATURE = b"\xab" * 256  # Подпись RSA-2048
+
+
+def bench_commits(batch_size, threads, per_thread, commit_delay):
+    with tempfile.TemporaryDirectory() as data_dir:
+        log = LedgerLog(data_dir, fsync_batch_size=batch_size, commit_delay=commit_delay, snapshot_interval=0)
+        store = TransactionStore(log)
+        log.recover(store)
+
+        def writer(n):
+            for i in range(per_thread):
+                store.append(f"user{n}", "user0", float(i), SIGNATURE)
+
+        workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        log.close()
+    return threads * per_thread / elapsed
+
+
+def write_log(data_dir, records):
+    # Журнал пишется напрямую одним потоком, без групповых коммитов
+    with open(os.path.join(data_dir, "wal-00000001.log"), "wb") as f:
+        chunk = []
+        for i in range(records):
+            chunk.append(encode_record(f"txn_{i + 1}", f"user{i % 1000}", f"user{(i + 1) % 1000}", 1.0, SIGNATURE))
+            if len(chunk) == 100_000:
+                f.write(b"".join(chunk))
+                chunk = []
+        f.write(b"".join(chunk))
+
+
+def bench_restart(data_dir):
+    log = LedgerLog(data_dir, snapshot_interval=0)
+    store = TransactionStore(log)
+    start = time.perf_counter()
+    count = log.recover(store)
+    elapsed = time.perf_counter() - start
+    return log, store, count, elapsed
+
+
+def run(threads, per_thread, records, commit_delay):
+    for batch_size in (1, 16, 64, 256, 1024):
+        rate = bench_commits(batch_size, threads, per_thread, commit_delay)
+        print(f"fsync batch {batch_size:>5}: {rate:>9.0f} commits/s ({threads} writer threads)")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_log(data_dir, records)
+        log, store, count, elapsed = bench_restart(data_dir)
+        print(f"restart from log:      {count} records in {elapsed:.2f} s")
+        log.snapshot(store)
+        log.close()
+        log, _, count, elapsed = bench_restart(data_dir)
+        print(f"restart from snapshot: {count} records in {elapsed:.2f} s")
+        log.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ledger log commit and restart benchmark")
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--per-thread", type=int, default=200)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--commit-delay", type=float, default=0.002)
+    args = parser.parse_args()
+    run(args.threads, args.per_thread, args.records, args.commit_delay)
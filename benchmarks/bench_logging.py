@@ -0,0 +1,106 @@
+"""
+RPS сервера с логированием горячих путей и без него.
+Сравниваются: синхронная запись в поток (как было с print), фоновая запись через очередь
+и уровень INFO, на котором логи кадров и проверок превращаются в no-op.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_logging --calls 5000 --clients 8
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from benchmarks.bench_fuel import PAYER_BALANCE, register_payer
+from server import PaymentService
+from signing import sign_fuel_session
+from structured_logging import setup_logging, shutdown_logging
+
+
+def drive(stub, calls, clients, private_keys):
+    verify = payment_pb2.VerifyRequest(transaction_id="txn_1")
+
+    def client(n):
+        session_id = uuid.uuid4().hex
+        opened_at, signature = sign_fuel_session(private_keys[n], session_id, f"pump{n}")
+        frame = payment_pb2.FuelPaymentRequest(fuel_price_per_liter=54.37, liters=0.3, session_id=session_id,
+                                               account_id=f"pump{n}", opened_at=opened_at, signature=signature)
+        for i in range(calls // clients):
+            if i % 2:
+                stub.VerifyTransaction(verify)
+            else:
+                stub.ProcessFuelPayment(frame)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return calls / (time.perf_counter() - start)
+
+
+def configure(mode, devnull):
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == "sync DEBUG":
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG)
+    elif mode == "queue DEBUG":
+        setup_logging("DEBUG", stream=devnull)
+    elif mode == "queue INFO":
+        setup_logging("INFO", stream=devnull)
+    else:
+        setup_logging("WARNING", stream=devnull)
+
+
+def micro(devnull, count=200_000):
+    logger = logging.getLogger("payment.bench")
+    setup_logging("INFO", stream=devnull)
+    start = time.perf_counter()
+    for i in range(count):
+        logger.debug("Fuel payment processed: %.2f liters, %.2f RUB", 0.3, 16.31)
+    disabled = (time.perf_counter() - start) / count * 1e9
+    start = time.perf_counter()
+    for i in range(count):
+        print(f"Fuel payment processed: {0.3:.2f} liters, {16.31:.2f} RUB", file=devnull)
+    printed = (time.perf_counter() - start) / count * 1e9
+    print(f"disabled logger.debug: {disabled:.0f} ns/call, print: {printed:.0f} ns/call")
+
+
+def run(calls, clients):
+    service = PaymentService(initial_balance=PAYER_BALANCE)
+    private_keys = [register_payer(service, f"pump{n}") for n in range(clients)]
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(service, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel, open(os.devnull, "w") as devnull:
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            for mode in ("sync DEBUG", "queue DEBUG", "queue INFO", "off"):
+                configure(mode, devnull)
+                print(f"{mode:>12}: {drive(stub, calls, clients, private_keys):>8.0f} rps")
+            micro(devnull)
+            shutdown_logging()
+    finally:
+        server.stop(0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Logging overhead benchmark")
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+    run(args.calls, args.clients)
@@ -0,0 +1,229 @@
+"""
+Симуляция нарезки топлива на кадры оплаты по профилям расхода.
+
+Профили расхода проигрываются в модельном времени, сервер заменен фиксированным
+временем ответа с джиттером. Сравниваются прежние политики клиента (кадры по 0.3 л:
+унарные по одному на тик и потоковые) и AdaptiveMeter. Для каждой политики выводится
+число вызовов на литр, задержка оплаты (от выдачи литра до подтверждения его кадра)
+и максимальный объем выданного, но не отправленного топлива.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_metering --rtt 0.02 --jitter 0.01
+"""
+import argparse
+import bisect
+import heapq
+import random
+
+from benchmarks.bench_fuel import percentile
+from metering import DEFAULT_TICK, AdaptiveMeter
+
+LEGACY_FRAME_LITERS = 0.3
+GRID = 0.001  # Шаг интегрирования расхода (секунды)
+
+PROFILES = {
+    "trickle 0.1 L/s": (30, lambda t: 0.1),
+    "car 0.7 L/s": (30, lambda t: 0.7),
+    "client default 6 L/s": (20, lambda t: 6.0),
+    "truck 20 L/s": (20, lambda t: 20.0),
+    "stop-start 6/0 L/s": (20, lambda t: 6.0 if int(t / 2) % 2 == 0 else 0.0),
+    "ramp 0-20 L/s": (20, lambda t: t),
+}
+
+
+class FlowProfile:
+    """
+    Накопленный объем выдачи на мелкой сетке и обратная функция (момент выдачи литра).
+    """
+
+    def __init__(self, duration, flow):
+        self.duration = duration
+        self.cumulative = [0.0]
+        for step in range(int(duration / GRID)):
+            self.cumulative.append(self.cumulative[-1] + flow(step * GRID) * GRID)
+
+    def dispensed(self, t):
+        index = min(int(t / GRID), len(self.cumulative) - 1)
+        return self.cumulative[index]
+
+    def time_of(self, liters):
+        return bisect.bisect_left(self.cumulative, liters) * GRID
+
+
+class Simulation:
+    """
+    Модель канала: подтверждение кадра приходит через время ответа, учет задержки оплаты по литрам.
+    """
+
+    def __init__(self, profile, rtt, jitter, seed):
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.rtt = rtt
+        self.jitter = jitter
+        self.frames = 0
+        self.sent = 0.0
+        self.acked = 0.0
+        self.max_backlog = 0.0
+        self.lags = []
+        self._acks = []  # Куча (время подтверждения, литры)
+
+    def response_time(self):
+        return self.rtt + (self.random.expovariate(1 / self.jitter) if self.jitter else 0)
+
+    def send(self, now, liters):
+        """
+        :return: Время ответа на кадр.
+        """
+        self.frames += 1
+        self.sent += liters
+        rtt = self.response_time()
+        heapq.heappush(self._acks, (now + rtt, self.frames, liters))
+        return rtt
+
+    def deliver(self, now, on_ack=None):
+        # Подтверждения приходят по порядку отправки в потоке, но время ответа у каждого свое
+        while self._acks and self._acks[0][0] <= now:
+            acked_at, _, liters = heapq.heappop(self._acks)
+            # Задержка считается по порциям в 0.01 л: от момента выдачи порции до подтверждения
+            start = self.acked
+            self.acked += liters
+            portion = start + 0.005
+            while portion < self.acked:
+                self.lags.append(acked_at - self.profile.time_of(portion))
+                portion += 0.01
+            if on_ack:
+                on_ack(acked_at)
+
+    def in_flight(self):
+        return len(self._acks)
+
+    def observe(self, now):
+        self.max_backlog = max(self.max_backlog, self.profile.dispensed(now) - self.sent)
+
+    def finish(self):
+        self.deliver(float("inf"))
+
+
+def legacy_unary(sim):
+    # Прежний fueling_process: не больше одного кадра 0.3 л на тик, вызов блокирует цикл, тик через sleep
+    now = last = 0.0
+    buffer_liters = 0.0
+    while now < sim.profile.duration:
+        buffer_liters += sim.profile.dispensed(now) - sim.profile.dispensed(last)
+        last = now
+        sim.observe(now)
+        if buffer_liters >= LEGACY_FRAME_LITERS:
+            now += sim.send(now, LEGACY_FRAME_LITERS)
+            buffer_liters -= LEGACY_FRAME_LITERS
+            sim.deliver(now)
+        now += DEFAULT_TICK
+    buffer_liters += sim.profile.dispensed(now) - sim.profile.dispensed(last)
+    if buffer_liters > 0:
+        sim.send(now, buffer_liters)
+
+
+def legacy_stream(sim):
+    # Прежний fueling_session_process: все целые кадры по 0.3 л на каждом тике, без ожидания ответов
+    now = last = 0.0
+    buffer_liters = 0.0
+    while now < sim.profile.duration:
+        sim.deliver(now)
+        buffer_liters += sim.profile.dispensed(now) - sim.profile.dispensed(last)
+        last = now
+        sim.observe(now)
+        while buffer_liters >= LEGACY_FRAME_LITERS:
+            sim.send(now, LEGACY_FRAME_LITERS)
+            buffer_liters -= LEGACY_FRAME_LITERS
+        now += DEFAULT_TICK
+    buffer_liters += sim.profile.dispensed(now) - sim.profile.dispensed(last)
+    if buffer_liters > 0:
+        sim.send(now, buffer_liters)
+
+
+def adaptive_stream(sim, max_in_flight=4):
+    meter = AdaptiveMeter(max_in_flight=max_in_flight)
+    sent_at = {}
+
+    def on_ack(acked_at):
+        meter.observe_rtt(acked_at - sent_at.pop(min(sent_at)))
+
+    tick = 0
+    last = 0.0
+    while tick * DEFAULT_TICK < sim.profile.duration:
+        # Тики по сетке монотонного планировщика, без накопления дрейфа
+        now = tick * DEFAULT_TICK
+        sim.deliver(now, on_ack)
+        meter.add(sim.profile.dispensed(now) - sim.profile.dispensed(last), now)
+        last = now
+        sim.observe(now)
+        liters = meter.take_frame(now, sim.in_flight())
+        if liters:
+            sent_at[sim.frames + 1] = now
+            sim.send(now, liters)
+        tick += 1
+    now = tick * DEFAULT_TICK
+    meter.add(sim.profile.dispensed(now) - sim.profile.dispensed(last), now)
+    liters = meter.drain()
+    if liters > 0:
+        sim.send(now, liters)
+
+
+def adaptive_unary(sim):
+    meter = AdaptiveMeter(max_in_flight=1)
+    now = last = 0.0
+    next_tick = 0.0
+    while now < sim.profile.duration:
+        meter.add(sim.profile.dispensed(now) - sim.profile.dispensed(last), now)
+        last = now
+        sim.observe(now)
+        liters = meter.take_frame(now)
+        if liters:
+            rtt = sim.send(now, liters)
+            meter.observe_rtt(rtt)
+            sim.deliver(now + rtt)
+            now += rtt
+        # Следующий тик по сетке; если вызов затянулся, пропущенные тики не догоняются
+        next_tick += DEFAULT_TICK
+        if next_tick < now:
+            next_tick += ((now - next_tick) // DEFAULT_TICK + 1) * DEFAULT_TICK
+        now = next_tick
+    meter.add(sim.profile.dispensed(now) - sim.profile.dispensed(last), now)
+    liters = meter.drain()
+    if liters > 0:
+        sim.send(now, liters)
+
+
+POLICIES = (
+    ("legacy unary", legacy_unary),
+    ("legacy stream", legacy_stream),
+    ("adaptive unary", adaptive_unary),
+    ("adaptive stream", adaptive_stream),
+)
+
+
+def run(profiles, rtt, jitter, seed):
+    print(f"response time {rtt * 1e3:.0f} ms + exp jitter {jitter * 1e3:.0f} ms, tick {DEFAULT_TICK * 1e3:.0f} ms")
+    print(f"{'profile':>22} {'policy':>16} {'frames':>7} {'RPC/L':>7} "
+          f"{'lag p50 s':>10} {'lag p99 s':>10} {'lag max s':>10} {'backlog L':>10}")
+    for name in profiles:
+        duration, flow = PROFILES[name]
+        profile = FlowProfile(duration, flow)
+        total = profile.dispensed(duration)
+        for label, policy in POLICIES:
+            sim = Simulation(profile, rtt, jitter, seed)
+            policy(sim)
+            sim.finish()
+            assert abs(sim.acked - total) < 1e-6, (label, sim.acked, total)
+            print(f"{name:>22} {label:>16} {sim.frames:>7} {sim.frames / total:>7.2f} "
+                  f"{percentile(sim.lags, 0.5):>10.3f} {percentile(sim.lags, 0.99):>10.3f} "
+                  f"{max(sim.lags):>10.3f} {sim.max_backlog:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fuel metering simulation: RPCs per liter and billing lag")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=list(PROFILES))
+    parser.add_argument("--rtt", type=float, default=0.02, help="server response time, seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="mean of exponential response jitter, seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.profiles, args.rtt, args.jitter, args.seed)
@@ -0,0 +1,88 @@
+"""
+Стоимость инструментирования: запись в гистограмму и RPS сервера
+с перехватчиком метрик и без него.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_metrics --calls 20000
+"""
+import argparse
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from metrics import REGISTRY, ClientMetricsInterceptor, Histogram, ServerMetricsInterceptor
+from server import PaymentService
+
+
+def bench_observe(threads, count):
+    histogram = Histogram()
+
+    def worker():
+        for i in range(count):
+            histogram.observe(0.0003)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - start
+    assert histogram.snapshot()[2] == threads * count
+    return elapsed / (threads * count) * 1e9
+
+
+def bench_rps(server_metrics, client_metrics, calls, clients):
+    interceptors = [ServerMetricsInterceptor()] if server_metrics else []
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), interceptors=interceptors)
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(PaymentService(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as raw_channel:
+            channel = raw_channel
+            if client_metrics:
+                channel = grpc.intercept_channel(raw_channel, ClientMetricsInterceptor())
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            request = payment_pb2.VerifyRequest(transaction_id="txn_1")
+            stub.VerifyTransaction(request)
+
+            def client():
+                for _ in range(calls // clients):
+                    stub.VerifyTransaction(request)
+
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return calls / (time.perf_counter() - start)
+    finally:
+        server.stop(0)
+
+
+def run(calls, clients):
+    for threads in (1, 8):
+        print(f"Histogram.observe, {threads} threads: {bench_observe(threads, 200_000):.0f} ns/call")
+    plain = bench_rps(False, False, calls, clients)
+    print(f"without metrics:          {plain:.0f} rps")
+    # Клиент и сервер работают в одном процессе, поэтому накладные расходы сторон меряются отдельно
+    for label, server_metrics, client_metrics in (("server interceptor", True, False),
+                                                  ("client interceptor", False, True),
+                                                  ("both interceptors", True, True)):
+        rate = bench_rps(server_metrics, client_metrics, calls, clients)
+        print(f"with {label}: {rate:.0f} rps ({(rate / plain - 1) * 100:+.1f}%)")
+    print(f"exposition size: {len(REGISTRY.render())} bytes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Metrics overhead microbenchmark")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+    run(args.calls, args.clients)
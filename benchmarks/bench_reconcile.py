@@ -0,0 +1,116 @@
+"""
+Сверка леджера через gRPC: выборка по ID против потоковых выборок.
+
+Сервер поднимается в процессе бенчмарка, леджер заполняется напрямую через хранилище.
+Сравниваются:
+- проверка каждой транзакции отдельным VerifyTransaction и одна потоковая выборка
+  ListTransactions с разными размерами страниц;
+- итоги по счетам, посчитанные клиентом по всему леджеру, и GetAccountAggregates
+  из итогов, которые хранилище ведет при добавлении.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_reconcile --transactions 100000 --accounts 1000
+"""
+import argparse
+import time
+from collections import defaultdict
+from concurrent import futures
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from backoff import RetryingStub
+from server import PaymentService
+
+SIGNATURE = b"\xab" * 256  # Подпись RSA-2048
+
+
+def fill(service, transactions, accounts):
+    ids = []
+    for i in range(transactions):
+        ids.append(service.transactions.append(f"user{i % accounts}", f"user{(i * 7 + 1) % accounts}",
+                                               float(i % 100 + 1), SIGNATURE))
+    return ids
+
+
+def verify_each(stub, ids):
+    start = time.perf_counter()
+    found = sum(stub.VerifyTransaction(payment_pb2.VerifyRequest(transaction_id=transaction_id)).success
+                for transaction_id in ids)
+    return time.perf_counter() - start, found
+
+
+def list_all(stub, page_size):
+    start = time.perf_counter()
+    ids = set()
+    pages = 0
+    for page in stub.pages("ListTransactions", payment_pb2.ListTransactionsRequest(page_size=page_size)):
+        ids.update(transaction.transaction_id for transaction in page.transactions)
+        pages += 1
+    return time.perf_counter() - start, ids, pages
+
+
+def rescan_totals(stub, page_size):
+    start = time.perf_counter()
+    totals = defaultdict(lambda: [0.0, 0, 0.0, 0])
+    for page in stub.pages("ListTransactions", payment_pb2.ListTransactionsRequest(page_size=page_size)):
+        for transaction in page.transactions:
+            sent, received = totals[transaction.sender_id], totals[transaction.receiver_id]
+            sent[0] += transaction.amount
+            sent[1] += 1
+            received[2] += transaction.amount
+            received[3] += 1
+    return time.perf_counter() - start, totals
+
+
+def aggregates(stub, page_size):
+    start = time.perf_counter()
+    totals = {}
+    for page in stub.pages("GetAccountAggregates", payment_pb2.AccountAggregatesRequest(page_size=page_size)):
+        for aggregate in page.aggregates:
+            totals[aggregate.account_id] = [aggregate.sent_total, aggregate.sent_count,
+                                            aggregate.received_total, aggregate.received_count]
+    return time.perf_counter() - start, totals
+
+
+def run(transactions, accounts, page_sizes):
+    service = PaymentService()
+    ids = fill(service, transactions, accounts)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(service, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = RetryingStub(payment_pb2_grpc.PaymentServiceStub(channel))
+            print(f"{transactions} transactions, {accounts} accounts")
+
+            elapsed, found = verify_each(stub, ids)
+            print(f"VerifyTransaction per id:      {elapsed:>7.2f} s, {transactions / elapsed:>9.0f} tx/s, "
+                  f"found {found}")
+            for size in page_sizes:
+                elapsed, listed, pages = list_all(stub, size)
+                print(f"ListTransactions page {size:>6}: {elapsed:>7.2f} s, {transactions / elapsed:>9.0f} tx/s, "
+                      f"{pages} pages, matched {len(listed & set(ids))}")
+
+            size = max(page_sizes)
+            elapsed, rescanned = rescan_totals(stub, size)
+            print(f"totals by client rescan:       {elapsed:>7.2f} s")
+            elapsed, served = aggregates(stub, size)
+            mismatched = sum(1 for account_id, totals in rescanned.items()
+                             if [round(value, 2) for value in served.get(account_id, ())]
+                             != [round(value, 2) for value in totals])
+            print(f"GetAccountAggregates:          {elapsed:>7.2f} s, {len(served)} accounts, "
+                  f"mismatched {mismatched}")
+    finally:
+        server.stop(None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ledger reconciliation: per-id lookups vs streamed queries")
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+    run(args.transactions, args.accounts, args.page_sizes)
@@ -0,0 +1,116 @@
+"""
+Сравнение режимов сервера: пул потоков против grpc.aio при 10/100/1000 одновременных клиентах.
+Сервер запускается отдельным процессом на localhost, нагрузка — VerifyTransaction
+и кадры ProcessFuelPayment. Кадры сверх очереди полосы заправки сервер отклоняет
+с RESOURCE_EXHAUSTED: клиент ждет подсказку сервера и повторяет, отказы выводятся отдельно.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_server_modes --duration 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from backoff import retry_pushback
+from benchmarks.bench_fuel import PAYER_BALANCE, percentile
+from client import load_private_key
+from signing import sign_fuel_session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYER = "user1"  # Ключ плательщика берется из корня репозитория, где его ищет сервер
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port):
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--mode", mode, "--bind", f"127.0.0.1:{port}", "--in-memory",
+         "--initial-balance", str(PAYER_BALANCE)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+        grpc.channel_ready_future(channel).result(timeout=30)
+    return process
+
+
+async def client_loop(stub, private_key, deadline, latencies, rejected):
+    session_id = uuid.uuid4().hex
+    opened_at, signature = sign_fuel_session(private_key, session_id, PAYER)
+    verify = payment_pb2.VerifyRequest(transaction_id="txn_1")
+    frame = payment_pb2.FuelPaymentRequest(fuel_price_per_liter=54.37, liters=0.3, session_id=session_id,
+                                           account_id=PAYER, opened_at=opened_at, signature=signature)
+    calls = 0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            if calls % 2:
+                await stub.VerifyTransaction(verify)
+            else:
+                await stub.ProcessFuelPayment(frame)
+        except grpc.aio.AioRpcError as e:
+            if e.code() != grpc.StatusCode.RESOURCE_EXHAUSTED:
+                raise
+            rejected[0] += 1
+            await asyncio.sleep(retry_pushback(e) or 0.01)
+            continue
+        latencies.append(time.perf_counter() - start)
+        calls += 1
+
+
+async def drive(port, clients, duration, private_key):
+    # Несколько каналов, чтобы не упираться в лимит потоков одного HTTP/2 соединения
+    channels = [grpc.aio.insecure_channel(f"127.0.0.1:{port}") for _ in range(max(1, clients // 100))]
+    stubs = [payment_pb2_grpc.PaymentServiceStub(channel) for channel in channels]
+    latencies = []
+    rejected = [0]
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            client_loop(stubs[i % len(stubs)], private_key, deadline, latencies, rejected) for i in range(clients)
+        ))
+    finally:
+        for channel in channels:
+            await channel.close()
+    return latencies, rejected[0], time.perf_counter() - start
+
+
+def run(duration, levels):
+    private_key = load_private_key(os.path.join(ROOT, f"{PAYER}_private.pem"))
+    for mode in ("thread", "aio"):
+        port = free_port()
+        server = start_server(mode, port)
+        try:
+            for clients in levels:
+                latencies, rejected, elapsed = asyncio.run(drive(port, clients, duration, private_key))
+                print(f"{mode:>6} {clients:>5} clients: {len(latencies) / elapsed:>8.0f} rps, "
+                      f"p50 {percentile(latencies, 0.5) * 1e3:.2f} ms, "
+                      f"p99 {percentile(latencies, 0.99) * 1e3:.2f} ms, rejected {rejected}")
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Thread-pool vs grpc.aio server benchmark")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    run(args.duration, args.clients)
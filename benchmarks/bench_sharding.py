@@ -0,0 +1,162 @@
+"""
+Масштабирование многопроцессного сервера по числу шардов.
+
+Для каждого числа процессов поднимаются воркеры server.py (ledger в памяти), нагрузка —
+заранее подписанные CreateTransaction от многих счетов. Клиенты работают в отдельных
+процессах и маршрутизируют запросы сами через ShardRouter (или через фронт-маршрутизатор
+с --via-router). Межшардовые зачисления шард отправителя доставляет в фоне: в задержку ответа
+они не входят, но нагружают те же процессы. Рост пропускной способности
+ограничен числом ядер машины: на одном ядре процессы только делят его между собой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_sharding --shards 1 2 4 8 16 --duration 5
+"""
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from cryptography.hazmat.primitives import serialization
+
+import payment_pb2
+import payment_pb2_grpc
+from benchmarks.bench_fuel import percentile
+from generate_keys import generate_bulk
+from sharded_server import RouterService, ShardRouter, start_workers, stop_workers
+from signing import sign_request
+
+SERVER_ARGS = ["--in-memory", "--initial-balance", "1e9", "--log-level", "WARNING", "--workers", "16"]
+
+
+def free_port_range(count):
+    # Подбор базового порта, от которого свободны count портов подряд
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            base = sock.getsockname()[1]
+        try:
+            for port in range(base, base + count + 1):
+                with socket.socket() as sock:
+                    sock.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+
+
+def signed_requests(key_dir, accounts, count):
+    keys = []
+    for n in range(1, accounts + 1):
+        with open(os.path.join(key_dir, f"user{n}_private.pem"), "rb") as f:
+            keys.append((f"user{n}", serialization.load_pem_private_key(f.read(), password=None)))
+    requests = []
+    for i in range(count):
+        sender_id, private_key = keys[i % accounts]
+        request = payment_pb2.TransactionRequest(
+            sender_id=sender_id, receiver_id=keys[(i * 7 + 1) % accounts][0], amount=float(i % 50 + 1)
+        )
+        requests.append(sign_request(private_key, request).SerializeToString())
+    return requests
+
+
+def client_process(addresses, router_address, requests, concurrency, duration):
+    """
+    Замкнутый цикл нагрузки в одном клиентском процессе.
+    :return: Кортеж (успешных вызовов, ошибок, задержки).
+    """
+    requests = [payment_pb2.TransactionRequest.FromString(data) for data in requests]
+    if router_address:
+        channel = grpc.insecure_channel(router_address)
+        stub = payment_pb2_grpc.PaymentServiceStub(channel)
+        create = stub.CreateTransaction
+    else:
+        router = ShardRouter(addresses)
+        create = router.create_transaction
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    deadline = time.monotonic() + duration
+
+    def worker(offset):
+        index = offset
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = create(requests[index % len(requests)], timeout=10).success
+            except grpc.RpcError:
+                ok = False
+            latency = time.perf_counter() - start
+            with lock:
+                latencies.append(latency)
+                if not ok:
+                    errors[0] += 1
+            index += concurrency
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) - errors[0], errors[0], latencies
+
+
+def run_once(shards, key_dir, requests, clients, concurrency, duration, via_router):
+    base_port = free_port_range(shards)
+    with tempfile.TemporaryDirectory() as data_dir:
+        processes, addresses = start_workers(shards, base_port, data_dir, 0,
+                                             SERVER_ARGS + ["--key-dir", key_dir])
+        router = router_server = None
+        router_address = None
+        try:
+            if via_router:
+                router = ShardRouter(addresses)
+                router_server = grpc.server(futures.ThreadPoolExecutor(max_workers=32))
+                payment_pb2_grpc.add_PaymentServiceServicer_to_server(RouterService(router), router_server)
+                router_address = f"127.0.0.1:{router_server.add_insecure_port('127.0.0.1:0')}"
+                router_server.start()
+            with futures.ProcessPoolExecutor(max_workers=clients) as pool:
+                results = list(pool.map(
+                    client_process, [addresses] * clients, [router_address] * clients,
+                    [requests[n::clients] for n in range(clients)], [concurrency] * clients, [duration] * clients
+                ))
+        finally:
+            if router_server is not None:
+                router_server.stop(0)
+                router.close()
+            stop_workers(processes)
+    ok = sum(result[0] for result in results)
+    failed = sum(result[1] for result in results)
+    latencies = [latency for result in results for latency in result[2]]
+    # Время запуска клиентских процессов не входит в замер: каждый клиент грузит ровно duration секунд
+    return ok / duration, failed, latencies
+
+
+def run(shard_counts, accounts, signed_pool, clients, concurrency, duration, via_router):
+    print(f"{os.cpu_count()} CPU cores, {accounts} accounts, {clients} client processes x {concurrency} threads, "
+          f"routing {'via front router' if via_router else 'in client'}")
+    with tempfile.TemporaryDirectory() as key_dir:
+        generate_bulk(accounts, key_dir)
+        requests = signed_requests(key_dir, accounts, signed_pool)
+        baseline = None
+        for shards in shard_counts:
+            rps, failed, latencies = run_once(shards, key_dir, requests, clients, concurrency, duration, via_router)
+            baseline = baseline or rps
+            print(f"{shards:>3} processes: {rps:>8.0f} tx/s (x{rps / baseline:.2f}), "
+                  f"p50 {percentile(latencies, 0.5) * 1e3:.2f} ms, p99 {percentile(latencies, 0.99) * 1e3:.2f} ms, "
+                  f"failed {failed}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sharded server throughput by number of worker processes")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--accounts", type=int, default=64)
+    parser.add_argument("--signed-pool", type=int, default=2000, help="pre-signed requests")
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="threads per client process")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--via-router", action="store_true", help="send requests through the front router")
+    args = parser.parse_args()
+    run(args.shards, args.accounts, args.signed_pool, args.clients, args.concurrency, args.duration,
+        args.via_router)
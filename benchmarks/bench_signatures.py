@@ -0,0 +1,94 @@
+"""
+Пропускная способность проверки подписей по схемам (RSA-PSS 2048, Ed25519):
+inline против пула потоков/процессов, скорость подписи на клиенте, а также стоимость
+сборки подписываемых данных (строка старых клиентов против двоичного transaction_payload).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_signatures --count 2000
+"""
+import argparse
+import os
+import time
+
+import payment_pb2
+from signature_verifier import SignatureVerifier, verify_signature
+from signing import SCHEMES, legacy_payload, sign_request, transaction_payload
+
+
+def make_samples(private_key, count):
+    """
+    :return: Кортеж (пары (подпись, данные), подписей в секунду).
+    """
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        request = sign_request(private_key, payment_pb2.TransactionRequest(
+            sender_id="user1", receiver_id="user2", amount=float(i)))
+        samples.append((request.signature, transaction_payload(request)))
+    return samples, count / (time.perf_counter() - start)
+
+
+def bench_inline(public_key, samples):
+    start = time.perf_counter()
+    for signature, message in samples:
+        verify_signature(public_key, signature, message)
+    return len(samples) / (time.perf_counter() - start)
+
+
+def bench_pool(public_key, samples, workers, use_processes, cache_size=0):
+    verifier = SignatureVerifier(max_workers=workers, use_processes=use_processes,
+                                 cache_size=cache_size)
+    # Прогрев пула, чтобы не учитывать запуск процессов
+    verifier.verify(public_key, *samples[0])
+    start = time.perf_counter()
+    pending = [verifier.submit(public_key, signature, message) for signature, message in samples]
+    for future in pending:
+        future.result()
+    rate = len(samples) / (time.perf_counter() - start)
+    verifier.shutdown()
+    return rate
+
+
+def bench_payload(build, count):
+    request = payment_pb2.TransactionRequest(sender_id="user1", receiver_id="user2", amount=1234.56)
+    start = time.perf_counter()
+    for _ in range(count):
+        build(request)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(count, schemes):
+    cores = os.cpu_count() or 1
+    for build in (legacy_payload, transaction_payload):
+        print(f"{build.__name__ + ':':<22}{bench_payload(build, 100_000):>10.2f} us per payload")
+
+    for name in schemes:
+        private_key = SCHEMES[name].generate()
+        public_key = private_key.public_key()
+        samples, sign_rate = make_samples(private_key, count)
+        print(f"{name} ({len(samples[0][0])}-byte signatures):")
+        print(f"  sign:               {sign_rate:>10.0f} sign/s")
+        print(f"  inline:             {bench_inline(public_key, samples):>10.0f} verify/s")
+        for workers in sorted({1, 4, cores}):
+            threads = bench_pool(public_key, samples, workers, use_processes=False)
+            processes = bench_pool(public_key, samples, workers, use_processes=True)
+            print(f"  {workers:>2} threads:         {threads:>10.0f} verify/s")
+            print(f"  {workers:>2} processes:       {processes:>10.0f} verify/s")
+
+        # Повторная отправка тех же подписей обслуживается из кэша
+        verifier = SignatureVerifier(max_workers=cores, cache_size=count)
+        for signature, message in samples:
+            verifier.verify(public_key, signature, message)
+        start = time.perf_counter()
+        for signature, message in samples:
+            verifier.verify(public_key, signature, message)
+        print(f"  cache hits:         {count / (time.perf_counter() - start):>10.0f} verify/s")
+        verifier.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Signature verification throughput benchmark")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--schemes", nargs="+", choices=tuple(SCHEMES), default=list(SCHEMES))
+    args = parser.parse_args()
+    run(args.count, args.schemes)
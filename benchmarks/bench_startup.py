@@ -0,0 +1,115 @@
+"""
+Холодный старт точек входа.
+
+Для server.py и client.py в отдельных процессах замеряется время импорта модуля
+и проверяется, какие тяжелые зависимости он загрузил. Затем сервер запускается
+целиком, и замеряется время от запуска процесса до первого обслуженного вызова
+VerifyTransaction, а также задержка первого CreateTransaction (загрузка криптографии
+и разбор ключа отправителя при первом обращении).
+
+Цель: первый вызов обслуживается меньше чем через 0.5 с после запуска процесса
+на одноядерной машине.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import grpc
+from cryptography.hazmat.primitives import serialization
+
+import payment_pb2
+import payment_pb2_grpc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("grpc", "cryptography", "http.server", "asyncio", "payment_pb2", "payment_pb2_grpc")
+TARGET_FIRST_RPC = 0.5  # Цель: секунды от запуска процесса до первого ответа
+# Короткие паузы между попытками соединения, иначе замер определяет стандартная пауза gRPC в 1 с
+PROBE_OPTIONS = [("grpc.initial_reconnect_backoff_ms", 10), ("grpc.min_reconnect_backoff_ms", 10),
+                 ("grpc.max_reconnect_backoff_ms", 10)]
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time(module):
+    """
+    :return: Кортеж (секунды на импорт, загруженные тяжелые модули).
+    """
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    elapsed, loaded = json.loads(output)
+    return elapsed, loaded
+
+
+def signed_request():
+    with open(os.path.join(ROOT, "user1_private.pem"), "rb") as f:
+        private_key = serialization.load_pem_private_key(f.read(), password=None)
+    from signing import sign_request
+    return sign_request(private_key, payment_pb2.TransactionRequest(sender_id="user1", receiver_id="user2",
+                                                                    amount=1.0))
+
+
+def server_start(request):
+    """
+    :return: Кортеж (секунды до первого VerifyTransaction, секунды на первый CreateTransaction).
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--bind", f"127.0.0.1:{port}", "--in-memory", "--metrics-port", "0",
+         "--key-reload-interval", "0", "--log-level", "WARNING"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}", options=PROBE_OPTIONS) as channel:
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            stub.VerifyTransaction(payment_pb2.VerifyRequest(transaction_id="txn_0"), wait_for_ready=True,
+                                   timeout=30)
+            first_rpc = time.perf_counter() - start
+            call_start = time.perf_counter()
+            response = stub.CreateTransaction(request, timeout=30)
+            first_create = time.perf_counter() - call_start
+            assert response.success
+    finally:
+        process.terminate()
+        process.wait()
+    return first_rpc, first_create
+
+
+def run(runs):
+    for module in ("server", "client", "sharded_server"):
+        samples = [import_time(module) for _ in range(runs)]
+        print(f"import {module:<15} {statistics.median(s[0] for s in samples) * 1e3:>7.1f} ms, "
+              f"loads: {', '.join(samples[0][1])}")
+    request = signed_request()
+    samples = [server_start(request) for _ in range(runs)]
+    first_rpc = statistics.median(s[0] for s in samples)
+    print(f"server start to first RPC {first_rpc * 1e3:>7.1f} ms (target {TARGET_FIRST_RPC * 1e3:.0f} ms: "
+          f"{'met' if first_rpc <= TARGET_FIRST_RPC else 'missed'})")
+    print(f"first CreateTransaction   {statistics.median(s[1] for s in samples) * 1e3:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import time and cold start of the server and client")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run(args.runs)
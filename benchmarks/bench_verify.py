@@ -0,0 +1,47 @@
+"""
+Задержка VerifyTransaction в зависимости от размера леджера.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_verify --max-size 10000000
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+
+import payment_pb2
+from server import PaymentService
+
+
+def measure(service, ids, lookups):
+    requests = [payment_pb2.VerifyRequest(transaction_id=random.choice(ids)) for _ in range(lookups)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for request in requests:
+            service.VerifyTransaction(request, None)
+        elapsed = time.perf_counter() - start
+    return elapsed / lookups * 1e6
+
+
+def run(max_size, lookups):
+    service = PaymentService()
+    store = service.transactions
+    size = 1000
+    created = []
+    while size <= max_size:
+        # Дозаполняем леджер до нужного размера
+        for i in range(len(store), size):
+            created.append(store.append(f"user{i % 1000}", f"user{(i + 1) % 1000}", 1.0, b"\x00"))
+        ids = [random.choice(created) for _ in range(1000)]
+        latency = measure(service, ids, lookups)
+        print(f"{size:>10} transactions: {latency:.2f} us per VerifyTransaction")
+        size *= 10
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="VerifyTransaction latency benchmark")
+    parser.add_argument("--max-size", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.max_size, args.lookups)
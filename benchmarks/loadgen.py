@@ -0,0 +1,242 @@
+"""
+Генератор нагрузки для PaymentService без интерактивного ввода.
+
+Поднимает сервер в этом же процессе на localhost и подает смешанную нагрузку:
+подписанные CreateTransaction от многих ключей, VerifyTransaction по созданным ID
+и потоковые сессии заправки от FuelPumpSimulator. Результат печатается в JSON.
+
+Запуск из корня репозитория:
+    python -m benchmarks.loadgen --mode closed --concurrency 32 --duration 10
+    python -m benchmarks.loadgen --mode open --rate 2000 --fuel-sessions 50
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import payment_pb2
+import payment_pb2_grpc
+from client import FuelPumpSimulator, FuelSessionClient
+from server import PaymentService
+from signature_verifier import SignatureVerifier
+from signing import sign_request
+
+
+LOAD_BALANCE = 10 ** 12  # Баланс счетов нагрузки в копейках
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Recorder:
+    """
+    Сбор задержек и ошибок по типам операций.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, operation, latency, ok=True):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(latency)
+            if not ok:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def report(self, elapsed):
+        result = {}
+        for operation, values in sorted(self.latencies.items()):
+            result[operation] = {
+                "count": len(values),
+                "errors": self.errors.get(operation, 0),
+                "throughput": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 0.5) * 1e3, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1e3, 3),
+                "p999_ms": round(percentile(values, 0.999) * 1e3, 3),
+            }
+        return result
+
+
+class Workload:
+    """
+    Заранее подписанные транзакции от многих ключей и выбор следующей операции по смеси.
+    """
+
+    def __init__(self, service, keys, signed_pool, verify_ratio, seed):
+        self.random = random.Random(seed)
+        self.verify_ratio = verify_ratio
+        self.created_ids = []
+        self.users = users = []  # Пары (счет, закрытый ключ)
+        for n in range(keys):
+            user_id = f"load{n}"
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            service.keys.register(user_id, private_key.public_key())
+            # Баланс с запасом, чтобы переводы по кругу не упирались в нехватку средств
+            service.balances.open(user_id, LOAD_BALANCE)
+            users.append((user_id, private_key))
+        # Подписи готовятся до запуска, чтобы клиентская криптография не искажала замеры
+        self.requests = []
+        for i in range(signed_pool):
+            user_id, private_key = users[i % keys]
+            receiver_id = users[(i + 1) % keys][0]
+            request = payment_pb2.TransactionRequest(
+                sender_id=user_id, receiver_id=receiver_id, amount=float(i + 1)
+            )
+            self.requests.append(sign_request(private_key, request))
+        self._next_request = itertools.cycle(self.requests)
+
+    def next_operation(self):
+        """
+        :return: Кортеж (имя метода заглушки, запрос).
+        """
+        if self.created_ids and self.random.random() < self.verify_ratio:
+            transaction_id = self.random.choice(self.created_ids)
+            return "VerifyTransaction", payment_pb2.VerifyRequest(transaction_id=transaction_id)
+        return "CreateTransaction", next(self._next_request)
+
+    def completed(self, operation, response):
+        if operation == "CreateTransaction" and response.success:
+            self.created_ids.append(response.transaction_id)
+        return response.success
+
+
+def run_closed_loop(stub, workload, recorder, concurrency, deadline):
+    def worker():
+        while time.monotonic() < deadline:
+            operation, request = workload.next_operation()
+            start = time.perf_counter()
+            try:
+                response = getattr(stub, operation)(request)
+                ok = workload.completed(operation, response)
+            except grpc.RpcError:
+                ok = False
+            recorder.record(operation, time.perf_counter() - start, ok)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(stub, workload, recorder, rate, deadline):
+    # Задержка считается от запланированного момента отправки, а не от фактического,
+    # чтобы отставание генератора не скрывало очереди на сервере
+    pending = []
+    scheduled = time.perf_counter()
+    while time.monotonic() < deadline:
+        scheduled += workload.random.expovariate(rate)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        operation, request = workload.next_operation()
+        future = getattr(stub, operation).future(request)
+
+        def done(f, operation=operation, start=scheduled):
+            try:
+                ok = workload.completed(operation, f.result())
+            except grpc.RpcError:
+                ok = False
+            recorder.record(operation, time.perf_counter() - start, ok)
+        future.add_done_callback(done)
+        pending.append(future)
+    for future in pending:
+        try:
+            future.result()
+        except grpc.RpcError:
+            pass
+
+
+def run_fuel_session(stub, recorder, frame_rate, flow_rate, deadline, account_id, private_key):
+    pump = FuelPumpSimulator(flow_rate_liters_per_second=flow_rate)
+    pump.is_pumping = True
+    session = FuelSessionClient(stub, 54.37, account_id=account_id, private_key=private_key)
+    next_at = time.monotonic()
+    while time.monotonic() < deadline and not session.failed:
+        next_at += 1 / frame_rate
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        session.send(pump.get_fuel_consumed(1 / frame_rate))
+    session.finish()
+    for latency in session.latencies:
+        recorder.record("FuelFrame", latency, not session.failed)
+
+
+def run(args):
+    service = PaymentService(SignatureVerifier(cache_size=args.verify_cache))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.server_workers + args.fuel_sessions))
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(service, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+
+    workload = Workload(service, args.keys, args.signed_pool, args.verify_ratio, args.seed)
+    recorder = Recorder()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = payment_pb2_grpc.PaymentServiceStub(channel)
+            grpc.channel_ready_future(channel).result(timeout=10)
+            start = time.perf_counter()
+            deadline = time.monotonic() + args.duration
+            fuel_threads = [
+                threading.Thread(target=run_fuel_session,
+                                 args=(stub, recorder, args.frame_rate, args.flow_rate, deadline,
+                                       *workload.users[n % args.keys]))
+                for n in range(args.fuel_sessions)
+            ]
+            for thread in fuel_threads:
+                thread.start()
+            if args.mode == "closed":
+                run_closed_loop(stub, workload, recorder, args.concurrency, deadline)
+            else:
+                run_open_loop(stub, workload, recorder, args.rate, deadline)
+            for thread in fuel_threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+    finally:
+        server.stop(0)
+
+    return {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 3),
+        "operations": recorder.report(elapsed),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless PaymentService load generator")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed-loop workers")
+    parser.add_argument("--rate", type=float, default=1000.0, help="open-loop requests per second")
+    parser.add_argument("--keys", type=int, default=8, help="number of signing keys")
+    parser.add_argument("--signed-pool", type=int, default=2000, help="pre-signed transactions to cycle through")
+    parser.add_argument("--verify-ratio", type=float, default=0.5, help="share of VerifyTransaction lookups")
+    parser.add_argument("--verify-cache", type=int, default=0, help="server signature cache size")
+    parser.add_argument("--fuel-sessions", type=int, default=0, help="concurrent streaming fuel sessions")
+    parser.add_argument("--frame-rate", type=float, default=20.0, help="frames per second per fuel session")
+    parser.add_argument("--flow-rate", type=float, default=6.0, help="pump flow rate, liters per second")
+    parser.add_argument("--server-workers", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
@@ -1,9 +1,18 @@
 import grpc
 import payment_pb2
 import payment_pb2_grpc
+import argparse
+import logging
+import queue
 import threading
 import time
-from datetime import datetime
+import uuid
+from structured_logging import setup_logging
+from metering import AdaptiveMeter, MonotonicTicker
+from backoff import RetryingStub
+from signing import sign_fuel_session
+
+logger = logging.getLogger("payment.client")
 
 # Внешняя структура, имитирующая подачу топлива
 class FuelPumpSimulator:
@@ -14,11 +23,11 @@ class FuelPumpSimulator:
 
     def start_pumping(self):
         self.is_pumping = True
-        print("Fuel pumping started.")
+        logger.info("Fuel pumping started.")
 
     def stop_pumping(self):
         self.is_pumping = False
-        print("Fuel pumping stopped.")
+        logger.info("Fuel pumping stopped.")
 
     def get_fuel_consumed(self, time_interval):
         if self.is_pumping:
@@ -27,71 +36,226 @@ class FuelPumpSimulator:
             return fuel_consumed
         return 0
 
-def process_fuel_payment(stub, fuel_price_per_liter, liters, is_finished=False):
-    # Отправка запроса на оплату бензина
+def process_fuel_payment(stub, fuel_price_per_liter, liters, is_finished=False, session_id="", account_id="",
+                         opened_at=0, signature=b""):
+    # Отправка запроса на оплату бензина; opened_at и signature - подпись открытия сессии из sign_fuel_session
     start_time = time.time()  # Засекаем время начала отправки
     response = stub.ProcessFuelPayment(payment_pb2.FuelPaymentRequest(
         fuel_price_per_liter=fuel_price_per_liter,
         liters=liters,
-        is_finished=is_finished
+        is_finished=is_finished,
+        session_id=session_id,
+        account_id=account_id,
+        opened_at=opened_at,
+        signature=signature
     ))
     end_time = time.time()  # Засекаем время получения ответа
     return response, end_time - start_time  # Возвращаем ответ и время передачи
 
-def fueling_process(stub, fuel_price_per_liter, fuel_pump):
+class FuelSessionClient:
+    """
+    Потоковая сессия заправки: кадры отправляются конвейером,
+    подтверждения читаются в отдельном потоке.
+    """
+
+    def __init__(self, stub, fuel_price_per_liter, session_id=None, on_ack=None, account_id="", on_rtt=None,
+                 private_key=None):
+        """
+        :param stub: PaymentServiceStub.
+        :param fuel_price_per_liter: Цена за литр.
+        :param session_id: Идентификатор сессии (по умолчанию генерируется).
+        :param on_ack: Функция, вызываемая для каждого подтверждения.
+        :param account_id: Счет плательщика, на котором сервер выставляет холд.
+        :param on_rtt: Функция, получающая время ответа на каждый кадр.
+        :param private_key: Закрытый ключ счета, которым подписывается открытие сессии.
+        """
+        self.fuel_price_per_liter = fuel_price_per_liter
+        self.account_id = account_id
+        self.session_id = session_id or uuid.uuid4().hex
+        self.opened_at, self.signature = 0, b""
+        if private_key is not None:
+            self.opened_at, self.signature = sign_fuel_session(private_key, self.session_id, account_id)
+        self.on_ack = on_ack
+        self.on_rtt = on_rtt
+        self.latencies = []   # Время от отправки кадра до подтверждения (секунды)
+        self.failed = False
+        self._sequence = 0
+        self._sent_at = {}
+        self._frames = queue.Queue()
+        self._responses = stub.FuelSession(self._frame_iterator())
+        self._reader = threading.Thread(target=self._read_acks, daemon=True)
+        self._reader.start()
+
+    def _frame_iterator(self):
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+            yield frame
+
+    def _read_acks(self):
+        try:
+            for ack in self._responses:
+                latency = time.monotonic() - self._sent_at.pop(ack.sequence)
+                self.latencies.append(latency)
+                if self.on_rtt:
+                    self.on_rtt(latency)
+                if not ack.success:
+                    self.failed = True
+                if self.on_ack:
+                    self.on_ack(ack)
+        except grpc.RpcError as e:
+            logger.error("Fuel session failed: %s", e.code())
+            self.failed = True
+
+    @property
+    def in_flight(self):
+        # Кадры, отправленные без подтверждения
+        return len(self._sent_at)
+
+    def send(self, liters, is_finished=False):
+        """
+        Отправка кадра без ожидания подтверждения.
+        :return: Порядковый номер кадра.
+        """
+        self._sequence += 1
+        self._sent_at[self._sequence] = time.monotonic()
+        self._frames.put(payment_pb2.FuelFrame(
+            session_id=self.session_id,
+            sequence=self._sequence,
+            fuel_price_per_liter=self.fuel_price_per_liter,
+            liters=liters,
+            is_finished=is_finished,
+            account_id=self.account_id,
+            opened_at=self.opened_at,
+            signature=self.signature
+        ))
+        return self._sequence
+
+    def finish(self):
+        """
+        Отправка завершающего кадра и ожидание всех подтверждений.
+        """
+        self.send(0, is_finished=True)
+        self._frames.put(None)
+        self._reader.join()
+
+def fueling_session_process(stub, fuel_price_per_liter, fuel_pump, account_id="", private_key=None):
+    total = {"liters": 0, "cost": 0}
+
+    def on_ack(ack):
+        if ack.success and ack.message != "Fueling finished":
+            logger.debug("Frame %d acknowledged. Total cost: %.2f RUB, Remaining hold: %.2f RUB",
+                         ack.sequence, ack.total_cost, ack.hold_remaining)
+
+    meter = AdaptiveMeter()
+    session = FuelSessionClient(stub, fuel_price_per_liter, on_ack=on_ack, account_id=account_id,
+                                on_rtt=meter.observe_rtt, private_key=private_key)
+    ticker = MonotonicTicker(meter.tick)
+    last_reading = time.monotonic()
+    while not stop_fueling.is_set() and not session.failed:
+        now = ticker.wait()
+        # Счетчик колонки читается за фактически прошедшее время, а не за номинальный тик
+        meter.add(fuel_pump.get_fuel_consumed(now - last_reading), now)
+        last_reading = now
+
+        # Кадры отправляются без ожидания ответа на предыдущие, размер кадра подбирает meter
+        liters = meter.take_frame(now, session.in_flight)
+        if liters:
+            session.send(liters)
+            total["liters"] += liters
+            total["cost"] += fuel_price_per_liter * liters
+
+    buffer_liters = meter.drain()
+    if buffer_liters > 0 and not session.failed:
+        session.send(buffer_liters)
+        total["liters"] += buffer_liters
+        total["cost"] += fuel_price_per_liter * buffer_liters
+
+    logger.info("Sending final frame to finish fueling...")
+    session.finish()
+    if session.failed:
+        logger.error("Fuel payment failed")
+    else:
+        logger.info("Fueling finished successfully. Total fueled: %.2f liters, Total cost: %.2f RUB. Frames: %d",
+                    total["liters"], total["cost"], len(session.latencies))
+
+def fueling_process(stub, fuel_price_per_liter, fuel_pump, account_id="", private_key=None):
+    session_id = uuid.uuid4().hex  # Идентификатор сессии заправки на сервере
+    # Подпись открытия сессии отправляется в каждом кадре: по ней сервер узнает владельца счета
+    opened_at, signature = sign_fuel_session(private_key, session_id, account_id) if private_key else (0, b"")
     total_liters = 0  # Общее количество заправленных литров
     total_cost = 0    # Общая стоимость заправки
-    buffer_liters = 0  # Буфер для накопления литров перед отправкой кадра
+    # Унарный вызов блокирует цикл, поэтому в полете не больше одного кадра,
+    # а все выданное за время ответа уходит следующим кадром
+    meter = AdaptiveMeter(max_in_flight=1)
+    ticker = MonotonicTicker(meter.tick)
+    last_reading = time.monotonic()
 
     while not stop_fueling.is_set():
-        # Получаем количество потребленного топлива за интервал времени
-        time_interval = 0.05  # Интервал времени (секунды)
-        fuel_consumed = fuel_pump.get_fuel_consumed(time_interval)
-        buffer_liters += fuel_consumed
-
-        # Если в буфере накопилось 0.3 литра или больше, отправляем кадр
-        if buffer_liters >= 0.3:
-            liters_to_send = 0.3
-            print(f"Sending frame: {liters_to_send:.2f} liters, {fuel_price_per_liter * liters_to_send:.2f} RUB")
-            response, _ = process_fuel_payment(stub, fuel_price_per_liter, liters_to_send)
+        # Получаем количество потребленного топлива за фактически прошедшее время
+        now = ticker.wait()
+        meter.add(fuel_pump.get_fuel_consumed(now - last_reading), now)
+        last_reading = now
+
+        liters_to_send = meter.take_frame(now)
+        if liters_to_send:
+            logger.debug("Sending frame: %.2f liters, %.2f RUB", liters_to_send, fuel_price_per_liter * liters_to_send)
+            response, transfer_time = process_fuel_payment(stub, fuel_price_per_liter, liters_to_send,
+                                                           session_id=session_id, account_id=account_id,
+                                                           opened_at=opened_at, signature=signature)
+            meter.observe_rtt(transfer_time)
             if not response.success:
-                print("Fuel payment failed")
+                logger.error("Fuel payment failed")
                 break
             total_liters += liters_to_send
             total_cost += fuel_price_per_liter * liters_to_send
-            buffer_liters -= liters_to_send
-            print(f"Total fueled: {total_liters:.2f} liters, Total cost: {total_cost:.2f} RUB")
-
-        # Задержка для следующего измерения
-        time.sleep(time_interval)
+            logger.debug("Total fueled: %.2f liters, Total cost: %.2f RUB", total_liters, total_cost)
 
     # Отправляем оставшиеся литры, если они есть
+    buffer_liters = meter.drain()
     if buffer_liters > 0:
-        print(f"Sending final frame: {buffer_liters:.2f} liters, {fuel_price_per_liter * buffer_liters:.2f} RUB")
-        response, _ = process_fuel_payment(stub, fuel_price_per_liter, buffer_liters)
+        logger.debug("Sending final frame: %.2f liters, %.2f RUB", buffer_liters, fuel_price_per_liter * buffer_liters)
+        response, _ = process_fuel_payment(stub, fuel_price_per_liter, buffer_liters, session_id=session_id,
+                                           account_id=account_id, opened_at=opened_at, signature=signature)
         if not response.success:
-            print("Fuel payment failed")
+            logger.error("Fuel payment failed")
         else:
             total_liters += buffer_liters
             total_cost += fuel_price_per_liter * buffer_liters
-            print(f"Total fueled: {total_liters:.2f} liters, Total cost: {total_cost:.2f} RUB")
 
     # Отправляем финальный кадр с флагом завершения
-    print("Sending final frame to finish fueling...")
-    response, transfer_time = process_fuel_payment(stub, fuel_price_per_liter, 0, is_finished=True)
+    logger.info("Sending final frame to finish fueling...")
+    response, transfer_time = process_fuel_payment(stub, fuel_price_per_liter, 0, is_finished=True,
+                                                   session_id=session_id, account_id=account_id,
+                                                   opened_at=opened_at, signature=signature)
     if response.success:
-        print(f"Fueling finished successfully. Transfer time: {transfer_time:.4f} seconds.")
+        logger.info("Fueling finished successfully. Total fueled: %.2f liters, Total cost: %.2f RUB. "
+                    "Transfer time: %.4f seconds.", total_liters, total_cost, transfer_time)
     else:
-        print("Failed to finish fueling.")
+        logger.error("Failed to finish fueling.")
+
+def load_private_key(path):
+    from cryptography.hazmat.primitives import serialization
+    with open(path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
 
-def run():
+def run(use_stream=True, account_id="user1", with_metrics=False, key_path=None):
     global stop_fueling
     stop_fueling = threading.Event()  # Флаг для остановки заправки
 
     # Подключение к серверу
-    with grpc.insecure_channel('localhost:50051') as channel:
-        stub = payment_pb2_grpc.PaymentServiceStub(channel)
+    with grpc.insecure_channel('localhost:50051') as raw_channel:
+        channel = raw_channel
+        if with_metrics:
+            # Метрики (и их HTTP-эндпоинт) загружаются, только если включены
+            from metrics import ClientMetricsInterceptor
+            channel = grpc.intercept_channel(raw_channel, ClientMetricsInterceptor())
+        # Унарные вызовы, отклоненные перегруженным сервером, повторяются по его подсказке
+        stub = RetryingStub(payment_pb2_grpc.PaymentServiceStub(channel))
         fuel_price_per_liter = 54.37  # Цена за литр бензина
+        # Ключ счета подписывает открытие сессии: без подписи сервер не выставит холд
+        private_key = load_private_key(key_path or f"{account_id}_private.pem")
 
         # Создаем симулятор подачи топлива
         fuel_pump = FuelPumpSimulator(flow_rate_liters_per_second=6)  # 6 литров в секунду
@@ -109,7 +273,9 @@ def run():
         fuel_pump.start_pumping()
 
         # Запускаем процесс заправки в отдельном потоке
-        fueling_thread = threading.Thread(target=fueling_process, args=(stub, fuel_price_per_liter, fuel_pump))
+        target = fueling_session_process if use_stream else fueling_process
+        fueling_thread = threading.Thread(target=target, args=(stub, fuel_price_per_liter, fuel_pump, account_id,
+                                                               private_key))
         fueling_thread.start()
 
         # Ожидаем ввода пользователя для остановки заправки
@@ -123,4 +289,17 @@ def run():
                 break
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fuel station client")
+    parser.add_argument("--unary", action="store_true", help="send frames with unary ProcessFuelPayment calls")
+    parser.add_argument("--account", default="user1", help="payer account the fuel hold is placed on")
+    parser.add_argument("--key", default=None, help="private key of the account (default: <account>_private.pem)")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG logs every frame")
+    parser.add_argument("--log-format", choices=("json", "text"), default="text")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve client metrics on 127.0.0.1:PORT/metrics (0 disables)")
+    args = parser.parse_args()
+    setup_logging(args.log_level, json_output=args.log_format == "json")
+    if args.metrics_port:
+        from metrics import start_metrics_server
+        start_metrics_server(args.metrics_port)
+    run(use_stream=not args.unary, account_id=args.account, with_metrics=bool(args.metrics_port), key_path=args.key)
\ No newline at end of file
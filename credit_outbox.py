@@ -0,0 +1,182 @@
+import hashlib
+import hmac
+import logging
+import os
+import struct
+import threading
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from balance_engine import to_minor, valid_amount
+
+logger = logging.getLogger("payment.credits")
+
+PEER_SECRET_ENV = "PAYMENT_PEER_SECRET"  # Переменная окружения с общим секретом шардов (hex)
+CURSOR_FILE = "credit_outbox.cursor"  # Номер первой недоставленной строки леджера
+# Зачислений, отправляемых шардам получателей одновременно: они идут в полосу транзакций получателя
+# и не должны вытеснять из ее очереди вызовы клиентов
+DELIVERY_BATCH = 16
+CALL_TIMEOUT = 5.0  # Дедлайн вызова соседнего шарда, секунды
+POLL_INTERVAL = 1.0  # Проверка леджера без уведомления о новых переводах, секунды
+RETRY_DELAY = 0.1  # Первая пауза перед повтором недоставленных зачислений, секунды
+MAX_RETRY_DELAY = 10.0
+
+_LENGTH = struct.Struct(">I")
+_AMOUNT = struct.Struct(">q")
+
+
+def credit_mac(secret, transaction_id, sender_id, receiver_id, amount):
+    """
+    Подпись зачисления общим секретом шардов: CreditAccount доступен любому клиенту шарда,
+    и без нее ID, получателя и сумму зачисления задавал бы вызывающий.
+    :param amount: Сумма в рублях, подписывается в копейках.
+    """
+    fields = [value.encode() for value in (transaction_id, sender_id, receiver_id)]
+    message = b"".join(_LENGTH.pack(len(field)) + field for field in fields) + _AMOUNT.pack(to_minor(amount))
+    return hmac.new(secret, message, hashlib.sha256).digest()
+
+
+class CreditOutbox:
+    """
+    Доставка зачислений получателям с других шардов шардом отправителя.
+    Очередь доставки - сам леджер шарда: переводы его отправителей получателям с других шардов
+    читаются из леджера по порядку строк, поэтому зачисление не теряется, если перевод записан,
+    а шард получателя недоступен или процесс перезапустился. Номер первой недоставленной строки
+    сохраняется в каталоге леджера, после перезапуска доставка продолжается с него,
+    а повторы шард получателя пропускает по ID транзакции.
+    Зачисления подписываются общим секретом шардов, шард получателя принимает только их (confirm).
+    """
+
+    def __init__(self, transactions, ring, shard_index, peers, secret, data_dir=None, channel_options=()):
+        """
+        :param transactions: TransactionStore этого шарда.
+        :param ring: HashRing шардов.
+        :param shard_index: Номер этого шарда.
+        :param peers: Адреса всех шардов в порядке их номеров (включая этот).
+        :param secret: Общий секрет шардов (байты).
+        :param data_dir: Каталог леджера для курсора доставки (None - курсор только в памяти).
+        """
+        if not secret:
+            raise ValueError("shard workers need a shared peer secret")
+        self.transactions = transactions
+        self.ring = ring
+        self.shard_index = shard_index
+        self._secret = secret
+        self._channels = [grpc.insecure_channel(address, options=channel_options) for address in peers]
+        self._stubs = [payment_pb2_grpc.PaymentServiceStub(channel) for channel in self._channels]
+        self._cursor_path = os.path.join(data_dir, CURSOR_FILE) if data_dir else None
+        self._cursor = self._load_cursor()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="credit-outbox", daemon=True)
+
+    def _load_cursor(self):
+        if self._cursor_path is None or not os.path.exists(self._cursor_path):
+            return 0
+        with open(self._cursor_path) as f:
+            return int(f.read().strip() or 0)
+
+    def _save_cursor(self):
+        # Отставший курсор безопасен (повтор зачисления ничего не меняет), поэтому fsync не нужен
+        if self._cursor_path is None:
+            return
+        with open(self._cursor_path + ".tmp", "w") as f:
+            f.write(str(self._cursor))
+        os.replace(self._cursor_path + ".tmp", self._cursor_path)
+
+    def _owns(self, account_id):
+        return self.ring.shard_for(account_id) == self.shard_index
+
+    def start(self):
+        """
+        Запуск доставки, в том числе недоставленных до перезапуска зачислений.
+        """
+        if self._cursor:
+            logger.info("Credit delivery resumes from ledger row %d", self._cursor)
+        self._thread.start()
+
+    def notify(self):
+        """
+        Уведомление о записанном переводе получателю с другого шарда.
+        """
+        self._wake.set()
+
+    def _next_batch(self):
+        """
+        :return: Кортеж (переводы на другие шарды, номер строки после просмотренных).
+        """
+        batch = []
+        end = self._cursor
+        for row, transaction in self.transactions.query(start_row=self._cursor):
+            end = row + 1
+            if self._owns(transaction.sender_id) and not self._owns(transaction.receiver_id):
+                batch.append(transaction)
+                if len(batch) >= DELIVERY_BATCH:
+                    break
+        return batch, end
+
+    def _deliver(self, batch):
+        """
+        :return: Переводы, которые нужно отправить повторно.
+        """
+        calls = [
+            (transaction, self._stubs[self.ring.shard_for(transaction.receiver_id)].CreditAccount.future(
+                payment_pb2.CreditRequest(
+                    transaction_id=transaction.id, sender_id=transaction.sender_id,
+                    receiver_id=transaction.receiver_id, amount=transaction.amount,
+                    peer_mac=credit_mac(self._secret, transaction.id, transaction.sender_id,
+                                        transaction.receiver_id, transaction.amount)),
+                timeout=CALL_TIMEOUT))
+            for transaction in batch
+        ]
+        failed = []
+        for transaction, call in calls:
+            try:
+                if not call.result().success:
+                    # Отказ шарда получателя не изменится при повторе: зачисление остается в леджере для разбора
+                    logger.error("Credit rejected: ID=%s, Receiver=%s, Amount=%s",
+                                 transaction.id, transaction.receiver_id, transaction.amount)
+            except grpc.RpcError as e:
+                logger.warning("Credit delivery failed: ID=%s: %s", transaction.id, e.code())
+                failed.append(transaction)
+        return failed
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch, end = self._next_batch()
+            delay = RETRY_DELAY
+            while batch and not self._stop.is_set():
+                batch = self._deliver(batch)
+                if batch:
+                    self._stop.wait(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+            if self._stop.is_set():
+                return
+            if end > self._cursor:
+                self._cursor = end
+                self._save_cursor()
+                continue
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+
+    def confirm(self, request):
+        """
+        :param request: CreditRequest.
+        :return: True, если зачисление подписано шардом с тем же секретом.
+        """
+        # Сумма неподписанного запроса может быть NaN или бесконечностью, в копейки ее не перевести
+        if not valid_amount(request.amount):
+            return False
+        expected = credit_mac(self._secret, request.transaction_id, request.sender_id, request.receiver_id,
+                              request.amount)
+        return hmac.compare_digest(request.peer_mac, expected)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        for channel in self._channels:
+            channel.close()
@@ -0,0 +1,310 @@
+import hmac
+import logging
+import math
+import threading
+import time
+import zlib
+from concurrent import futures
+
+from balance_engine import from_minor, to_minor
+from lru import LRUCache
+
+DEFAULT_HOLD_AMOUNT = 100  # Холд в рублях, который выставляется на сессию
+DEFAULT_TOP_UP_THRESHOLD = 0.5  # Доля использованного холда, после которой запрашивается доплата
+DEFAULT_FINISHED_SESSIONS = 100_000  # Завершенные сессии, повтор кадров которых отклоняется
+DEFAULT_IDLE_TTL = 300.0  # Секунды без кадров, после которых унарная сессия завершается и холд возвращается
+
+logger = logging.getLogger("payment.fuel")
+
+
+class HoldError(Exception):
+    """
+    Итог сессии не проведен: списание не записано в журнал или холда на счете не хватило.
+    """
+
+
+class ReplayedFrameError(Exception):
+    """
+    Кадр потоковой сессии с номером не больше уже принятого: повтор или переупорядоченный кадр.
+    """
+
+
+class SessionAuthError(Exception):
+    """
+    Кадр не подтверждает право на сессию: подпись открытия не совпадает с сессией или сессия не открыта.
+    """
+
+
+class FuelHold:
+    """
+    Состояние холда одной сессии заправки.
+    Авторизованная и списанная суммы хранятся в копейках.
+    """
+    __slots__ = ("account_id", "authorized", "captured", "total_cost", "top_up", "declined", "closed", "sequence",
+                 "last_seen", "credential")
+
+    def __init__(self, account_id):
+        self.account_id = account_id  # Счет, на котором выставлен холд
+        self.authorized = 0           # Всего авторизовано за сессию
+        self.captured = 0             # Всего списано со счета
+        self.total_cost = 0           # Общая стоимость заправки в рублях
+        self.top_up = None            # Future запрошенной доплаты холда
+        self.declined = False         # В доплате отказано, заранее она больше не запрашивается
+        self.closed = False           # Сессия завершена
+        self.sequence = 0             # Номер последнего принятого кадра потоковой сессии
+        self.last_seen = 0.0          # Время последнего кадра по часам менеджера
+        self.credential = None        # Подпись открытия сессии, которую должен нести каждый кадр
+
+    @property
+    def hold_amount(self):
+        return from_minor(self.authorized)
+
+    @property
+    def remaining(self):
+        return from_minor(self.authorized - self.captured)
+
+
+class FuelSessionManager:
+    """
+    Менеджер холдов по сессиям заправки.
+    Сессии распределены по шардам, у каждого шарда своя блокировка,
+    поэтому колонки не конкурируют за один общий объект.
+
+    Жизненный цикл холда: авторизация на первом кадре, учет стоимости каждого кадра
+    в холде, доплата холда и при завершении одно списание итога с возвратом остатка.
+    Итог проводится по балансу только после записи в журнал (journal), поэтому баланс,
+    восстановленный из журнала после рестарта, совпадает с проведенным.
+    Доплата запрашивается в фоне заранее, когда использована заданная доля холда,
+    поэтому кадры не ждут авторизации, пока банк успевает ее выдать.
+    Унарные сессии, по которым долго нет кадров, завершает фоновый поток: колонка могла
+    пропасть, не отправив завершающий кадр. Потоковые сессии завершает сервер при обрыве потока.
+    """
+
+    def __init__(self, balances, shards=64, hold_amount=DEFAULT_HOLD_AMOUNT,
+                 top_up_threshold=DEFAULT_TOP_UP_THRESHOLD, authorizer=None, max_workers=8,
+                 finished_sessions=DEFAULT_FINISHED_SESSIONS, idle_ttl=DEFAULT_IDLE_TTL, clock=time.monotonic):
+        """
+        :param balances: BalanceEngine со счетами плательщиков.
+        :param shards: Количество шардов.
+        :param hold_amount: Размер холда и каждой доплаты в рублях.
+        :param top_up_threshold: Доля использованного холда, после которой запрашивается доплата
+                                 (1.0 - только когда холда уже не хватает на кадр).
+        :param authorizer: Функция (account_id, сумма в копейках) -> bool, выставляющая холд
+                           на счете из balances (по умолчанию balances.hold).
+        :param max_workers: Потоки для фоновых запросов авторизации.
+        :param finished_sessions: Сколько завершенных сессий помнить, чтобы повтор
+                                  их кадров не открыл сессию заново.
+        :param idle_ttl: Секунды без кадров, после которых унарная сессия завершается (0 отключает).
+        """
+        self.hold_amount = hold_amount
+        self.balances = balances
+        self.top_up_threshold = top_up_threshold
+        self._hold_minor = to_minor(hold_amount)
+        self._authorize = authorizer or balances.hold
+        # Функция (account_id, сумма в копейках), записывающая итог сессии в журнал; задается сервисом с леджером
+        self.journal = None
+        self._pool = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fuel-hold")
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._finished = LRUCache(finished_sessions)
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._stop = threading.Event()
+        self._sweeper = None
+        if idle_ttl:
+            self._sweeper = threading.Thread(target=self._sweep, args=(idle_ttl / 2,), name="fuel-sessions",
+                                             daemon=True)
+            self._sweeper.start()
+
+    def _shard(self, session_id):
+        return self._shards[zlib.crc32(session_id.encode()) % len(self._shards)]
+
+    def _request_top_up(self, hold, lock, amount):
+        hold.top_up = self._pool.submit(self._top_up, hold, lock, amount)
+
+    def _top_up(self, hold, lock, amount):
+        try:
+            approved = self._authorize(hold.account_id, amount)
+        except Exception as e:
+            logger.error("Hold authorization failed: %s", e, extra={"account_id": hold.account_id})
+            approved = False
+        with lock:
+            hold.top_up = None
+            if not approved:
+                hold.declined = True
+            elif hold.closed:
+                # Сессия завершилась, пока шла авторизация: холд сразу возвращается
+                if not self.balances.release(hold.account_id, amount):
+                    logger.error("Hold release failed: %d kopecks", amount, extra={"account_id": hold.account_id})
+            else:
+                hold.authorized += amount
+        return approved
+
+    def charge(self, session_id, cost, account_id, sequence=0, credential=None, verified=False):
+        """
+        Списание стоимости кадра из холда сессии. Сессия создается при первом кадре.
+        Кадр ждет авторизации только на первом кадре сессии и когда доплата не успела прийти.
+        :param cost: Стоимость кадра в рублях, конечное положительное число.
+        :param account_id: Счет плательщика, на котором выставляется холд новой сессии.
+        :param sequence: Номер кадра потоковой сессии (0 - унарный кадр без номера).
+        :param credential: Подпись открытия сессии из кадра (None - без проверки, для вызовов внутри сервера).
+        :param verified: Вызывающий проверил credential и может открыть сессию; иначе кадр
+                         принимается только в уже открытую сессию с той же подписью.
+        :return: Кортеж (снимок холда или None, если в холде отказано,
+                 ждал ли кадр доплаты холда).
+        :raises ValueError: Если стоимость не положительна или не конечна.
+        :raises ReplayedFrameError: Если кадр с таким номером уже принят или сессия уже завершена.
+        :raises SessionAuthError: Если подпись кадра не открывает сессию и не совпадает с подписью сессии.
+        """
+        if not (math.isfinite(cost) and cost > 0):
+            raise ValueError(f"Invalid frame cost: {cost}")
+        if not account_id:
+            raise ValueError("Fuel session requires a payer account")
+        sessions, lock = self._shard(session_id)
+        stalled = False
+        shortfall_requested = False
+        while True:
+            with lock:
+                hold = sessions.get(session_id)
+                if hold is None:
+                    if self._finished.get(session_id):
+                        raise ReplayedFrameError(f"session {session_id} is already finished")
+                    if credential is not None and not verified:
+                        raise SessionAuthError(f"session {session_id} is not open")
+                    hold = sessions[session_id] = FuelHold(account_id)
+                    hold.credential = credential
+                    self._request_top_up(hold, lock, max(self._hold_minor, to_minor(cost)))
+                else:
+                    self._check_credential(hold, session_id, credential)
+                hold.last_seen = self._clock()
+                # Списывается разница округленных итогов, чтобы копейки не терялись на округлении кадров
+                if sequence and sequence <= hold.sequence:
+                    raise ReplayedFrameError(f"frame {sequence} of session {session_id} is already processed")
+                due = to_minor(hold.total_cost + cost) - hold.captured
+                available = hold.authorized - hold.captured
+                if due <= available:
+                    hold.captured += due
+                    hold.total_cost += cost
+                    hold.sequence = max(hold.sequence, sequence)
+                    if (available - due <= self._hold_minor * (1 - self.top_up_threshold)
+                            and hold.top_up is None and not hold.declined):
+                        self._request_top_up(hold, lock, self._hold_minor)
+                    return self._snapshot(hold), stalled
+                if hold.top_up is None:
+                    if not hold.declined:
+                        self._request_top_up(hold, lock, max(self._hold_minor, due - available))
+                    elif not shortfall_requested:
+                        # В полном холде отказано: запрашивается только недостающая для кадра сумма
+                        self._request_top_up(hold, lock, due - available)
+                        shortfall_requested = True
+                    else:
+                        if not hold.authorized:
+                            sessions.pop(session_id, None)
+                        return None, stalled
+                pending = hold.top_up
+                stalled = stalled or hold.authorized > 0
+            # Ожидание авторизации идет вне блокировки шарда
+            if pending is not None:
+                pending.result()
+
+    def finish(self, session_id, sequence=0, credential=None):
+        """
+        Завершение сессии: неиспользованный остаток холда возвращается на счет.
+        :param sequence: Номер завершающего кадра потоковой сессии (0 - унарный кадр без номера).
+        :param credential: Подпись открытия сессии из кадра (None - без проверки, для вызовов внутри сервера).
+        :return: Итоговый снимок холда или None, если сессии не было.
+        :raises HoldError: Если итог не проведен (сессия все равно закрывается).
+        :raises ReplayedFrameError: Если номер завершающего кадра не больше уже принятого.
+        :raises SessionAuthError: Если подпись кадра не совпадает с подписью сессии.
+        """
+        sessions, lock = self._shard(session_id)
+        with lock:
+            hold = sessions.get(session_id)
+            if hold is None:
+                return None
+            self._check_credential(hold, session_id, credential)
+            if sequence and sequence <= hold.sequence:
+                raise ReplayedFrameError(f"frame {sequence} of session {session_id} is already processed")
+            self._close_locked(sessions, session_id, hold)
+        # Запись в журнал ждет диска, поэтому идет вне блокировки шарда
+        return self._settle(session_id, hold)
+
+    @staticmethod
+    def _check_credential(hold, session_id, credential):
+        if credential is not None and not hmac.compare_digest(hold.credential or b"", credential):
+            raise SessionAuthError(f"credential does not match session {session_id}")
+
+    def _close_locked(self, sessions, session_id, hold):
+        # После закрытия холд не меняется: запоздавшую доплату _top_up сразу возвращает на счет
+        del sessions[session_id]
+        hold.closed = True
+        self._finished.put(session_id, True)
+
+    def _settle(self, session_id, hold):
+        if hold.captured and self.journal is not None:
+            try:
+                self.journal(hold.account_id, hold.captured)
+            except Exception as e:
+                # Незаписанное списание не проводится: баланс должен совпадать с журналом
+                self.balances.release(hold.account_id, hold.authorized)
+                raise HoldError(f"journal of {hold.captured} kopecks failed for session {session_id}: {e}") from e
+        if not self.balances.capture(hold.account_id, hold.captured, hold.authorized - hold.captured):
+            raise HoldError(f"settlement of {hold.captured} kopecks failed for session {session_id}")
+        return self._snapshot(hold)
+
+    def expire_idle(self):
+        """
+        Завершение унарных сессий, по которым нет кадров дольше idle_ttl.
+        :return: Количество завершенных сессий.
+        """
+        deadline = self._clock() - self.idle_ttl
+        expired = []
+        for sessions, lock in self._shards:
+            with lock:
+                idle = [(session_id, hold) for session_id, hold in sessions.items()
+                        if not hold.sequence and hold.last_seen < deadline]
+                for session_id, hold in idle:
+                    self._close_locked(sessions, session_id, hold)
+                expired.extend(idle)
+        for session_id, hold in expired:
+            try:
+                snapshot = self._settle(session_id, hold)
+                logger.warning("Idle fuel session expired. Session=%s, Total fuel cost: %.2f RUB",
+                               session_id, snapshot.total_cost)
+            except HoldError as e:
+                logger.error("Idle fuel session settlement failed: %s", e)
+        return len(expired)
+
+    def _sweep(self, interval):
+        while not self._stop.wait(interval):
+            self.expire_idle()
+
+    def get(self, session_id):
+        """
+        Снимок холда сессии или None.
+        """
+        sessions, lock = self._shard(session_id)
+        with lock:
+            hold = sessions.get(session_id)
+            return self._snapshot(hold) if hold else None
+
+    @staticmethod
+    def _snapshot(hold):
+        snapshot = FuelHold(hold.account_id)
+        snapshot.authorized = hold.authorized
+        snapshot.captured = hold.captured
+        snapshot.total_cost = hold.total_cost
+        return snapshot
+
+    def __contains__(self, session_id):
+        sessions, lock = self._shard(session_id)
+        with lock:
+            return session_id in sessions
+
+    def __len__(self):
+        return sum(len(sessions) for sessions, _ in self._shards)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+        self._pool.shutdown(wait=True)
@@ -1,28 +1,86 @@
-from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
+from concurrent import futures
+import argparse
+import base64
+import os
+from signing import DEFAULT_SCHEME, SCHEMES
 
-def generate_keys(user_id):
-    # Генерация закрытого ключа
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-    )
+def generate_keys(user_id, out_dir=".", key_size=2048, key_format="pem", scheme=DEFAULT_SCHEME):
+    # Генерация закрытого ключа выбранной схемы подписи (key_size используется только для RSA)
+    signature_scheme = SCHEMES[scheme]
+    private_key = signature_scheme.generate(key_size)
     # Сохранение закрытого ключа в файл
-    with open(f"{user_id}_private.pem", "wb") as f:
+    with open(os.path.join(out_dir, f"{user_id}_private.pem"), "wb") as f:
         f.write(private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            format=getattr(serialization.PrivateFormat, signature_scheme.private_format),
             encryption_algorithm=serialization.NoEncryption()
         ))
     # Генерация открытого ключа
     public_key = private_key.public_key()
     # Сохранение открытого ключа в файл
-    with open(f"{user_id}_public.pem", "wb") as f:
-        f.write(public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        ))
+    encoding = serialization.Encoding.DER if key_format == "der" else serialization.Encoding.PEM
+    public_bytes = public_key.public_bytes(
+        encoding=encoding,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    if key_format:
+        with open(os.path.join(out_dir, f"{user_id}_public.{key_format}"), "wb") as f:
+            f.write(public_bytes)
+    return public_key
+
+def _generate_files(user_id, out_dir, key_size, key_format, scheme):
+    # Объекты ключей не передаются между процессами, поэтому воркер возвращает только факт записи
+    generate_keys(user_id, out_dir, key_size, key_format, scheme)
+
+def _keystore_line(user_id, out_dir, key_size, scheme):
+    public_key = generate_keys(user_id, out_dir, key_size, key_format=None, scheme=scheme)
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return f"{user_id} {base64.b64encode(der).decode()}\n"
+
+def generate_bulk(count, out_dir, prefix="user", key_size=2048, key_format="pem", keystore=None, workers=None,
+                  scheme=DEFAULT_SCHEME):
+    """
+    Массовая генерация ключей для тестов в пуле процессов.
+    :param count: Количество пользователей.
+    :param out_dir: Каталог для файлов ключей.
+    :param prefix: Префикс идентификаторов пользователей (<prefix><номер>).
+    :param key_size: Размер ключа RSA.
+    :param key_format: Формат открытых ключей в каталоге: pem или der.
+    :param keystore: Если задан, открытые ключи пишутся в этот файл хранилища, а не отдельными файлами.
+    :param workers: Количество процессов (по умолчанию по числу ядер).
+    :param scheme: Схема подписи из signing.SCHEMES: rsa-pss или ed25519.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    user_ids = [f"{prefix}{n}" for n in range(1, count + 1)]
+    with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        if keystore:
+            lines = pool.map(_keystore_line, user_ids, [out_dir] * count, [key_size] * count, [scheme] * count,
+                             chunksize=64)
+            with open(keystore, "w") as f:
+                f.writelines(lines)
+        else:
+            for _ in pool.map(_generate_files, user_ids, [out_dir] * count, [key_size] * count,
+                              [key_format] * count, [scheme] * count, chunksize=64):
+                pass
 
 if __name__ == '__main__':
-    generate_keys("user1")
-    generate_keys("user2")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate RSA-PSS or Ed25519 key pairs")
+    parser.add_argument("--bulk", type=int, default=0, help="generate this many users for testing")
+    parser.add_argument("--out-dir", default=".", help="directory for the key files")
+    parser.add_argument("--prefix", default="user", help="user id prefix in bulk mode")
+    parser.add_argument("--scheme", choices=tuple(SCHEMES), default=DEFAULT_SCHEME, help="signature scheme")
+    parser.add_argument("--key-size", type=int, default=2048, help="RSA key size")
+    parser.add_argument("--format", choices=("pem", "der"), default="pem", help="public key file format")
+    parser.add_argument("--keystore", default=None, help="write public keys to a single keystore file")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    if args.bulk:
+        generate_bulk(args.bulk, args.out_dir, args.prefix, args.key_size, args.format, args.keystore, args.workers,
+                      args.scheme)
+    else:
+        generate_keys("user1", scheme=args.scheme)
+        generate_keys("user2", scheme=args.scheme)
\ No newline at end of file
@@ -0,0 +1,53 @@
+import bisect
+import hashlib
+import re
+
+# ID транзакции шарда: s<номер шарда>-txn_<значение IdAllocator>
+_SHARD_PREFIX = re.compile(r"^s(\d+)-")
+
+
+class HashRing:
+    """
+    Консистентное хэширование ключей (счетов, колонок) по шардам.
+    У каждого шарда несколько виртуальных точек на кольце, поэтому ключи
+    распределяются равномерно, а при изменении числа шардов переезжает только их часть.
+    """
+
+    def __init__(self, shards, replicas=64):
+        """
+        :param shards: Количество шардов.
+        :param replicas: Виртуальных точек на шард.
+        """
+        self.shards = shards
+        points = sorted(
+            (self._hash(f"shard-{shard}#{replica}"), shard)
+            for shard in range(shards) for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        # Хэш должен совпадать во всех процессах, поэтому встроенный hash() не подходит
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard_for(self, key):
+        """
+        :return: Номер шарда, которому принадлежит ключ.
+        """
+        if self.shards == 1:
+            return 0
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+def shard_prefix(shard):
+    return f"s{shard}-"
+
+
+def shard_of_transaction(transaction_id):
+    """
+    :return: Номер шарда из ID транзакции или None, если ID без префикса шарда.
+    """
+    match = _SHARD_PREFIX.match(transaction_id)
+    return int(match.group(1)) if match else None
@@ -0,0 +1,82 @@
+import itertools
+import threading
+import time
+
+# Раскладка 64-битного значения ID: миллисекунды от EPOCH_MS, счетчик внутри миллисекунды, номер воркера
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+SEQUENCE_BITS = 13
+WORKER_BITS = 10
+MAX_WORKERS = 1 << WORKER_BITS
+_MILLISECOND = 1 << SEQUENCE_BITS
+
+
+class IdAllocator:
+    """
+    Генератор ID транзакций без блокировки на горячем пути.
+    Уникальность дает общий счетчик itertools.count (его next() атомарен под GIL),
+    время только сдвигает счетчик вперед: если счетчик отстал от монотонных часов больше
+    чем на миллисекунду, он переставляется на текущее время под редкой блокировкой.
+    Значение записывается в hex фиксированной ширины, поэтому ID одного префикса сортируются
+    как строки по времени выдачи, а номер воркера (процесса) в младших битах разводит ID разных процессов.
+    """
+
+    def __init__(self, worker_id=0, prefix="", clock_ns=time.monotonic_ns, wall_clock_ns=time.time_ns):
+        """
+        :param worker_id: Номер процесса (шарда), от 0 до MAX_WORKERS - 1.
+        :param prefix: Префикс ID (номер шарда для маршрутизации).
+        """
+        if not 0 <= worker_id < MAX_WORKERS:
+            raise ValueError(f"worker_id must be in [0, {MAX_WORKERS})")
+        self.prefix = f"{prefix}txn_"
+        self._template = self.prefix.replace("%", "%%") + "%016x"
+        self.worker_id = worker_id
+        self._clock_ns = clock_ns
+        # Стенные часы читаются один раз, дальше время идет по монотонным: перевод часов не ломает порядок
+        self._base_ms = wall_clock_ns() // 1_000_000 - EPOCH_MS - clock_ns() // 1_000_000
+        self._lock = threading.Lock()  # Только для перестановки счетчика
+        self._counter = itertools.count(self._tick())
+
+    def _tick(self):
+        return (self._base_ms + self._clock_ns() // 1_000_000) << SEQUENCE_BITS
+
+    def _resync(self, tick):
+        with self._lock:
+            value = next(self._counter)
+            # Потоки, взявшие старый счетчик до перестановки, получат из него не больше чем по одному значению,
+            # и все они меньше tick, пока потоков меньше 2**SEQUENCE_BITS
+            if value < tick - _MILLISECOND:
+                self._counter = itertools.count(tick + 1)
+                value = tick
+            return value
+
+    def advance_past(self, transaction_id):
+        """
+        Продолжение счетчика после ID, выданного до перезапуска: стенные часы могли отстать
+        от времени его выдачи (перевод часов, перенос на другой узел), и новые ID повторили бы выданные.
+        :param transaction_id: Восстановленный ID с префиксом этого генератора.
+        :return: False, если ID другого формата (например, номер строки из старого леджера).
+        """
+        digits = transaction_id[len(self.prefix):]
+        if not transaction_id.startswith(self.prefix) or len(digits) != 16:
+            return False
+        try:
+            value = int(digits, 16) >> WORKER_BITS
+        except ValueError:
+            return False
+        with self._lock:
+            self._counter = itertools.count(max(next(self._counter), value + 1))
+        return True
+
+    def next_id(self):
+        # Тело _tick() встроено: вызов метода заметен на фоне остальной работы
+        value = next(self._counter)
+        tick = (self._base_ms + self._clock_ns() // 1_000_000) << SEQUENCE_BITS
+        if value < tick - _MILLISECOND:
+            value = self._resync(tick)
+        return self._template % ((value << WORKER_BITS) | self.worker_id)
+
+    def take(self, count):
+        """
+        :return: Список из count новых ID.
+        """
+        return [self.next_id() for _ in range(count)]
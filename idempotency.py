@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent import futures
+
+DEFAULT_TTL = 600.0        # Сколько секунд помнить ответ на запрос с ключом идемпотентности
+DEFAULT_MAX_KEYS = 100000  # Максимум запомненных ключей
+
+
+class _Entry:
+    __slots__ = ("future", "fingerprint", "expires")
+
+    def __init__(self, fingerprint):
+        self.future = futures.Future()
+        self.fingerprint = fingerprint
+        self.expires = None  # Пока запрос выполняется, запись не устаревает
+
+
+class IdempotencyCache:
+    """
+    Ответы на запросы с ключом идемпотентности.
+    Первый запрос с ключом выполняется, повторы получают его ответ: пока он выполняется -
+    через ожидание общего Future, после - сразу из кэша до истечения TTL.
+    Неуспешные ответы отдаются ожидающим, но не запоминаются, чтобы повтор мог пройти.
+    Старые ключи вытесняются при превышении max_keys.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_keys=DEFAULT_MAX_KEYS, clock=time.monotonic):
+        """
+        :param ttl: Время хранения ответа (секунды).
+        :param max_keys: Максимум запомненных ключей.
+        """
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key, fingerprint):
+        """
+        Регистрация запроса с ключом.
+        :param fingerprint: Содержимое запроса; повтор с тем же ключом, но другим содержимым отклоняется.
+        :return: Кортеж (Future с ответом, True, если запрос должен выполнить вызывающий),
+                 или (None, False), если ключ уже занят запросом с другим содержимым.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    return None, False
+                self._entries.move_to_end(key)
+                return entry.future, False
+            entry = self._entries[key] = _Entry(fingerprint)
+            self._evict_locked()
+        return entry.future, True
+
+    def resolve(self, key, response, keep=True):
+        """
+        Ответ на запрос, зарегистрированный через claim.
+        :param keep: Запомнить ответ для повторов; иначе ключ освобождается.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if keep:
+                entry.expires = self._clock() + self.ttl
+            else:
+                del self._entries[key]
+        entry.future.set_result(response)
+
+    def _evict_locked(self):
+        # Вытесняются самые старые ключи; выполняющиеся запросы не трогаются, их ждут повторы
+        excess = len(self._entries) - self.max_keys
+        if excess <= 0:
+            return
+        victims = []
+        for key, entry in self._entries.items():
+            if len(victims) >= excess:
+                break
+            if entry.expires is not None:
+                victims.append(key)
+        for key in victims:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,203 @@
+import base64
+import logging
+import os
+import threading
+
+from lru import LRUCache
+
+logger = logging.getLogger("payment.keys")
+
+# Суффиксы файлов открытых ключей в каталоге: <user_id>_public.pem / <user_id>_public.der
+# и функции разбора из cryptography.hazmat.primitives.serialization; cryptography
+# загружается при разборе первого ключа, а не при импорте
+KEY_SUFFIXES = (("_public.pem", "load_pem_public_key"),
+                ("_public.der", "load_der_public_key"))
+
+
+class KeyRegistry:
+    """
+    Реестр открытых ключей плательщиков.
+    Ключи ищутся по имени файла и разбираются только при первом обращении,
+    разобранные объекты держатся в LRU-кэше вместе с mtime и размером файла. Фоновый поток
+    сверяет их для закэшированных ключей и следит за файлом хранилища ключей, сбрасывая кэш
+    для измененных (в том числе перезаписанных на месте) и отозванных ключей.
+    """
+
+    def __init__(self, key_dir=".", keystore=None, cache_size=10000, reload_interval=2.0):
+        """
+        :param key_dir: Каталог с файлами <user_id>_public.pem или <user_id>_public.der.
+        :param keystore: Файл хранилища ключей: строки "<user_id> <DER в base64>".
+        :param cache_size: Сколько разобранных ключей держать в памяти.
+        :param reload_interval: Период проверки изменений в секундах (0 отключает наблюдение).
+        """
+        self.key_dir = key_dir
+        self.keystore = keystore
+        self._cache = LRUCache(cache_size)  # user_id -> (ключ, (путь, mtime, размер) или None для хранилища)
+        self._pinned = {}            # Ключи, зарегистрированные напрямую в памяти
+        self._keystore_index = None  # user_id -> смещение строки в хранилище, строится при первом обращении
+        self._keystore_mtime = None
+        self._index_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        if reload_interval:
+            self._watcher = threading.Thread(target=self._watch, args=(reload_interval,),
+                                             name="key-registry", daemon=True)
+            self._watcher.start()
+
+    def register(self, user_id, public_key):
+        """
+        Регистрация уже разобранного ключа (не зависит от файлов).
+        """
+        self._pinned[user_id] = public_key
+
+    def get(self, user_id):
+        """
+        Открытый ключ пользователя.
+        :return: Объект ключа или None, если ключ не найден или отозван.
+        """
+        public_key = self._pinned.get(user_id)
+        if public_key is not None:
+            return public_key
+        entry = self._cache.get(user_id)
+        if entry is None:
+            entry = self._load(user_id)
+            if entry is None:
+                return None
+            self._cache.put(user_id, entry)
+        return entry[0]
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def _load(self, user_id):
+        # Кортеж (ключ, отметка файла) или None; user_id приходит из сети, поэтому в путь попадают только простые имена
+        if not user_id or os.path.basename(user_id) != user_id or user_id in (".", ".."):
+            return None
+        from cryptography.exceptions import UnsupportedAlgorithm
+        if self.keystore:
+            try:
+                public_key = self._load_from_keystore(user_id)
+            except (ValueError, UnsupportedAlgorithm) as e:
+                # Испорченная строка хранилища - неизвестный пользователь, а не ошибка вызова
+                logger.warning("Invalid keystore entry for %s: %s", user_id, e)
+                return None
+            if public_key is not None:
+                return public_key, None
+        from cryptography.hazmat.primitives import serialization
+        for suffix, loader in KEY_SUFFIXES:
+            path = os.path.join(self.key_dir, f"{user_id}{suffix}")
+            try:
+                with open(path, "rb") as key_file:
+                    data = key_file.read()
+                    stat = os.fstat(key_file.fileno())
+                return getattr(serialization, loader)(data), (path, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue
+            except (ValueError, UnsupportedAlgorithm) as e:
+                logger.warning("Invalid public key for %s: %s", user_id, e)
+                return None
+        return None
+
+    def _build_keystore_index(self):
+        # В индексе только имя и смещение строки, ключи разбираются при обращении
+        index = {}
+        try:
+            mtime = os.stat(self.keystore).st_mtime_ns
+            with open(self.keystore, "rb") as f:
+                offset = 0
+                for line in f:
+                    user_id, _, _ = line.partition(b" ")
+                    if user_id.strip():
+                        try:
+                            index[user_id.decode()] = offset
+                        except UnicodeDecodeError:
+                            logger.warning("Invalid keystore user ID at offset %d", offset)
+                    offset += len(line)
+        except FileNotFoundError:
+            mtime = None
+        self._keystore_index = index
+        self._keystore_mtime = mtime
+
+    def _read_keystore_entry(self, user_id):
+        """
+        :return: Ключ в base64 по смещению из индекса; None, если пользователя нет в индексе;
+            False, если по смещению строка другого пользователя (хранилище перезаписано после построения индекса).
+        """
+        with self._index_lock:
+            if self._keystore_index is None:
+                self._build_keystore_index()
+            offset = self._keystore_index.get(user_id)
+        if offset is None:
+            return None
+        try:
+            with open(self.keystore, "rb") as f:
+                f.seek(offset)
+                line = f.readline()
+        except FileNotFoundError:
+            return False
+        found, _, encoded = line.partition(b" ")
+        if found != user_id.encode():
+            return False
+        return encoded.strip()
+
+    def _load_from_keystore(self, user_id):
+        encoded = self._read_keystore_entry(user_id)
+        if encoded is False:
+            # Наблюдатель еще не заметил перезапись: индекс перестраивается сразу, а не по его периоду
+            self._reload_keystore()
+            encoded = self._read_keystore_entry(user_id)
+        if not encoded:
+            return None
+        from cryptography.hazmat.primitives import serialization
+        # binascii.Error испорченного base64 - подкласс ValueError, как и ошибки разбора DER
+        return serialization.load_der_public_key(base64.b64decode(encoded, validate=True))
+
+    def _reload_keystore(self):
+        # Кэш сбрасывается вместе с индексом: разобранные ключи могли быть прочитаны из прежнего файла
+        with self._index_lock:
+            self._build_keystore_index()
+        self._cache.clear()
+        logger.info("Keystore reloaded: %d keys", len(self._keystore_index))
+
+    def reload(self):
+        """
+        Одна проверка изменений: сброс кэша для измененных и удаленных ключей.
+        """
+        # mtime каталога не меняется при перезаписи файла на месте, поэтому сверяется каждый файл из кэша
+        for user_id, (_, stamp) in self._cache.items():
+            if stamp is None:
+                continue
+            path, mtime, size = stamp
+            try:
+                stat = os.stat(path)
+                changed = (stat.st_mtime_ns, stat.st_size) != (mtime, size)
+            except FileNotFoundError:
+                changed = True
+            if changed:
+                self._cache.pop(user_id)
+                logger.info("Public key changed or revoked: %s", user_id)
+
+        if self.keystore and self._keystore_index is not None:
+            try:
+                mtime = os.stat(self.keystore).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._keystore_mtime:
+                self._reload_keystore()
+
+    def _watch(self, interval):
+        # Индекс хранилища строится сразу в фоне, чтобы первый запрос не ждал чтения всего файла
+        if self.keystore:
+            with self._index_lock:
+                if self._keystore_index is None:
+                    self._build_keystore_index()
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except OSError as e:
+                logger.warning("Key registry reload failed: %s", e)
+
+    def close(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
@@ -0,0 +1,387 @@
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+
+# Кадр записи: длина и CRC32 полезной нагрузки, затем сама нагрузка
+FRAME_HEADER = struct.Struct("<II")
+# Флаг в поле длины: нагрузка - пачка вложенных кадров, которая восстанавливается целиком или никак
+BATCH_FLAG = 1 << 31
+AMOUNT = struct.Struct("<d")
+FIELD_LENGTH = struct.Struct("<H")
+
+# Версия 2 хранит строки с префиксом длины, версия 1 - через перевод строки (только для чтения старых снимков)
+SNAPSHOT_MAGIC = b"LSNP2\n"
+LEGACY_SNAPSHOT_MAGIC = b"LSNP1\n"
+SEGMENT_PATTERN = re.compile(r"^wal-(\d{8})\.log$")
+SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d{8})\.bin$")
+
+
+def encode_record(transaction_id, sender_id, receiver_id, amount, signature):
+    """
+    Кодирование транзакции в кадр журнала.
+    """
+    parts = [AMOUNT.pack(amount)]
+    for field in (transaction_id.encode(), sender_id.encode(), receiver_id.encode(), signature):
+        parts.append(FIELD_LENGTH.pack(len(field)))
+        parts.append(field)
+    payload = b"".join(parts)
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_batch(frames):
+    """
+    Объединение кадров в один кадр пачки: одна CRC на все записи,
+    поэтому оборванная на середине пачка отрезается при чтении целиком.
+    """
+    payload = b"".join(frames)
+    return FRAME_HEADER.pack(len(payload) | BATCH_FLAG, zlib.crc32(payload)) + payload
+
+
+def decode_payload(payload):
+    """
+    Обратное преобразование полезной нагрузки кадра.
+    :return: Кортеж (transaction_id, sender_id, receiver_id, amount, signature).
+    """
+    amount, = AMOUNT.unpack_from(payload, 0)
+    offset = AMOUNT.size
+    fields = []
+    for _ in range(4):
+        length, = FIELD_LENGTH.unpack_from(payload, offset)
+        offset += FIELD_LENGTH.size
+        fields.append(payload[offset:offset + length])
+        offset += length
+    transaction_id, sender_id, receiver_id, signature = fields
+    return transaction_id.decode(), sender_id.decode(), receiver_id.decode(), amount, signature
+
+
+def read_segment(path):
+    """
+    Чтение сегмента журнала через mmap.
+    Оборванный или поврежденный хвост (после сбоя) отрезается.
+    :return: Генератор записей.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    offset = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        while offset + FRAME_HEADER.size <= size:
+            length, crc = FRAME_HEADER.unpack_from(data, offset)
+            batch = length & BATCH_FLAG
+            length &= ~BATCH_FLAG
+            start = offset + FRAME_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            if batch:
+                yield from _decode_batch(payload)
+            else:
+                yield decode_payload(payload)
+            offset = start + length
+    if offset < size:
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+            os.fsync(f.fileno())
+
+
+def _decode_batch(payload):
+    # Целостность вложенных кадров уже проверена CRC всей пачки
+    offset = 0
+    while offset < len(payload):
+        length, _ = FRAME_HEADER.unpack_from(payload, offset)
+        offset += FRAME_HEADER.size
+        yield decode_payload(payload[offset:offset + length])
+        offset += length
+
+
+class CommitGroup:
+    """
+    Группа записей, которые попадут на диск одним fsync.
+    """
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self):
+        """
+        Ожидание, пока записи группы не станут durable.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class LedgerLog:
+    """
+    Журнал транзакций только на дозапись: сегменты из кадров с префиксом длины,
+    групповой коммит (один fsync на много транзакций) и периодические снимки.
+    """
+
+    def __init__(self, data_dir, fsync_batch_size=256, commit_delay=0.002, snapshot_interval=1_000_000):
+        """
+        :param data_dir: Каталог с сегментами журнала и снимками.
+        :param fsync_batch_size: Сколько записей накопить, чтобы сбросить группу без ожидания.
+        :param commit_delay: Максимальное ожидание попутных записей перед fsync (секунды).
+        :param snapshot_interval: Делать снимок каждые N транзакций (0 отключает снимки).
+        """
+        self.data_dir = data_dir
+        self.fsync_batch_size = fsync_batch_size
+        self.commit_delay = commit_delay
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(data_dir, exist_ok=True)
+        self._cond = threading.Condition()
+        self._pending = []            # Кадры, ожидающие записи, и номера сегментов для переключения
+        self._group = CommitGroup()   # Группа, в которую попадут новые записи
+        self._next_segment = None     # Номер следующего сегмента
+        self._file = None
+        self._closed = False
+        self._failed = None           # Ошибка записи: после нее журнал больше ничего не пишет
+        self._snapshot_lock = threading.Lock()
+        self._writer = None
+
+    def _path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def _list(self, pattern):
+        found = []
+        for name in os.listdir(self.data_dir):
+            match = pattern.match(name)
+            if match:
+                found.append((int(match.group(1)), name))
+        return sorted(found)
+
+    def recover(self, store):
+        """
+        Восстановление хранилища: последний снимок плюс сегменты журнала после него.
+        После восстановления журнал открывается для записи в новом сегменте.
+        :return: Количество восстановленных транзакций.
+        """
+        snapshot_segment = 0
+        snapshots = self._list(SNAPSHOT_PATTERN)
+        if snapshots:
+            snapshot_segment, name = snapshots[-1]
+            self._load_snapshot(store, self._path(name))
+
+        last_segment = snapshot_segment
+        for segment, name in self._list(SEGMENT_PATTERN):
+            last_segment = max(last_segment, segment)
+            if segment < snapshot_segment:
+                continue
+            for record in read_segment(self._path(name)):
+                store.restore(*record)
+        store.resume_ids()
+
+        self._open_segment(last_segment + 1)
+        self._writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+        self._writer.start()
+        return len(store)
+
+    def _open_segment(self, segment):
+        if self._file is not None:
+            self._file.close()
+        self._next_segment = max(self._next_segment or 0, segment + 1)
+        self._file = open(self._path(f"wal-{segment:08d}.log"), "ab", buffering=0)
+        self._fsync_dir()
+
+    def _fsync_dir(self):
+        fd = os.open(self.data_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def submit(self, frame):
+        """
+        Постановка кадра в очередь записи. Вызывается под блокировкой хранилища,
+        поэтому порядок в журнале совпадает с порядком строк хранилища.
+        :return: CommitGroup, которую нужно дождаться вне блокировки.
+        :raises Exception: Ошибка прошлой записи: журнал остановлен, новые кадры не принимаются.
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("LedgerLog is closed")
+            if self._failed is not None:
+                raise self._failed
+            self._pending.append(frame)
+            group = self._group
+            if len(self._pending) == 1 or len(self._pending) >= self.fsync_batch_size:
+                self._cond.notify()
+            return group
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                # Ждем попутные записи, пока группа не наберется или не истечет задержка
+                if self.commit_delay and len(self._pending) < self.fsync_batch_size:
+                    deadline = time.monotonic() + self.commit_delay
+                    while len(self._pending) < self.fsync_batch_size and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                frames, self._pending = self._pending, []
+                group, self._group = self._group, CommitGroup()
+
+            # После ошибки записи следующие группы не пишутся: иначе в журнале после
+            # отброшенных записей оказались бы более поздние, и порядок строк бы разошелся
+            if self._failed is not None:
+                group.error = self._failed
+                group.done.set()
+                continue
+            try:
+                chunk = []
+                for item in frames:
+                    if isinstance(item, int):
+                        # Кадры до переключения остаются в старом сегменте
+                        self._flush(chunk)
+                        chunk = []
+                        self._open_segment(item)
+                    else:
+                        chunk.append(item)
+                self._flush(chunk)
+            except Exception as e:
+                self._failed = e
+                group.error = e
+            group.done.set()
+
+    def _flush(self, frames):
+        if frames:
+            offset = self._file.tell()
+            try:
+                self._file.write(b"".join(frames))
+                os.fsync(self._file.fileno())
+            except Exception:
+                # Отрезаем недописанную группу: клиенты получат отказ, и после перезапуска
+                # ее записи не должны восстановиться
+                try:
+                    self._file.truncate(offset)
+                except OSError:
+                    pass
+                raise
+
+    def rotate(self):
+        """
+        Переключение на новый сегмент. Все уже поставленные кадры остаются в текущем.
+        Вызывается под блокировкой хранилища.
+        :return: Номер нового сегмента.
+        """
+        with self._cond:
+            segment = self._next_segment
+            self._next_segment += 1
+            self._pending.append(segment)
+            self._cond.notify()
+            return segment
+
+    def maybe_snapshot(self, store, before, after):
+        """
+        Запуск снимка в фоне каждые snapshot_interval транзакций.
+        :param before: Размер хранилища до добавления.
+        :param after: Размер хранилища после добавления.
+        """
+        if self.snapshot_interval and before // self.snapshot_interval != after // self.snapshot_interval:
+            threading.Thread(target=self.snapshot, args=(store,), name="ledger-snapshot", daemon=True).start()
+
+    def snapshot(self, store):
+        """
+        Снимок хранилища. После записи снимка старые сегменты и снимки удаляются.
+        """
+        with self._snapshot_lock:
+            segment, columns = store.capture(self.rotate)
+            path = self._path(f"snapshot-{segment:08d}.bin")
+            self._write_snapshot(path + ".tmp", columns)
+            os.replace(path + ".tmp", path)
+            self._fsync_dir()
+            for old, name in self._list(SNAPSHOT_PATTERN) + self._list(SEGMENT_PATTERN):
+                if old < segment:
+                    os.remove(self._path(name))
+
+    @staticmethod
+    def _write_blob(f, blob):
+        f.write(struct.pack("<Q", len(blob)))
+        f.write(blob)
+
+    def _write_snapshot(self, path, columns):
+        ids, parties, senders, receivers, amounts, signatures = columns
+        with open(path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack("<QQ", len(ids), len(parties)))
+            # ID и счета задает клиент, они могут содержать любые символы, поэтому разделитель не подходит
+            self._write_blob(f, self._pack_strings(ids))
+            self._write_blob(f, self._pack_strings(parties))
+            for column in (senders, receivers, amounts):
+                column.tofile(f)
+            array("H", map(len, signatures)).tofile(f)
+            f.write(b"".join(signatures))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _pack_strings(strings):
+        parts = []
+        for value in strings:
+            data = value.encode()
+            parts.append(FIELD_LENGTH.pack(len(data)))
+            parts.append(data)
+        return b"".join(parts)
+
+    @staticmethod
+    def _unpack_strings(blob, count):
+        strings = []
+        offset = 0
+        for _ in range(count):
+            length, = FIELD_LENGTH.unpack_from(blob, offset)
+            offset += FIELD_LENGTH.size
+            strings.append(blob[offset:offset + length].decode())
+            offset += length
+        return strings
+
+    @staticmethod
+    def _read_blob(f):
+        length, = struct.unpack("<Q", f.read(8))
+        return f.read(length)
+
+    def _load_snapshot(self, store, path):
+        with open(path, "rb") as f:
+            magic = f.read(len(SNAPSHOT_MAGIC))
+            if magic not in (SNAPSHOT_MAGIC, LEGACY_SNAPSHOT_MAGIC):
+                raise ValueError(f"Invalid ledger snapshot: {path}")
+            count, party_count = struct.unpack("<QQ", f.read(16))
+            if magic == SNAPSHOT_MAGIC:
+                ids = self._unpack_strings(self._read_blob(f), count)
+                parties = self._unpack_strings(self._read_blob(f), party_count)
+            else:
+                ids = self._read_blob(f).decode().split("\n")[:count]
+                parties = self._read_blob(f).decode().split("\n")[:party_count]
+            senders, receivers, amounts, lengths = array("I"), array("I"), array("d"), array("H")
+            for column in (senders, receivers, amounts, lengths):
+                column.fromfile(f, count)
+            data = f.read()
+        signatures = []
+        offset = 0
+        for length in lengths:
+            signatures.append(data[offset:offset + length])
+            offset += length
+        store.load(ids, parties, senders, receivers, amounts, signatures)
+
+    def close(self):
+        """
+        Сброс оставшихся записей и остановка фонового писателя.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._writer is not None:
+            self._writer.join()
+        if self._file is not None:
+            self._file.close()
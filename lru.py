@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Ограниченный потокобезопасный LRU-кэш.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def items(self):
+        """
+        :return: Снимок пар (ключ, значение) от старых к новым.
+        """
+        with self._lock:
+            return list(self._entries.items())
+
+    def pop(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,111 @@
+import math
+import time
+
+DEFAULT_TICK = 0.05  # Период опроса счетчика колонки (секунды)
+
+
+class MonotonicTicker:
+    """
+    Планировщик тиков по сетке монотонных часов.
+    Задержка одного шага не сдвигает следующие, пропущенные тики не догоняются пачкой.
+    """
+
+    def __init__(self, interval=DEFAULT_TICK, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next = clock()
+
+    def wait(self):
+        """
+        Ожидание следующего тика.
+        :return: Текущее время по монотонным часам.
+        """
+        self._next += self.interval
+        now = self._clock()
+        if self._next > now:
+            self._sleep(self._next - now)
+            return self._clock()
+        # Отставание: следующий тик переносится на ближайшую точку сетки впереди
+        self._next += math.ceil((now - self._next) / self.interval) * self.interval
+        return now
+
+
+class AdaptiveMeter:
+    """
+    Нарезка выданного топлива на кадры оплаты.
+    Размер кадра растет с расходом и временем ответа сервера, поэтому при большом расходе
+    уходит меньше вызовов на литр. При малом расходе кадр отправляется не позже
+    max_billing_lag после первого неоплаченного литра. Пока в полете max_in_flight кадров,
+    новые литры копятся и уходят одним кадром.
+    Время передается явно, поэтому та же логика работает в симуляции.
+    """
+
+    def __init__(self, tick=DEFAULT_TICK, min_frame_liters=0.3, max_billing_lag=1.0, rtt_multiple=4,
+                 max_in_flight=4, smoothing=0.2):
+        """
+        :param tick: Период опроса счетчика (секунды).
+        :param min_frame_liters: Минимальный размер кадра при нормальном расходе.
+        :param max_billing_lag: Максимальное время от выдачи литра до отправки его кадра (секунды).
+        :param rtt_multiple: Во сколько раз интервал между кадрами больше времени ответа.
+        :param max_in_flight: Максимум кадров без подтверждения.
+        :param smoothing: Вес нового замера в скользящих средних расхода и времени ответа.
+        """
+        self.tick = tick
+        self.min_frame_liters = min_frame_liters
+        self.max_billing_lag = max_billing_lag
+        self.rtt_multiple = rtt_multiple
+        self.max_in_flight = max_in_flight
+        self.smoothing = smoothing
+        self.flow_rate = 0.0        # Оценка расхода (литров в секунду)
+        self.rtt = 0.0              # Оценка времени ответа (секунды)
+        self.pending_liters = 0.0   # Выдано, но еще не отправлено
+        self._unbilled_since = None
+        self._last_reading = None
+
+    def observe_rtt(self, rtt):
+        self.rtt = rtt if not self.rtt else self.rtt + self.smoothing * (rtt - self.rtt)
+
+    def add(self, liters, now):
+        """
+        Учет литров, выданных с прошлого замера.
+        """
+        if self._last_reading is not None and now > self._last_reading:
+            rate = liters / (now - self._last_reading)
+            self.flow_rate += self.smoothing * (rate - self.flow_rate)
+        self._last_reading = now
+        if liters > 0:
+            if self._unbilled_since is None:
+                self._unbilled_since = now
+            self.pending_liters += liters
+
+    def frame_interval(self):
+        """
+        Желаемый интервал между кадрами: несколько времен ответа, но не больше допустимой задержки оплаты.
+        """
+        return min(max(self.tick, self.rtt * self.rtt_multiple), self.max_billing_lag)
+
+    def target_liters(self):
+        return max(self.min_frame_liters, self.flow_rate * self.frame_interval())
+
+    def take_frame(self, now, in_flight=0):
+        """
+        Решение об отправке кадра.
+        :param in_flight: Кадров отправлено и еще не подтверждено.
+        :return: Литры для кадра или 0, если кадр пока не отправляется.
+        """
+        if self.pending_liters <= 0 or in_flight >= self.max_in_flight:
+            return 0
+        if (self.pending_liters < self.target_liters()
+                and now - self._unbilled_since < self.max_billing_lag):
+            return 0
+        return self.drain()
+
+    def drain(self):
+        """
+        Все накопленные литры одним кадром (для завершения заправки).
+        """
+        liters = self.pending_liters
+        self.pending_liters = 0.0
+        self._unbilled_since = None
+        return liters
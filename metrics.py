@@ -0,0 +1,348 @@
+import bisect
+import threading
+import time
+
+import grpc
+
+# Границы корзин гистограмм задержки (секунды)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Sharded:
+    """
+    Основа метрик с шардами по потокам: каждый поток пишет только в свой список,
+    поэтому запись идет без блокировок, а при чтении шарды суммируются.
+    """
+
+    def __init__(self, width):
+        self._width = width
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()  # Только для регистрации нового шарда
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0] * self._width
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _totals(self):
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0] * self._width
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    @property
+    def value(self):
+        return self._totals()[0]
+
+
+class Gauge(Counter):
+    def dec(self, amount=1):
+        self._shard()[0] -= amount
+
+
+class Histogram(_Sharded):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Корзины, затем +Inf, сумма значений
+        super().__init__(len(self.buckets) + 2)
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """
+        :return: Кортеж (накопленные счетчики по корзинам включая +Inf, сумма, количество).
+        """
+        totals = self._totals()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1], running
+
+
+class Family:
+    """
+    Семейство метрик с одинаковыми метками, например по методу RPC.
+    """
+
+    def __init__(self, kind, name, help_text, label_names=(), factory=None):
+        self.kind = kind
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.label_names, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            if self.kind == "histogram":
+                cumulative, total, count = child.snapshot()
+                for bound, value in zip(child.buckets + ("+Inf",), cumulative):
+                    lines.append(f"{self.name}_bucket{self._label_text(values, [('le', bound)])} {value}")
+                lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+                lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+            else:
+                lines.append(f"{self.name}{self._label_text(values)} {child.value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = []
+
+    def _register(self, family):
+        self._families.append(family)
+        return family
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Family("counter", name, help_text, label_names, Counter))
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._register(Family("gauge", name, help_text, label_names, Gauge))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._register(Family("histogram", name, help_text, label_names, lambda: Histogram(buckets)))
+
+    def render(self):
+        """
+        Текст в формате Prometheus exposition.
+        """
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+RPC_LATENCY = REGISTRY.histogram("payment_rpc_duration_seconds", "Server RPC latency", ("method",))
+RPC_IN_FLIGHT = REGISTRY.gauge("payment_rpc_in_flight", "Server RPCs in flight", ("method",))
+RPC_ERRORS = REGISTRY.counter("payment_rpc_errors_total", "Server RPCs that raised or aborted", ("method",))
+CLIENT_RPC_LATENCY = REGISTRY.histogram("payment_client_rpc_duration_seconds", "Client RPC latency", ("method",))
+CLIENT_RPC_ERRORS = REGISTRY.counter("payment_client_rpc_errors_total", "Client RPCs that failed", ("method",))
+SIGNATURE_VERIFY_SECONDS = REGISTRY.histogram(
+    "payment_signature_verify_seconds", "Signature verification time").labels()
+LEDGER_APPEND_SECONDS = REGISTRY.histogram(
+    "payment_ledger_append_seconds", "Ledger append time including group commit").labels()
+IDEMPOTENT_REPLAYS = REGISTRY.counter(
+    "payment_idempotent_replays_total", "Retried transactions answered with the original result").labels()
+ADMISSION_REJECTED = REGISTRY.counter(
+    "payment_admission_rejected_total", "Calls shed by admission control", ("lane", "reason"))
+
+
+def _method_name(full_method):
+    return full_method.rsplit("/", 1)[-1]
+
+
+def _timed_unary(behavior, method):
+    latency, in_flight, errors = RPC_LATENCY.labels(method), RPC_IN_FLIGHT.labels(method), RPC_ERRORS.labels(method)
+
+    def wrapper(request, context):
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            return behavior(request, context)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+            in_flight.dec()
+    return wrapper
+
+
+def _timed_stream(behavior, method):
+    latency, in_flight, errors = RPC_LATENCY.labels(method), RPC_IN_FLIGHT.labels(method), RPC_ERRORS.labels(method)
+
+    def wrapper(request, context):
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            yield from behavior(request, context)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+            in_flight.dec()
+    return wrapper
+
+
+def _async_timed_unary(behavior, method):
+    latency, in_flight, errors = RPC_LATENCY.labels(method), RPC_IN_FLIGHT.labels(method), RPC_ERRORS.labels(method)
+
+    async def wrapper(request, context):
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            return await behavior(request, context)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+            in_flight.dec()
+    return wrapper
+
+
+def _async_timed_stream(behavior, method):
+    latency, in_flight, errors = RPC_LATENCY.labels(method), RPC_IN_FLIGHT.labels(method), RPC_ERRORS.labels(method)
+
+    async def wrapper(request, context):
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            async for response in behavior(request, context):
+                yield response
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+            in_flight.dec()
+    return wrapper
+
+
+def _wrap_handler(handler, method, unary, stream):
+    if handler is None:
+        return None
+    if handler.unary_unary:
+        return grpc.unary_unary_rpc_method_handler(
+            unary(handler.unary_unary, method), handler.request_deserializer, handler.response_serializer)
+    if handler.unary_stream:
+        return grpc.unary_stream_rpc_method_handler(
+            stream(handler.unary_stream, method), handler.request_deserializer, handler.response_serializer)
+    if handler.stream_unary:
+        return grpc.stream_unary_rpc_method_handler(
+            unary(handler.stream_unary, method), handler.request_deserializer, handler.response_serializer)
+    return grpc.stream_stream_rpc_method_handler(
+        stream(handler.stream_stream, method), handler.request_deserializer, handler.response_serializer)
+
+
+class ServerMetricsInterceptor(grpc.ServerInterceptor):
+    """
+    Перехватчик сервера: задержка по методам, вызовы в работе и ошибки.
+    """
+
+    def __init__(self):
+        self._handlers = {}  # Обернутые обработчики кэшируются по методу
+
+    def intercept_service(self, continuation, handler_call_details):
+        method = handler_call_details.method
+        wrapped = self._handlers.get(method)
+        if wrapped is None:
+            wrapped = _wrap_handler(continuation(handler_call_details), _method_name(method),
+                                    _timed_unary, _timed_stream)
+            self._handlers[method] = wrapped
+        return wrapped
+
+
+class AsyncServerMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """
+    То же для сервера grpc.aio.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    async def intercept_service(self, continuation, handler_call_details):
+        method = handler_call_details.method
+        wrapped = self._handlers.get(method)
+        if wrapped is None:
+            wrapped = _wrap_handler(await continuation(handler_call_details), _method_name(method),
+                                    _async_timed_unary, _async_timed_stream)
+            self._handlers[method] = wrapped
+        return wrapped
+
+
+class ClientMetricsInterceptor(grpc.UnaryUnaryClientInterceptor, grpc.StreamStreamClientInterceptor):
+    """
+    Перехватчик клиента: задержка вызовов по методам и ошибки.
+    """
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        method = _method_name(client_call_details.method)
+        start = time.perf_counter()
+        call = continuation(client_call_details, request)
+
+        def done(future):
+            CLIENT_RPC_LATENCY.labels(method).observe(time.perf_counter() - start)
+            if future.exception() is not None:
+                CLIENT_RPC_ERRORS.labels(method).inc()
+        call.add_done_callback(done)
+        return call
+
+    def intercept_stream_stream(self, continuation, client_call_details, request_iterator):
+        method = _method_name(client_call_details.method)
+        start = time.perf_counter()
+        call = continuation(client_call_details, request_iterator)
+        call.add_done_callback(lambda _: CLIENT_RPC_LATENCY.labels(method).observe(time.perf_counter() - start))
+        return call
+
+
+def _metrics_handler(registry):
+    # http.server нужен только с включенными метриками, поэтому импортируется при запуске эндпоинта
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    Запуск HTTP-эндпоинта /metrics в фоновом потоке.
+    :return: HTTP-сервер (для остановки вызвать shutdown()).
+    """
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, port), _metrics_handler(registry))
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
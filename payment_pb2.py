@@ -24,25 +24,49 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rpayment.proto\x12\x07payment\"_\n\x12TransactionRequest\x12\x11\n\tsender_id\x18\x01 \x01(\t\x12\x13\n\x0breceiver_id\x18\x02 \x01(\t\x12\x0e\n\x06\x61mount\x18\x03 \x01(\x01\x12\x11\n\tsignature\x18\x04 \x01(\x0c\">\n\x13TransactionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x16\n\x0etransaction_id\x18\x02 \x01(\t\"\'\n\rVerifyRequest\x12\x16\n\x0etransaction_id\x18\x01 \x01(\t\"2\n\x0eVerifyResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"W\n\x12\x46uelPaymentRequest\x12\x1c\n\x14\x66uel_price_per_liter\x18\x01 \x01(\x01\x12\x0e\n\x06liters\x18\x02 \x01(\x01\x12\x13\n\x0bis_finished\x18\x03 \x01(\x08\"7\n\x13\x46uelPaymentResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t2\xf7\x01\n\x0ePaymentService\x12N\n\x11\x43reateTransaction\x12\x1b.payment.TransactionRequest\x1a\x1c.payment.TransactionResponse\x12\x44\n\x11VerifyTransaction\x12\x16.payment.VerifyRequest\x1a\x17.payment.VerifyResponse\x12O\n\x12ProcessFuelPayment\x12\x1b.payment.FuelPaymentRequest\x1a\x1c.payment.FuelPaymentResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rpayment.proto\x12\x07payment\"\x91\x01\n\x12TransactionRequest\x12\x11\n\tsender_id\x18\x01 \x01(\t\x12\x13\n\x0breceiver_id\x18\x02 \x01(\t\x12\x0e\n\x06\x61mount\x18\x03 \x01(\x01\x12\x11\n\tsignature\x18\x04 \x01(\x0c\x12\x17\n\x0fidempotency_key\x18\x05 \x01(\t\x12\x17\n\x0fpayload_version\x18\x06 \x01(\r\">\n\x13TransactionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x16\n\x0etransaction_id\x18\x02 \x01(\t\"L\n\x17TransactionBatchRequest\x12\x31\n\x0ctransactions\x18\x01 \x03(\x0b\x32\x1b.payment.TransactionRequest\"I\n\x18TransactionBatchResponse\x12-\n\x07results\x18\x01 \x03(\x0b\x32\x1c.payment.TransactionResponse\"\'\n\rVerifyRequest\x12\x16\n\x0etransaction_id\x18\x01 \x01(\t\"2\n\x0eVerifyResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xa5\x01\n\x12\x46uelPaymentRequest\x12\x1c\n\x14\x66uel_price_per_liter\x18\x01 \x01(\x01\x12\x0e\n\x06liters\x18\x02 \x01(\x01\x12\x13\n\x0bis_finished\x18\x03 \x01(\x08\x12\x12\n\nsession_id\x18\x04 \x01(\t\x12\x12\n\naccount_id\x18\x05 \x01(\t\x12\x11\n\topened_at\x18\x06 \x01(\x04\x12\x11\n\tsignature\x18\x07 \x01(\x0c\"7\n\x13\x46uelPaymentResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xae\x01\n\tFuelFrame\x12\x12\n\nsession_id\x18\x01 \x01(\t\x12\x10\n\x08sequence\x18\x02 \x01(\x04\x12\x1c\n\x14\x66uel_price_per_liter\x18\x03 \x01(\x01\x12\x0e\n\x06liters\x18\x04 \x01(\x01\x12\x13\n\x0bis_finished\x18\x05 \x01(\x08\x12\x12\n\naccount_id\x18\x06 \x01(\t\x12\x11\n\topened_at\x18\x07 \x01(\x04\x12\x11\n\tsignature\x18\x08 \x01(\x0c\"}\n\x07\x46uelAck\x12\x12\n\nsession_id\x18\x01 \x01(\t\x12\x10\n\x08sequence\x18\x02 \x01(\x04\x12\x0f\n\x07success\x18\x03 \x01(\x08\x12\x0f\n\x07message\x18\x04 \x01(\t\x12\x16\n\x0ehold_remaining\x18\x05 \x01(\x01\x12\x12\n\ntotal_cost\x18\x06 \x01(\x01\"q\n\rCreditRequest\x12\x16\n\x0etransaction_id\x18\x01 \x01(\t\x12\x11\n\tsender_id\x18\x02 \x01(\t\x12\x13\n\x0breceiver_id\x18\x03 \x01(\t\x12\x0e\n\x06\x61mount\x18\x04 \x01(\x01\x12\x10\n\x08peer_mac\x18\x05 \x01(\x0c\"!\n\x0e\x43reditResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x95\x01\n\x17ListTransactionsRequest\x12\x11\n\tsender_id\x18\x01 \x01(\t\x12\x13\n\x0breceiver_id\x18\x02 \x01(\t\x12\x10\n\x08start_id\x18\x03 \x01(\t\x12\x0e\n\x06\x65nd_id\x18\x04 \x01(\t\x12\x0e\n\x06\x63ursor\x18\x05 \x01(\t\x12\x11\n\tpage_size\x18\x06 \x01(\r\x12\r\n\x05limit\x18\x07 \x01(\r\"v\n\x11LedgerTransaction\x12\x16\n\x0etransaction_id\x18\x01 \x01(\t\x12\x11\n\tsender_id\x18\x02 \x01(\t\x12\x13\n\x0breceiver_id\x18\x03 \x01(\t\x12\x0e\n\x06\x61mount\x18\x04 \x01(\x01\x12\x11\n\tsignature\x18\x05 \x01(\x0c\"S\n\x0fTransactionPage\x12\x30\n\x0ctransactions\x18\x01 \x03(\x0b\x32\x1a.payment.LedgerTransaction\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\t\"R\n\x18\x41\x63\x63ountAggregatesRequest\x12\x13\n\x0b\x61\x63\x63ount_ids\x18\x01 \x03(\t\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\t\x12\x11\n\tpage_size\x18\x03 \x01(\r\"~\n\x10\x41\x63\x63ountAggregate\x12\x12\n\naccount_id\x18\x01 \x01(\t\x12\x12\n\nsent_total\x18\x02 \x01(\x01\x12\x12\n\nsent_count\x18\x03 \x01(\x04\x12\x16\n\x0ereceived_total\x18\x04 \x01(\x01\x12\x16\n\x0ereceived_count\x18\x05 \x01(\x04\"V\n\x15\x41\x63\x63ountAggregatesPage\x12-\n\naggregates\x18\x01 \x03(\x0b\x32\x19.payment.AccountAggregate\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\t2\x80\x05\n\x0ePaymentService\x12N\n\x11\x43reateTransaction\x12\x1b.payment.TransactionRequest\x1a\x1c.payment.TransactionResponse\x12]\n\x16\x43reateTransactionBatch\x12 .payment.TransactionBatchRequest\x1a!.payment.TransactionBatchResponse\x12\x44\n\x11VerifyTransaction\x12\x16.payment.VerifyRequest\x1a\x17.payment.VerifyResponse\x12O\n\x12ProcessFuelPayment\x12\x1b.payment.FuelPaymentRequest\x1a\x1c.payment.FuelPaymentResponse\x12\x37\n\x0b\x46uelSession\x12\x12.payment.FuelFrame\x1a\x10.payment.FuelAck(\x01\x30\x01\x12@\n\rCreditAccount\x12\x16.payment.CreditRequest\x1a\x17.payment.CreditResponse\x12P\n\x10ListTransactions\x12 .payment.ListTransactionsRequest\x1a\x18.payment.TransactionPage0\x01\x12[\n\x14GetAccountAggregates\x12!.payment.AccountAggregatesRequest\x1a\x1e.payment.AccountAggregatesPage0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'payment_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_TRANSACTIONREQUEST']._serialized_start=26
-  _globals['_TRANSACTIONREQUEST']._serialized_end=121
-  _globals['_TRANSACTIONRESPONSE']._serialized_start=123
-  _globals['_TRANSACTIONRESPONSE']._serialized_end=185
-  _globals['_VERIFYREQUEST']._serialized_start=187
-  _globals['_VERIFYREQUEST']._serialized_end=226
-  _globals['_VERIFYRESPONSE']._serialized_start=228
-  _globals['_VERIFYRESPONSE']._serialized_end=278
-  _globals['_FUELPAYMENTREQUEST']._serialized_start=280
-  _globals['_FUELPAYMENTREQUEST']._serialized_end=367
-  _globals['_FUELPAYMENTRESPONSE']._serialized_start=369
-  _globals['_FUELPAYMENTRESPONSE']._serialized_end=424
-  _globals['_PAYMENTSERVICE']._serialized_start=427
-  _globals['_PAYMENTSERVICE']._serialized_end=674
+  _globals['_TRANSACTIONREQUEST']._serialized_start=27
+  _globals['_TRANSACTIONREQUEST']._serialized_end=172
+  _globals['_TRANSACTIONRESPONSE']._serialized_start=174
+  _globals['_TRANSACTIONRESPONSE']._serialized_end=236
+  _globals['_TRANSACTIONBATCHREQUEST']._serialized_start=238
+  _globals['_TRANSACTIONBATCHREQUEST']._serialized_end=314
+  _globals['_TRANSACTIONBATCHRESPONSE']._serialized_start=316
+  _globals['_TRANSACTIONBATCHRESPONSE']._serialized_end=389
+  _globals['_VERIFYREQUEST']._serialized_start=391
+  _globals['_VERIFYREQUEST']._serialized_end=430
+  _globals['_VERIFYRESPONSE']._serialized_start=432
+  _globals['_VERIFYRESPONSE']._serialized_end=482
+  _globals['_FUELPAYMENTREQUEST']._serialized_start=485
+  _globals['_FUELPAYMENTREQUEST']._serialized_end=650
+  _globals['_FUELPAYMENTRESPONSE']._serialized_start=652
+  _globals['_FUELPAYMENTRESPONSE']._serialized_end=707
+  _globals['_FUELFRAME']._serialized_start=710
+  _globals['_FUELFRAME']._serialized_end=884
+  _globals['_FUELACK']._serialized_start=886
+  _globals['_FUELACK']._serialized_end=1011
+  _globals['_CREDITREQUEST']._serialized_start=1013
+  _globals['_CREDITREQUEST']._serialized_end=1126
+  _globals['_CREDITRESPONSE']._serialized_start=1128
+  _globals['_CREDITRESPONSE']._serialized_end=1161
+  _globals['_LISTTRANSACTIONSREQUEST']._serialized_start=1164
+  _globals['_LISTTRANSACTIONSREQUEST']._serialized_end=1313
+  _globals['_LEDGERTRANSACTION']._serialized_start=1315
+  _globals['_LEDGERTRANSACTION']._serialized_end=1433
+  _globals['_TRANSACTIONPAGE']._serialized_start=1435
+  _globals['_TRANSACTIONPAGE']._serialized_end=1518
+  _globals['_ACCOUNTAGGREGATESREQUEST']._serialized_start=1520
+  _globals['_ACCOUNTAGGREGATESREQUEST']._serialized_end=1602
+  _globals['_ACCOUNTAGGREGATE']._serialized_start=1604
+  _globals['_ACCOUNTAGGREGATE']._serialized_end=1730
+  _globals['_ACCOUNTAGGREGATESPAGE']._serialized_start=1732
+  _globals['_ACCOUNTAGGREGATESPAGE']._serialized_end=1818
+  _globals['_PAYMENTSERVICE']._serialized_start=1821
+  _globals['_PAYMENTSERVICE']._serialized_end=2461
 # @@protoc_insertion_point(module_scope)
@@ -39,6 +39,11 @@ class PaymentServiceStub(object):
                 request_serializer=payment__pb2.TransactionRequest.SerializeToString,
                 response_deserializer=payment__pb2.TransactionResponse.FromString,
                 _registered_method=True)
+        self.CreateTransactionBatch = channel.unary_unary(
+                '/payment.PaymentService/CreateTransactionBatch',
+                request_serializer=payment__pb2.TransactionBatchRequest.SerializeToString,
+                response_deserializer=payment__pb2.TransactionBatchResponse.FromString,
+                _registered_method=True)
         self.VerifyTransaction = channel.unary_unary(
                 '/payment.PaymentService/VerifyTransaction',
                 request_serializer=payment__pb2.VerifyRequest.SerializeToString,
@@ -49,6 +54,26 @@ class PaymentServiceStub(object):
                 request_serializer=payment__pb2.FuelPaymentRequest.SerializeToString,
                 response_deserializer=payment__pb2.FuelPaymentResponse.FromString,
                 _registered_method=True)
+        self.FuelSession = channel.stream_stream(
+                '/payment.PaymentService/FuelSession',
+                request_serializer=payment__pb2.FuelFrame.SerializeToString,
+                response_deserializer=payment__pb2.FuelAck.FromString,
+                _registered_method=True)
+        self.CreditAccount = channel.unary_unary(
+                '/payment.PaymentService/CreditAccount',
+                request_serializer=payment__pb2.CreditRequest.SerializeToString,
+                response_deserializer=payment__pb2.CreditResponse.FromString,
+                _registered_method=True)
+        self.ListTransactions = channel.unary_stream(
+                '/payment.PaymentService/ListTransactions',
+                request_serializer=payment__pb2.ListTransactionsRequest.SerializeToString,
+                response_deserializer=payment__pb2.TransactionPage.FromString,
+                _registered_method=True)
+        self.GetAccountAggregates = channel.unary_stream(
+                '/payment.PaymentService/GetAccountAggregates',
+                request_serializer=payment__pb2.AccountAggregatesRequest.SerializeToString,
+                response_deserializer=payment__pb2.AccountAggregatesPage.FromString,
+                _registered_method=True)
 
 
 class PaymentServiceServicer(object):
@@ -60,6 +85,12 @@ class PaymentServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def CreateTransactionBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def VerifyTransaction(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -72,6 +103,34 @@ class PaymentServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def FuelSession(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CreditAccount(self, request, context):
+        """Зачисление получателю от шарда отправителя: шард отправителя доставляет переводы из своего леджера
+        (CreditOutbox) с повтором до успеха, шард получателя принимает только зачисления с верным peer_mac
+        и пропускает повторы по ID транзакции
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListTransactions(self, request, context):
+        """Чтение леджера для сверки: результаты идут страницами, курсор страницы продолжает чтение с места обрыва
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetAccountAggregates(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_PaymentServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -80,6 +139,11 @@ def add_PaymentServiceServicer_to_server(servicer, server):
                     request_deserializer=payment__pb2.TransactionRequest.FromString,
                     response_serializer=payment__pb2.TransactionResponse.SerializeToString,
             ),
+            'CreateTransactionBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.CreateTransactionBatch,
+                    request_deserializer=payment__pb2.TransactionBatchRequest.FromString,
+                    response_serializer=payment__pb2.TransactionBatchResponse.SerializeToString,
+            ),
             'VerifyTransaction': grpc.unary_unary_rpc_method_handler(
                     servicer.VerifyTransaction,
                     request_deserializer=payment__pb2.VerifyRequest.FromString,
@@ -90,6 +154,26 @@ def add_PaymentServiceServicer_to_server(servicer, server):
                     request_deserializer=payment__pb2.FuelPaymentRequest.FromString,
                     response_serializer=payment__pb2.FuelPaymentResponse.SerializeToString,
             ),
+            'FuelSession': grpc.stream_stream_rpc_method_handler(
+                    servicer.FuelSession,
+                    request_deserializer=payment__pb2.FuelFrame.FromString,
+                    response_serializer=payment__pb2.FuelAck.SerializeToString,
+            ),
+            'CreditAccount': grpc.unary_unary_rpc_method_handler(
+                    servicer.CreditAccount,
+                    request_deserializer=payment__pb2.CreditRequest.FromString,
+                    response_serializer=payment__pb2.CreditResponse.SerializeToString,
+            ),
+            'ListTransactions': grpc.unary_stream_rpc_method_handler(
+                    servicer.ListTransactions,
+                    request_deserializer=payment__pb2.ListTransactionsRequest.FromString,
+                    response_serializer=payment__pb2.TransactionPage.SerializeToString,
+            ),
+            'GetAccountAggregates': grpc.unary_stream_rpc_method_handler(
+                    servicer.GetAccountAggregates,
+                    request_deserializer=payment__pb2.AccountAggregatesRequest.FromString,
+                    response_serializer=payment__pb2.AccountAggregatesPage.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'payment.PaymentService', rpc_method_handlers)
@@ -128,6 +212,33 @@ class PaymentService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def CreateTransactionBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/payment.PaymentService/CreateTransactionBatch',
+            payment__pb2.TransactionBatchRequest.SerializeToString,
+            payment__pb2.TransactionBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def VerifyTransaction(request,
             target,
@@ -181,3 +292,111 @@ class PaymentService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def FuelSession(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/payment.PaymentService/FuelSession',
+            payment__pb2.FuelFrame.SerializeToString,
+            payment__pb2.FuelAck.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CreditAccount(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/payment.PaymentService/CreditAccount',
+            payment__pb2.CreditRequest.SerializeToString,
+            payment__pb2.CreditResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ListTransactions(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/payment.PaymentService/ListTransactions',
+            payment__pb2.ListTransactionsRequest.SerializeToString,
+            payment__pb2.TransactionPage.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetAccountAggregates(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/payment.PaymentService/GetAccountAggregates',
+            payment__pb2.AccountAggregatesRequest.SerializeToString,
+            payment__pb2.AccountAggregatesPage.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
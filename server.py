@@ -2,111 +2,767 @@ import grpc
 from concurrent import futures
 import payment_pb2
 import payment_pb2_grpc
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.backends import default_backend
+from transaction_store import TransactionStore
+from ledger_log import LedgerLog
+from structured_logging import setup_logging
+from metrics import IDEMPOTENT_REPLAYS, ServerMetricsInterceptor, start_metrics_server
+from signature_verifier import SignatureVerifier
+from fuel_sessions import (DEFAULT_HOLD_AMOUNT, DEFAULT_IDLE_TTL, DEFAULT_TOP_UP_THRESHOLD, FuelSessionManager,
+                           HoldError, ReplayedFrameError, SessionAuthError)
+from key_registry import KeyRegistry
+from balance_engine import BalanceEngine, from_minor, to_minor, valid_amount
+from hash_ring import HashRing, shard_prefix
+from credit_outbox import PEER_SECRET_ENV, CreditOutbox
+from id_allocator import IdAllocator
+from idempotency import DEFAULT_MAX_KEYS, DEFAULT_TTL, IdempotencyCache
+from admission import DEFAULT_FUEL_STREAM_WORKERS, AdmissionController, AdmissionInterceptor, default_lanes
+from signing import LEGACY_PAYLOAD_VERSION, PAYLOAD_VERSION, fuel_session_payload, signed_payload
+import argparse
+import logging
+import os
 import signal
 import sys
-from datetime import datetime
+import time
+
+DEFAULT_BIND_ADDRESS = '[::]:50051'
+
+DEFAULT_INITIAL_BALANCE = 1000.0  # Баланс нового счета в рублях
+FUEL_SESSION_WINDOW = 300.0  # Допустимое расхождение времени открытия сессии заправки с часами сервера, секунды
+FUEL_STATION_ID = "fuel-station"  # Счет АЗС, на который переводится оплата топлива
+
+DEFAULT_PAGE_SIZE = 1000  # Записей в странице потоковых выборок леджера
+MAX_PAGE_SIZE = 10000
+
+# Неизменяемые ответы создаются один раз и переиспользуются во всех вызовах
+TRANSACTION_FAILED = payment_pb2.TransactionResponse(success=False, transaction_id="")
+TRANSACTION_VERIFIED = payment_pb2.VerifyResponse(success=True, message="Transaction verified")
+TRANSACTION_NOT_FOUND = payment_pb2.VerifyResponse(success=False, message="Transaction not found")
+
+logger = logging.getLogger("payment.server")
+
+
+def decode_cursor(cursor):
+    """
+    Курсор выборки леджера - номер позиции, с которой она продолжается.
+    :return: Позиция; 0 для пустого курсора.
+    :raises ValueError: Если курсор не выдан сервером.
+    """
+    if not cursor:
+        return 0
+    if not cursor.isdigit():
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return int(cursor)
+
+
+def page_size(requested):
+    return min(requested or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
 
 class PaymentService(payment_pb2_grpc.PaymentServiceServicer):
-    def __init__(self):
-        self.transactions = []  # Локальный массив для хранения транзакций
-        self.users = {
-            "user1": self.get_public_key("user1"),
-            "user2": self.get_public_key("user2"),
-        }
-        self.hold_amount = 100  # Начальный холд в 100 рублей
-        self.used_amount = 0    # Использованная сумма
-        self.total_fuel_cost = 0  # Общая стоимость заправки
+    def __init__(self, verifier=None, ledger=None, keys=None, balances=None,
+                 initial_balance=DEFAULT_INITIAL_BALANCE, fuel_sessions=None, ring=None, shard_index=0,
+                 idempotency=None, min_payload_version=LEGACY_PAYLOAD_VERSION, peers=(), peer_secret=None):
+        """
+        :param ring: HashRing шардов, если сервис - один из процессов многопроцессного сервера.
+        :param shard_index: Номер этого шарда на кольце.
+        :param peers: Адреса всех шардов в порядке номеров: зачисления получателям с других шардов
+            доставляет и проверяет CreditOutbox.
+        :param peer_secret: Общий секрет шардов для подписи зачислений (байты).
+        :param idempotency: IdempotencyCache для запросов с ключом идемпотентности.
+        :param min_payload_version: Транзакции, подписанные более старой версией данных, отклоняются.
+        """
+        self.ring = ring
+        self.shard_index = shard_index
+        self.min_payload_version = min_payload_version
+        self.balances = balances if balances is not None else BalanceEngine()  # Балансы счетов в копейках
+        self.initial_balance = to_minor(initial_balance)
+        # Индексированное хранилище транзакций; ID шарда начинаются с его номера
+        self.transactions = TransactionStore(ledger, IdAllocator(shard_index,
+                                                                 shard_prefix(shard_index) if ring else ""))
+        if ledger is not None:
+            # Восстановление леджера из снимка и журнала перед приемом запросов
+            logger.info("Ledger recovered: %d transactions", ledger.recover(self.transactions))
+            self.replay_balances()
+        # Зачисления, записанные до перезапуска, но не доставленные, уходят первыми
+        self.credits = None
+        if ring is not None and peers:
+            self.credits = CreditOutbox(self.transactions, ring, shard_index, peers, peer_secret,
+                                        ledger.data_dir if ledger is not None else None)
+            self.credits.start()
+        self.verifier = verifier or SignatureVerifier()  # Пул проверки подписей с кэшем
+        self.keys = keys or KeyRegistry()  # Открытые ключи плательщиков, разбираются при первом обращении
+        # Холды по сессиям заправки на счетах плательщиков
+        if fuel_sessions is None:
+            fuel_sessions = FuelSessionManager(self.balances)
+        self.fuel_sessions = fuel_sessions
+        # Итог сессии заправки проводится по балансу только после записи в леджер
+        self.fuel_sessions.journal = self.journal_fuel
+        # Ответы на запросы с ключом идемпотентности: повтор проверяется, но не записывается заново
+        self.idempotency = idempotency if idempotency is not None else IdempotencyCache()
 
     def CreateTransaction(self, request, context):
-        public_key = self.users.get(request.sender_id)
+        # Проверка подписи транзакции
+        future = self.submit_verification(request)
+        if future is None:
+            return TRANSACTION_FAILED
+        try:
+            verified = future.result()
+        except Exception as e:
+            logger.warning("Transaction failed: %s", e)
+            return TRANSACTION_FAILED
+        if not verified:
+            logger.warning("Transaction failed: invalid signature", extra={"sender_id": request.sender_id})
+            return TRANSACTION_FAILED
+        original, first = self.claim_idempotency(request)
+        if not first:
+            return original.result() if original is not None else self.idempotency_conflict(request)
+        response = TRANSACTION_FAILED
+        try:
+            response = self.commit_transaction(request, verified)
+            return response
+        finally:
+            self.resolve_idempotency(request, response)
+
+    def claim_idempotency(self, request):
+        """
+        Регистрация запроса с ключом идемпотентности.
+        Вызывается только после проверки подписи: ключ подписан отправителем, и запрос без его подписи
+        не должен ни занимать ключ, ни получать ответ на запрос отправителя.
+        :return: Кортеж (Future с ответом первого запроса, True, если запрос выполняется впервые).
+                 Для запроса без ключа - (None, True), при конфликте содержимого - (None, False).
+        """
+        if not request.idempotency_key:
+            return None, True
+        # Ключи действуют в пределах отправителя; подпись в отпечаток не входит, PSS дает разные подписи
+        future, first = self.idempotency.claim((request.sender_id, request.idempotency_key),
+                                               (request.receiver_id, request.amount))
+        if not first and future is not None:
+            IDEMPOTENT_REPLAYS.inc()
+            logger.debug("Transaction retry: key=%s", request.idempotency_key,
+                         extra={"sender_id": request.sender_id})
+        return future, first
+
+    def resolve_idempotency(self, request, response):
+        # Запоминаются только успешные ответы, после отказа повтор выполняется заново
+        if request.idempotency_key:
+            self.idempotency.resolve((request.sender_id, request.idempotency_key), response,
+                                     keep=response.success)
+
+    @staticmethod
+    def idempotency_conflict(request):
+        logger.warning("Transaction failed: idempotency key reused for a different transaction",
+                       extra={"sender_id": request.sender_id})
+        return TRANSACTION_FAILED
+
+    def CreateTransactionBatch(self, request, context):
+        # Все подписи пачки проверяются параллельно в пуле. Кэш идемпотентности пачки не проходят,
+        # запросы с ключом отклоняются в commit_batch
+        pending = [self.submit_verification(item) for item in request.transactions]
+
+        accepted = []
+        for future in pending:
+            try:
+                accepted.append(future is not None and future.result())
+            except Exception as e:
+                logger.warning("Transaction failed: %s", e)
+                accepted.append(False)
+        return self.commit_batch(request, accepted)
+
+    def submit_verification(self, request):
+        """
+        Отправка подписи транзакции на проверку в пул.
+        :return: Future с результатом или None, если отправитель неизвестен или версия подписи не принимается.
+        """
+        if request.payload_version < self.min_payload_version:
+            logger.warning("Transaction failed: payload version %d is no longer accepted", request.payload_version,
+                           extra={"sender_id": request.sender_id})
+            return None
+        public_key = self.get_public_key(request.sender_id)
         if not public_key:
-            return payment_pb2.TransactionResponse(success=False, transaction_id="")
+            return None
+        try:
+            message = self.signed_message(request)
+        except ValueError as e:
+            logger.warning("Transaction failed: %s", e, extra={"sender_id": request.sender_id})
+            return None
+        return self.verifier.submit(public_key, request.signature, message)
 
+    def commit_transaction(self, request, verified):
+        """
+        Запись проверенной транзакции в леджер.
+        Сумма сначала блокируется на счете отправителя, а зачисляется получателю
+        только после записи в леджер.
+        """
+        if not verified:
+            logger.warning("Transaction failed: invalid signature", extra={"sender_id": request.sender_id})
+            return TRANSACTION_FAILED
+        if not self.reserve(request):
+            return TRANSACTION_FAILED
+        amount = to_minor(request.amount)
         try:
-            # Проверка подписи транзакции
-            public_key.verify(
-                request.signature,
-                f"{request.sender_id}{request.receiver_id}{request.amount}".encode(),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
+            transaction_id = self.transactions.append(
+                request.sender_id,
+                request.receiver_id,
+                request.amount,
+                request.signature
             )
-            transaction_id = f"txn_{len(self.transactions) + 1}"
-            self.transactions.append({
-                "id": transaction_id,
-                "sender_id": request.sender_id,
-                "receiver_id": request.receiver_id,
-                "amount": request.amount,
-                "signature": request.signature.hex()
-            })
-            print(f"Transaction created: ID={transaction_id}, Sender={request.sender_id}, "
-                  f"Receiver={request.receiver_id}, Amount={request.amount}")
-            return payment_pb2.TransactionResponse(success=True, transaction_id=transaction_id)
         except Exception as e:
-            print(f"Transaction failed: {e}")
-            return payment_pb2.TransactionResponse(success=False, transaction_id="")
+            self.balances.release(request.sender_id, amount)
+            logger.error("Transaction failed: %s", e)
+            return TRANSACTION_FAILED
+        self.settle([(request.sender_id, request.receiver_id, amount)])
+        logger.info("Transaction created: ID=%s, Sender=%s, Receiver=%s, Amount=%s",
+                    transaction_id, request.sender_id, request.receiver_id, request.amount)
+        return payment_pb2.TransactionResponse(success=True, transaction_id=transaction_id)
+
+    def open_account(self, user_id):
+        # Счет открывается при первой операции с начальным балансом
+        self.balances.open(user_id, self.initial_balance)
+
+    def owns(self, account_id):
+        # В многопроцессном режиме шард ведет только счета, попавшие на него по кольцу
+        return self.ring is None or self.ring.shard_for(account_id) == self.shard_index
+
+    def settle(self, transfers):
+        """
+        Перевод заблокированных сумм получателям.
+        Получателям с других шардов зачисляет их шард по вызову CreditAccount из CreditOutbox,
+        здесь сумма только списывается из холда отправителя.
+        :param transfers: Кортежи (sender_id, receiver_id, сумма в копейках).
+        """
+        local = [transfer for transfer in transfers if self.owns(transfer[1])]
+        if local:
+            self.balances.transfer_many(local, from_held=True)
+        if len(local) < len(transfers):
+            for sender_id, receiver_id, amount in transfers:
+                if not self.owns(receiver_id):
+                    self.balances.capture(sender_id, amount)
+            if self.credits is not None:
+                self.credits.notify()
+
+    def reserve(self, request):
+        """
+        Блокировка суммы транзакции на счете отправителя.
+        :return: True, если сумма корректна и средств хватило.
+        """
+        # Сумма приходит от клиента: NaN или бесконечность нельзя переводить в копейки
+        if not valid_amount(request.amount) or to_minor(request.amount) <= 0:
+            logger.warning("Transaction failed: invalid amount %s", request.amount,
+                           extra={"sender_id": request.sender_id})
+            return False
+        amount = to_minor(request.amount)
+        if not self.owns(request.sender_id):
+            logger.warning("Transaction failed: sender belongs to another shard",
+                           extra={"sender_id": request.sender_id})
+            return False
+        self.open_account(request.sender_id)
+        if self.owns(request.receiver_id):
+            self.open_account(request.receiver_id)
+        if not self.balances.hold(request.sender_id, amount):
+            logger.warning("Transaction failed: insufficient funds", extra={"sender_id": request.sender_id})
+            return False
+        return True
+
+    def replay_balances(self):
+        """
+        Пересчет балансов по восстановленному леджеру.
+        """
+        replayed = 0
+        for transaction in self.transactions:
+            amount = to_minor(transaction.amount)
+            if amount <= 0:
+                continue
+            # Шард восстанавливает только свою сторону перевода
+            sender_local = self.owns(transaction.sender_id)
+            receiver_local = self.owns(transaction.receiver_id)
+            if sender_local:
+                self.open_account(transaction.sender_id)
+            if receiver_local:
+                self.open_account(transaction.receiver_id)
+            if sender_local and receiver_local:
+                replayed += self.balances.transfer(transaction.sender_id, transaction.receiver_id, amount)
+            elif sender_local:
+                replayed += self.balances.debit(transaction.sender_id, amount)
+            elif receiver_local:
+                self.balances.credit(transaction.receiver_id, amount)
+                replayed += 1
+        logger.info("Balances rebuilt: %d accounts, %d transfers", len(self.balances), replayed)
+
+    def commit_batch(self, request, accepted):
+        """
+        Атомарная запись принятых транзакций пачки.
+        :param accepted: Результаты проверки подписей в порядке запросов.
+        """
+        accepted = [ok and not self.keyed_batch_item(item) and self.reserve(item)
+                    for item, ok in zip(request.transactions, accepted)]
+        settled = [item for item, ok in zip(request.transactions, accepted) if ok]
+        # Принятые транзакции записываются в леджер атомарно
+        try:
+            transaction_ids = iter(self.transactions.append_many(
+                (item.sender_id, item.receiver_id, item.amount, item.signature) for item in settled
+            ))
+        except Exception:
+            for item in settled:
+                self.balances.release(item.sender_id, to_minor(item.amount))
+            raise
+        # Зачисления пачки проводятся одним захватом блокировок счетов
+        self.settle([(item.sender_id, item.receiver_id, to_minor(item.amount)) for item in settled])
+        results = [
+            payment_pb2.TransactionResponse(success=True, transaction_id=next(transaction_ids)) if ok
+            else TRANSACTION_FAILED
+            for ok in accepted
+        ]
+        logger.info("Transaction batch processed: %d of %d accepted", sum(accepted), len(accepted))
+        return payment_pb2.TransactionBatchResponse(results=results)
+
+    @staticmethod
+    def keyed_batch_item(item):
+        """
+        Запросы с ключом идемпотентности в пачке не принимаются: повтор пачки записал бы их заново.
+        Такие запросы отправляются отдельным CreateTransaction (TransactionBatcher делает это сам).
+        """
+        if not item.idempotency_key:
+            return False
+        logger.warning("Transaction failed: idempotency keys are not accepted in batches",
+                       extra={"sender_id": item.sender_id})
+        return True
+
+    def CreditAccount(self, request, context):
+        """
+        Зачисление получателю этого шарда по транзакции, проведенной шардом отправителя.
+        Транзакция записывается в леджер шарда с исходным ID, повтор вызова ничего не меняет.
+        Принимаются только зачисления, подписанные секретом шардов: вызов доступен клиентам шарда.
+        """
+        if self.ring is None:
+            context.abort(grpc.StatusCode.PERMISSION_DENIED, "Credits are accepted only by shard workers")
+        if self.credits is None or not self.credits.confirm(request):
+            logger.warning("Credit rejected: invalid peer signature, ID=%s, Receiver=%s",
+                           request.transaction_id, request.receiver_id)
+            context.abort(grpc.StatusCode.PERMISSION_DENIED, "Credits are accepted only from shard workers")
+        amount = to_minor(request.amount)
+        if amount <= 0 or not self.owns(request.receiver_id):
+            return payment_pb2.CreditResponse(success=False)
+        if self.transactions.append_foreign(request.transaction_id, request.sender_id, request.receiver_id,
+                                            request.amount, b""):
+            self.open_account(request.receiver_id)
+            self.balances.credit(request.receiver_id, amount)
+            logger.info("Credit applied: ID=%s, Receiver=%s, Amount=%s",
+                        request.transaction_id, request.receiver_id, request.amount)
+        return payment_pb2.CreditResponse(success=True)
 
     def VerifyTransaction(self, request, context):
-        transaction = next((txn for txn in self.transactions if txn["id"] == request.transaction_id), None)
-        if transaction:
-            print(f"Transaction verified: ID={request.transaction_id}")
-            return payment_pb2.VerifyResponse(success=True, message="Transaction verified")
+        if request.transaction_id in self.transactions:
+            logger.debug("Transaction verified: ID=%s", request.transaction_id)
+            return TRANSACTION_VERIFIED
         else:
-            print(f"Transaction not found: ID={request.transaction_id}")
-            return payment_pb2.VerifyResponse(success=False, message="Transaction not found")
+            logger.debug("Transaction not found: ID=%s", request.transaction_id)
+            return TRANSACTION_NOT_FOUND
+
+    def ListTransactions(self, request, context):
+        try:
+            start_row = decode_cursor(request.cursor)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return self.transaction_pages(request, start_row)
+
+    def transaction_pages(self, request, start_row):
+        """
+        Страницы ListTransactions. Строки читаются по мере отправки, поэтому в памяти
+        держится одна страница; курсор страницы - номер строки после ее последней транзакции.
+        Последняя страница выборки идет без курсора.
+        """
+        size = page_size(request.page_size)
+        remaining = request.limit or None
+        page = []
+        cursor = ""
+        for row, transaction in self.transactions.query(request.sender_id, request.receiver_id, request.start_id,
+                                                         request.end_id, start_row):
+            if len(page) >= size:
+                # Заполненная страница уходит, когда за ней нашлась строка: иначе она последняя,
+                # и после нее не нужна пустая страница без курсора
+                yield payment_pb2.TransactionPage(transactions=page, cursor=cursor)
+                page = []
+            cursor = str(row + 1)
+            page.append(payment_pb2.LedgerTransaction(
+                transaction_id=transaction.id,
+                sender_id=transaction.sender_id,
+                receiver_id=transaction.receiver_id,
+                amount=transaction.amount,
+                signature=transaction.signature
+            ))
+            if remaining is not None:
+                remaining -= 1
+                if not remaining:
+                    # Лимит вызова исчерпан: курсор позволяет продолжить следующим вызовом
+                    yield payment_pb2.TransactionPage(transactions=page, cursor=cursor)
+                    return
+        yield payment_pb2.TransactionPage(transactions=page)
+
+    def GetAccountAggregates(self, request, context):
+        try:
+            start_code = decode_cursor(request.cursor)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return self.aggregate_pages(request, start_code)
+
+    def aggregate_pages(self, request, start_code):
+        """
+        Страницы GetAccountAggregates из итогов, которые хранилище ведет при добавлении транзакций.
+        Шард отдает только свои счета: у чужих счетов в его леджере лишь часть переводов.
+        """
+        size = page_size(request.page_size)
+        codes = self.transactions.party_codes(list(request.account_ids) or None, start_code)
+        for offset in range(0, len(codes), size):
+            chunk = codes[offset:offset + size]
+            aggregates = [
+                payment_pb2.AccountAggregate(
+                    account_id=totals.account_id,
+                    sent_total=from_minor(totals.sent_total),
+                    sent_count=totals.sent_count,
+                    received_total=from_minor(totals.received_total),
+                    received_count=totals.received_count
+                )
+                for totals in self.transactions.account_totals(chunk) if self.owns(totals.account_id)
+            ]
+            if offset + size < len(codes):
+                yield payment_pb2.AccountAggregatesPage(aggregates=aggregates, cursor=str(chunk[-1] + 1))
+            else:
+                yield payment_pb2.AccountAggregatesPage(aggregates=aggregates)
+                return
+        yield payment_pb2.AccountAggregatesPage()
 
     def ProcessFuelPayment(self, request, context):
-        fuel_price_per_liter = request.fuel_price_per_liter
-        liters = request.liters
+        success, message, _ = self.charge_fuel(
+            request.session_id, request.fuel_price_per_liter, request.liters, request.is_finished,
+            request.account_id, opened_at=request.opened_at, signature=request.signature
+        )
+        return payment_pb2.FuelPaymentResponse(success=success, message=message)
+
+    def FuelSession(self, request_iterator, context):
+        # Кадры приходят потоком, подтверждение отправляется на каждый кадр без ожидания следующего
+        opened = set()
+        try:
+            for frame in request_iterator:
+                ack = self.process_frame(frame)
+                self.track_fuel_session(opened, frame, ack)
+                yield ack
+                if frame.is_finished:
+                    return
+        finally:
+            # Поток отменен или оборвался без завершающего кадра: холд не должен остаться на счете
+            self.abandon_fuel_sessions(opened)
+
+    @staticmethod
+    def track_fuel_session(opened, frame, ack):
+        """
+        Учет сессий потока, которые открыты и еще не завершены завершающим кадром.
+        :param opened: Множество ID сессий потока.
+        """
+        if ack.success:
+            if frame.is_finished:
+                opened.discard(frame.session_id)
+            else:
+                opened.add(frame.session_id)
+
+    def abandon_fuel_sessions(self, session_ids):
+        """
+        Завершение сессий оборванного потока: неиспользованный остаток холда возвращается на счет.
+        """
+        for session_id in session_ids:
+            try:
+                hold = self.fuel_sessions.finish(session_id)
+            except HoldError as e:
+                logger.error("Abandoned fuel session finish failed: %s", e)
+                continue
+            if hold is not None:
+                logger.warning("Fuel session abandoned. Session=%s, Total fuel cost: %.2f RUB",
+                               session_id, hold.total_cost)
+
+    def process_frame(self, frame):
+        """
+        Обработка одного кадра потоковой сессии.
+        :return: FuelAck для кадра.
+        """
+        success, message, hold = self.charge_fuel(
+            frame.session_id, frame.fuel_price_per_liter, frame.liters, frame.is_finished, frame.account_id,
+            frame.sequence, frame.opened_at, frame.signature
+        )
+        return payment_pb2.FuelAck(
+            session_id=frame.session_id,
+            sequence=frame.sequence,
+            success=success,
+            message=message,
+            hold_remaining=hold.remaining if hold else 0,
+            total_cost=hold.total_cost if hold else 0
+        )
+
+    def charge_fuel(self, session_id, fuel_price_per_liter, liters, is_finished, account_id="", sequence=0,
+                    opened_at=0, signature=b""):
+        """
+        Списание стоимости кадра топлива из холда сессии.
+        Сессию открывает кадр с подписью владельца счета над fuel_session_payload; остальные
+        кадры сессии, включая завершающий, должны нести ту же подпись.
+        :param account_id: Счет плательщика, на котором выставляется холд.
+        :param sequence: Номер кадра потоковой сессии; повторные и устаревшие кадры отклоняются.
+        :param opened_at: Время открытия сессии из подписанных данных, мс Unix.
+        :param signature: Подпись открытия сессии.
+        :return: Кортеж (успех, сообщение, снимок холда или None).
+        """
+        if is_finished:
+            try:
+                hold = self.fuel_sessions.finish(session_id, sequence, signature)
+            except ReplayedFrameError as e:
+                logger.warning("Fuel session finish rejected: %s", e)
+                return False, "Duplicate frame", None
+            except SessionAuthError as e:
+                logger.warning("Fuel session finish rejected: %s", e)
+                return False, "Invalid signature", None
+            except HoldError as e:
+                logger.error("Fuel session finish failed: %s", e)
+                return False, "Hold error", None
+            total_cost = hold.total_cost if hold else 0
+            logger.info("Fueling finished. Session=%s, Total fuel cost: %.2f RUB", session_id, total_cost)
+            return True, "Fueling finished", hold
+
         cost = fuel_price_per_liter * liters
+        # Отрицательный или бесконечный кадр уменьшил бы списанное и сломал бы возврат холда
+        if not (fuel_price_per_liter > 0 and liters > 0 and valid_amount(cost)):
+            logger.warning("Fuel payment failed: invalid frame %s L x %s RUB, Session=%s",
+                           liters, fuel_price_per_liter, session_id)
+            return False, "Invalid frame", None
+        if not account_id:
+            logger.warning("Fuel payment failed: no payer account, Session=%s", session_id)
+            return False, "Account required", None
+        if not self.owns(account_id):
+            logger.warning("Fuel payment failed: account %s belongs to another shard", account_id)
+            return False, "Account is served by another shard", None
+        verified = False
+        if session_id not in self.fuel_sessions:
+            # Подпись проверяется один раз при открытии, дальше кадры сверяются с ней побайтно
+            reason = self.authenticate_fuel_session(session_id, account_id, opened_at, signature)
+            if reason is not None:
+                return False, reason, None
+            verified = True
+            if account_id not in self.balances:
+                self.open_account(account_id)
+        try:
+            hold, stalled = self.fuel_sessions.charge(session_id, cost, account_id, sequence, signature, verified)
+        except ReplayedFrameError as e:
+            logger.warning("Fuel payment rejected: %s", e)
+            return False, "Duplicate frame", None
+        except SessionAuthError as e:
+            logger.warning("Fuel payment rejected: %s", e)
+            return False, "Invalid signature", None
+        if hold is None:
+            logger.warning("Fuel payment failed: hold declined, Session=%s", session_id)
+            return False, "Insufficient funds", None
+        if stalled:
+            logger.debug("Frame waited for hold top-up. Hold: %.2f RUB, Session=%s", hold.hold_amount, session_id)
+        logger.debug("Fuel payment processed: %.2f liters, %.2f RUB. Authorized: %.2f RUB, "
+                     "Remaining hold: %.2f RUB, Total fuel cost: %.2f RUB",
+                     liters, cost, hold.hold_amount, hold.remaining, hold.total_cost)
 
-        if request.is_finished:
-            print("Fueling finished.")
-            return payment_pb2.FuelPaymentResponse(success=True, message="Fueling finished")
+        return True, "Fuel payment processed", hold
 
-        if self.used_amount + cost > self.hold_amount:
-            print("Insufficient hold amount. Requesting new hold...")
-            self.hold_amount = 100  # Новый холд
-            self.used_amount = 0
-            print(f"New hold: {self.hold_amount} RUB")
+    def journal_fuel(self, account_id, amount):
+        """
+        Запись итога сессии заправки в леджер переводом с плательщика на счет АЗС.
+        FuelSessionManager вызывает ее до списания итога с баланса, поэтому после рестарта
+        replay_balances снова списывает оплату топлива, а не возвращает ее плательщику.
+        :param amount: Сумма в копейках.
+        """
+        self.transactions.append(account_id, FUEL_STATION_ID, from_minor(amount), b"")
+        if self.owns(FUEL_STATION_ID):
+            self.open_account(FUEL_STATION_ID)
+            self.balances.credit(FUEL_STATION_ID, amount)
+        elif self.credits is not None:
+            self.credits.notify()
 
-        self.used_amount += cost
-        self.total_fuel_cost += cost  # Обновляем общую стоимость заправки
-        print(f"Fuel payment processed: {liters:.2f} liters, {cost:.2f} RUB. "
-              f"Used amount: {self.used_amount:.2f} RUB, Remaining hold: {self.hold_amount - self.used_amount:.2f} RUB")
-        print(f"Total fuel cost: {self.total_fuel_cost:.2f} RUB")  # Выводим общую стоимость
+    def authenticate_fuel_session(self, session_id, account_id, opened_at, signature):
+        """
+        Проверка подписи открытия сессии заправки ключом счета плательщика.
+        Время открытия ограничивает окно, в котором подпись можно отправить повторно,
+        а внутри окна повтор завершенной сессии отклоняет FuelSessionManager.
+        :return: Причина отказа или None, если сессию можно открыть.
+        """
+        if abs(time.time() - opened_at / 1000) > FUEL_SESSION_WINDOW:
+            logger.warning("Fuel session rejected: open time is outside the window, Session=%s", session_id)
+            return "Session open expired"
+        public_key = self.get_public_key(account_id)
+        if public_key is None:
+            logger.warning("Fuel payment failed: unknown account %s, Session=%s", account_id, session_id)
+            return "Unknown account"
+        try:
+            verified = self.verifier.verify(public_key, signature,
+                                            fuel_session_payload(session_id, account_id, opened_at))
+        except Exception as e:
+            logger.warning("Fuel session rejected: %s, Session=%s", e, session_id)
+            verified = False
+        if not verified:
+            logger.warning("Fuel session rejected: invalid signature", extra={"account_id": account_id})
+            return "Invalid signature"
+        return None
 
-        return payment_pb2.FuelPaymentResponse(success=True, message="Fuel payment processed")
+    @staticmethod
+    def signed_message(request):
+        # Данные, которые клиент подписывает при создании транзакции, в версии из запроса
+        return signed_payload(request)
 
     def get_public_key(self, user_id):
-        # Загрузка открытого ключа из файла
-        with open(f"{user_id}_public.pem", "rb") as key_file:
-            public_key = serialization.load_pem_public_key(
-                key_file.read(),
-                backend=default_backend()
-            )
-        return public_key
+        # Открытый ключ из реестра или None, если пользователь неизвестен
+        return self.keys.get(user_id)
 
 def handle_sigint(signum, frame):
-    print("\nServer is shutting down...")
+    logger.info("Server is shutting down...")
     sys.exit(0)
 
-def serve():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Payment gRPC server")
+    parser.add_argument("--mode", choices=("thread", "aio"), default="thread",
+                        help="thread-pool server or asyncio (grpc.aio) server")
+    parser.add_argument("--bind", default=DEFAULT_BIND_ADDRESS, help="address to listen on")
+    parser.add_argument("--workers", type=int, default=10,
+                        help="RPC worker threads in thread mode for calls outside admission lanes")
+    parser.add_argument("--verify-workers", type=int, default=None,
+                        help="signature verification workers (default: CPU count)")
+    parser.add_argument("--verify-processes", action="store_true",
+                        help="verify signatures in a process pool instead of threads")
+    parser.add_argument("--max-concurrent-rpcs", type=int, default=None,
+                        help="reject RPCs above this many in flight")
+    parser.add_argument("--max-concurrent-streams", type=int, default=None,
+                        help="HTTP/2 max concurrent streams per connection")
+    parser.add_argument("--no-admission", action="store_true",
+                        help="serve all calls from the shared pool without lanes and load shedding")
+    parser.add_argument("--fuel-workers", type=int, default=10,
+                        help="threads (aio: concurrent calls) of the fuel lane for unary fuel payments")
+    parser.add_argument("--fuel-stream-workers", type=int, default=DEFAULT_FUEL_STREAM_WORKERS,
+                        help="threads (aio: concurrent sessions) for fuel streaming sessions; a session holds one "
+                             "while the pump sends frames")
+    parser.add_argument("--fuel-queue", type=int, default=100,
+                        help="fuel calls waiting for a lane thread before RESOURCE_EXHAUSTED")
+    parser.add_argument("--transaction-workers", type=int, default=4,
+                        help="threads (aio: concurrent calls) of the transaction lane")
+    parser.add_argument("--transaction-queue", type=int, default=50,
+                        help="transaction calls waiting for a lane thread before RESOURCE_EXHAUSTED")
+    parser.add_argument("--client-limit", type=int, default=0,
+                        help="concurrent transaction calls per client (client-id metadata or peer host; "
+                             "0 disables)")
+    parser.add_argument("--ledger-workers", type=int, default=2,
+                        help="threads (aio: concurrent calls) for ledger listing and aggregate streams")
+    parser.add_argument("--ledger-queue", type=int, default=8,
+                        help="ledger streams waiting for a lane thread before RESOURCE_EXHAUSTED")
+    parser.add_argument("--data-dir", default="ledger_data", help="directory for the ledger log and snapshots")
+    parser.add_argument("--in-memory", action="store_true", help="keep the ledger in memory only")
+    parser.add_argument("--fsync-batch-size", type=int, default=256,
+                        help="transactions that trigger an immediate group commit")
+    parser.add_argument("--commit-delay", type=float, default=0.002,
+                        help="max seconds to wait for more transactions before fsync")
+    parser.add_argument("--snapshot-interval", type=int, default=1_000_000,
+                        help="write a ledger snapshot every N transactions (0 disables)")
+    parser.add_argument("--log-level", default="INFO",
+                        help="DEBUG enables per-request logs; INFO and above make them no-ops")
+    parser.add_argument("--log-format", choices=("json", "text"), default="json")
+    parser.add_argument("--log-rate", type=float, default=None,
+                        help="max records per second for each log event")
+    parser.add_argument("--key-dir", default=".", help="directory with <user>_public.pem/.der files")
+    parser.add_argument("--keystore", default=None, help="keystore file with '<user> <base64 DER>' lines")
+    parser.add_argument("--key-cache-size", type=int, default=10000, help="parsed public keys kept in memory")
+    parser.add_argument("--key-reload-interval", type=float, default=2.0,
+                        help="seconds between checks for added or revoked keys (0 disables)")
+    parser.add_argument("--min-payload-version", type=int, choices=(LEGACY_PAYLOAD_VERSION, PAYLOAD_VERSION),
+                        default=LEGACY_PAYLOAD_VERSION,
+                        help="reject transactions signed over an older payload (1 rejects the legacy string)")
+    parser.add_argument("--initial-balance", type=float, default=DEFAULT_INITIAL_BALANCE,
+                        help="balance of a newly opened account, RUB")
+    parser.add_argument("--hold-amount", type=float, default=DEFAULT_HOLD_AMOUNT,
+                        help="fuel hold and top-up size, RUB")
+    parser.add_argument("--top-up-threshold", type=float, default=DEFAULT_TOP_UP_THRESHOLD,
+                        help="share of a fuel hold used before a top-up is requested in the background")
+    parser.add_argument("--fuel-session-ttl", type=float, default=DEFAULT_IDLE_TTL,
+                        help="seconds without frames before a unary fuel session is closed and its hold "
+                             "released (0 disables)")
+    parser.add_argument("--idempotency-ttl", type=float, default=DEFAULT_TTL,
+                        help="seconds to remember the result of a request with an idempotency key")
+    parser.add_argument("--idempotency-keys", type=int, default=DEFAULT_MAX_KEYS,
+                        help="idempotency keys kept in memory")
+    parser.add_argument("--shard-index", type=int, default=0, help="shard number of this worker process")
+    parser.add_argument("--shard-count", type=int, default=1,
+                        help="number of shards; above 1 the process serves only its accounts")
+    parser.add_argument("--peers", default="",
+                        help="comma-separated addresses of all shard workers in shard order; required with "
+                             "--shard-count above 1 to deliver and confirm cross-shard credits")
+    parser.add_argument("--metrics-port", type=int, default=9464,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics (0 disables)")
+    args = parser.parse_args(argv)
+    args.peers = [address for address in args.peers.split(",") if address]
+    # Секрет передается через окружение, чтобы его не было видно в списке процессов
+    args.peer_secret = bytes.fromhex(os.environ.get(PEER_SECRET_ENV, ""))
+    if args.shard_count > 1 and len(args.peers) != args.shard_count:
+        parser.error("--peers must list one address per shard")
+    if args.shard_count > 1 and not args.peer_secret:
+        parser.error(f"shard workers need a shared secret in the {PEER_SECRET_ENV} environment variable")
+    return args
+
+def serve(args=None):
+    args = args or parse_args([])
+    setup_logging(args.log_level, json_output=args.log_format == "json", rate=args.log_rate)
     # Обработка сигнала SIGINT (Ctrl + C)
     signal.signal(signal.SIGINT, handle_sigint)
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    payment_pb2_grpc.add_PaymentServiceServicer_to_server(PaymentService(), server)
-    server.add_insecure_port('[::]:50051')
-    print("Server started on port 50051...")
+    ledger = None
+    if not args.in_memory:
+        ledger = LedgerLog(args.data_dir, fsync_batch_size=args.fsync_batch_size,
+                           commit_delay=args.commit_delay, snapshot_interval=args.snapshot_interval)
+    keys = KeyRegistry(args.key_dir, args.keystore, cache_size=args.key_cache_size,
+                       reload_interval=args.key_reload_interval)
+    balances = BalanceEngine()
+    fuel_sessions = FuelSessionManager(hold_amount=args.hold_amount, balances=balances,
+                                       top_up_threshold=args.top_up_threshold, idle_ttl=args.fuel_session_ttl)
+    service = PaymentService(
+        verifier=SignatureVerifier(max_workers=args.verify_workers, use_processes=args.verify_processes),
+        ledger=ledger,
+        keys=keys,
+        balances=balances,
+        initial_balance=args.initial_balance,
+        fuel_sessions=fuel_sessions,
+        ring=HashRing(args.shard_count) if args.shard_count > 1 else None,
+        shard_index=args.shard_index,
+        idempotency=IdempotencyCache(args.idempotency_ttl, args.idempotency_keys),
+        min_payload_version=args.min_payload_version,
+        peers=args.peers,
+        peer_secret=args.peer_secret
+    )
+    admission = None
+    if not args.no_admission:
+        admission = AdmissionController(default_lanes(args.fuel_workers, args.fuel_queue, args.transaction_workers,
+                                                      args.transaction_queue, args.client_limit,
+                                                      args.ledger_workers, args.ledger_queue,
+                                                      args.fuel_stream_workers))
+    options = []
+    if args.max_concurrent_streams:
+        options.append(("grpc.max_concurrent_streams", args.max_concurrent_streams))
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        logger.info("Metrics available on http://127.0.0.1:%d/metrics", args.metrics_port)
+
+    if args.mode == "aio":
+        import asyncio
+        from aio_server import serve_aio
+        asyncio.run(serve_aio(args.bind, service, args.max_concurrent_rpcs, options,
+                              with_metrics=bool(args.metrics_port), admission=admission))
+        return
+
+    # Допуск стоит первым: вызовы полос уходят в пулы полос, остальные - в общий пул сервера
+    interceptors = [AdmissionInterceptor(admission)] if admission is not None else []
+    if args.metrics_port:
+        interceptors.append(ServerMetricsInterceptor())
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.workers), interceptors=interceptors,
+                         options=options, maximum_concurrent_rpcs=args.max_concurrent_rpcs)
+    payment_pb2_grpc.add_PaymentServiceServicer_to_server(service, server)
+    server.add_insecure_port(args.bind)
+    logger.info("Server started on %s...", args.bind)
     server.start()
+    service.verifier.warm_up()
     server.wait_for_termination()
 
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    serve(parse_args())
\ No newline at end of file
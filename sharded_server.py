@@ -0,0 +1,347 @@
+import argparse
+import itertools
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+from concurrent import futures
+
+import grpc
+
+import payment_pb2
+import payment_pb2_grpc
+from admission import RETRY_PUSHBACK_KEY
+from credit_outbox import PEER_SECRET_ENV
+from hash_ring import HashRing, shard_of_transaction
+from structured_logging import setup_logging
+
+logger = logging.getLogger("payment.router")
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+UNBOUNDED_DEADLINE = 1e9  # Остаток дедлайна больше этого значит, что дедлайн не задан
+
+
+def _remaining(context):
+    """
+    Остаток дедлайна входящего вызова для вызова шарда.
+    :return: Секунды или None, если клиент не задал дедлайн (gRPC отдает тогда условную бесконечность).
+    """
+    remaining = context.time_remaining()
+    return remaining if remaining < UNBOUNDED_DEADLINE else None
+
+
+def split_cursor(cursor, shards):
+    """
+    Курсор маршрутизатора для выборок по всем шардам: "<номер шарда>:<курсор шарда>".
+    :return: Кортеж (номер шарда, курсор шарда).
+    :raises ValueError: Если курсор не выдан маршрутизатором.
+    """
+    if not cursor:
+        return 0, ""
+    shard, separator, inner = cursor.partition(":")
+    if not separator or not shard.isdigit() or int(shard) >= shards:
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return int(shard), inner
+
+
+def _abort(context, error):
+    """
+    Передача ошибки шарда клиенту вместе с подсказкой для повтора, если шард отклонил вызов.
+    """
+    context.set_trailing_metadata(tuple((key, value) for key, value in error.trailing_metadata() or ()
+                                        if key == RETRY_PUSHBACK_KEY))
+    context.abort(error.code(), error.details())
+
+
+class ShardRouter:
+    """
+    Маршрутизация запросов по шардам. Счета распределены по шардам консистентным хэшированием,
+    ID транзакции содержит номер шарда, который ее провел. Используется фронт-маршрутизатором
+    и клиентами, которые обращаются к шардам напрямую. Зачисления получателям с других шардов
+    доставляет сам шард отправителя (CreditOutbox), маршрутизатор в этом не участвует.
+    """
+
+    def __init__(self, addresses, channel_options=()):
+        """
+        :param addresses: Адреса процессов-шардов в порядке их номеров.
+        """
+        self.ring = HashRing(len(addresses))
+        self.channels = [grpc.insecure_channel(address, options=channel_options) for address in addresses]
+        self.stubs = [payment_pb2_grpc.PaymentServiceStub(channel) for channel in self.channels]
+
+    def stub_for_account(self, account_id):
+        return self.stubs[self.ring.shard_for(account_id)]
+
+    def stub_for_transaction(self, transaction_id):
+        """
+        :return: Заглушка шарда, проведшего транзакцию, или None для чужого ID.
+        """
+        shard = shard_of_transaction(transaction_id)
+        if shard is None or shard >= len(self.stubs):
+            return None
+        return self.stubs[shard]
+
+    def stub_for_fuel(self, account_id, session_id):
+        # Холд живет на шарде счета плательщика; кадры без счета идут по ID колонки
+        return self.stubs[self.ring.shard_for(account_id or session_id)]
+
+    def create_transaction(self, request, timeout=None):
+        return self.stub_for_account(request.sender_id).CreateTransaction(request, timeout=timeout)
+
+    def create_transaction_batch(self, request, timeout=None):
+        """
+        Пачка делится по шардам отправителей, части отправляются параллельно,
+        результаты собираются в исходном порядке.
+        """
+        groups = {}
+        for index, item in enumerate(request.transactions):
+            groups.setdefault(self.ring.shard_for(item.sender_id), []).append(index)
+        calls = {
+            shard: self.stubs[shard].CreateTransactionBatch.future(payment_pb2.TransactionBatchRequest(
+                transactions=[request.transactions[index] for index in indexes]
+            ), timeout=timeout)
+            for shard, indexes in groups.items()
+        }
+        results = [None] * len(request.transactions)
+        for shard, call in calls.items():
+            for index, result in zip(groups[shard], call.result().results):
+                results[index] = result
+        return payment_pb2.TransactionBatchResponse(results=results)
+
+    def _shard_pages(self, cursor, call):
+        """
+        Обход шардов по очереди для выборок леджера, не привязанных к одному счету.
+        Если поток шарда закончился страницей с курсором, исчерпан лимит вызова, и обход останавливается.
+        :param call: Функция (номер шарда, курсор шарда) -> поток страниц шарда или None, чтобы пропустить шард.
+        :return: Генератор кортежей (номер шарда, страница шарда, курсор маршрутизатора).
+        """
+        first, cursor = split_cursor(cursor, len(self.stubs))
+        for shard in range(first, len(self.stubs)):
+            pages = call(shard, cursor)
+            cursor = ""
+            if pages is None:
+                continue
+            limited = False
+            for page in pages:
+                limited = bool(page.cursor)
+                if page.cursor:
+                    yield shard, page, f"{shard}:{page.cursor}"
+                elif shard + 1 < len(self.stubs):
+                    yield shard, page, f"{shard + 1}:"
+                else:
+                    yield shard, page, ""
+            if limited:
+                return
+
+    def list_transactions(self, request, timeout=None):
+        """
+        Выборка транзакций со всех шардов. Межшардовая транзакция есть и в леджере шарда получателя,
+        там ее копия пропускается: каждая транзакция отдается шардом, который ее провел.
+        """
+        remaining = request.limit or None
+
+        def call(shard, cursor):
+            shard_request = payment_pb2.ListTransactionsRequest()
+            shard_request.CopyFrom(request)
+            shard_request.cursor = cursor
+            shard_request.limit = remaining or 0
+            return self.stubs[shard].ListTransactions(shard_request, timeout=timeout)
+
+        for shard, page, cursor in self._shard_pages(request.cursor, call):
+            if remaining is not None:
+                remaining -= len(page.transactions)
+            yield payment_pb2.TransactionPage(transactions=[
+                transaction for transaction in page.transactions
+                if shard_of_transaction(transaction.transaction_id) in (shard, None)
+            ], cursor=cursor)
+
+    def account_aggregates(self, request, timeout=None):
+        """
+        Итоги по счетам со всех шардов: каждый шард отдает только свои счета.
+        """
+        accounts = list(request.account_ids)
+
+        def call(shard, cursor):
+            owned = [account_id for account_id in accounts if self.ring.shard_for(account_id) == shard]
+            if accounts and not owned:
+                return None
+            return self.stubs[shard].GetAccountAggregates(payment_pb2.AccountAggregatesRequest(
+                account_ids=owned, cursor=cursor, page_size=request.page_size
+            ), timeout=timeout)
+
+        for _, page, cursor in self._shard_pages(request.cursor, call):
+            yield payment_pb2.AccountAggregatesPage(aggregates=page.aggregates, cursor=cursor)
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+
+class RouterService(payment_pb2_grpc.PaymentServiceServicer):
+    """
+    Фронт-маршрутизатор: принимает вызовы PaymentService и передает их шарду-владельцу.
+    """
+
+    def __init__(self, router):
+        self.router = router
+
+    def CreateTransaction(self, request, context):
+        try:
+            return self.router.create_transaction(request, timeout=_remaining(context))
+        except grpc.RpcError as e:
+            _abort(context, e)
+
+    def CreateTransactionBatch(self, request, context):
+        try:
+            return self.router.create_transaction_batch(request, timeout=_remaining(context))
+        except grpc.RpcError as e:
+            _abort(context, e)
+
+    def VerifyTransaction(self, request, context):
+        stub = self.router.stub_for_transaction(request.transaction_id)
+        if stub is None:
+            return payment_pb2.VerifyResponse(success=False, message="Transaction not found")
+        try:
+            return stub.VerifyTransaction(request, timeout=_remaining(context))
+        except grpc.RpcError as e:
+            _abort(context, e)
+
+    def ProcessFuelPayment(self, request, context):
+        stub = self.router.stub_for_fuel(request.account_id, request.session_id)
+        try:
+            return stub.ProcessFuelPayment(request, timeout=_remaining(context))
+        except grpc.RpcError as e:
+            _abort(context, e)
+
+    def FuelSession(self, request_iterator, context):
+        # Шард выбирается по первому кадру, дальше поток проксируется целиком
+        frames = iter(request_iterator)
+        first = next(frames, None)
+        if first is None:
+            return
+        stub = self.router.stub_for_fuel(first.account_id, first.session_id)
+        responses = stub.FuelSession(itertools.chain([first], frames))
+        try:
+            yield from responses
+        except grpc.RpcError as e:
+            _abort(context, e)
+        finally:
+            # Отмена вызова клиентом отменяет поток к шарду, и шард закрывает брошенную сессию
+            responses.cancel()
+
+    def ListTransactions(self, request, context):
+        # Все транзакции отправителя или получателя лежат на шарде его счета, курсор шарда передается как есть
+        account_id = request.sender_id or request.receiver_id
+        try:
+            if account_id:
+                yield from self.router.stub_for_account(account_id).ListTransactions(
+                    request, timeout=_remaining(context))
+            else:
+                yield from self.router.list_transactions(request, timeout=_remaining(context))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except grpc.RpcError as e:
+            _abort(context, e)
+
+    def GetAccountAggregates(self, request, context):
+        try:
+            yield from self.router.account_aggregates(request, timeout=_remaining(context))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except grpc.RpcError as e:
+            _abort(context, e)
+
+    def CreditAccount(self, request, context):
+        # Зачисления ходят только между шардами, снаружи они недоступны
+        context.abort(grpc.StatusCode.PERMISSION_DENIED, "Credits are not accepted by the router")
+
+
+def start_workers(shards, base_port, data_dir, metrics_base_port, server_args):
+    """
+    Запуск процессов-шардов server.py на localhost.
+    Шарды получают общий секрет для подписи зачислений друг другу: новый при каждом запуске,
+    если он не задан в окружении.
+    :return: Кортеж (процессы, адреса).
+    """
+    processes = []
+    addresses = [f"127.0.0.1:{base_port + shard}" for shard in range(shards)]
+    environment = dict(os.environ)
+    environment.setdefault(PEER_SECRET_ENV, secrets.token_hex(32))
+    for shard, address in enumerate(addresses):
+        command = [
+            sys.executable, SERVER_SCRIPT, "--bind", address,
+            "--shard-index", str(shard), "--shard-count", str(shards), "--peers", ",".join(addresses),
+            "--data-dir", os.path.join(data_dir, f"shard-{shard}"),
+            "--metrics-port", str(metrics_base_port + shard if metrics_base_port else 0),
+        ] + list(server_args)
+        processes.append(subprocess.Popen(command, env=environment))
+    for address in addresses:
+        with grpc.insecure_channel(address) as channel:
+            grpc.channel_ready_future(channel).result(timeout=60)
+    return processes, addresses
+
+
+def stop_workers(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Multi-process payment server: shard workers plus a routing front end. "
+                    "Unknown options are passed to every server.py worker."
+    )
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--bind", default="[::]:50051", help="router address")
+    parser.add_argument("--base-port", type=int, default=50100, help="workers listen on 127.0.0.1:BASE+N")
+    parser.add_argument("--router-workers", type=int, default=32, help="router RPC threads")
+    parser.add_argument("--no-router", action="store_true",
+                        help="run only the workers; clients route with ShardRouter themselves")
+    parser.add_argument("--data-dir", default="ledger_data", help="ledger partitions go to DATA_DIR/shard-N")
+    parser.add_argument("--metrics-base-port", type=int, default=0,
+                        help="workers serve metrics on 127.0.0.1:BASE+N (0 disables)")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--log-format", choices=("json", "text"), default="json")
+    return parser.parse_known_args(argv)
+
+
+def serve_sharded(args, server_args):
+    setup_logging(args.log_level, json_output=args.log_format == "json")
+    server_args = list(server_args) + ["--log-level", args.log_level, "--log-format", args.log_format]
+    processes, addresses = start_workers(args.shards, args.base_port, args.data_dir, args.metrics_base_port,
+                                         server_args)
+    logger.info("Started %d shard workers: %s", len(processes), ", ".join(addresses))
+    router = None
+    server = None
+    try:
+        if args.no_router:
+            for process in processes:
+                process.wait()
+            return
+        router = ShardRouter(addresses)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.router_workers))
+        payment_pb2_grpc.add_PaymentServiceServicer_to_server(RouterService(router), server)
+        server.add_insecure_port(args.bind)
+        server.start()
+        logger.info("Router started on %s...", args.bind)
+        server.wait_for_termination()
+    except KeyboardInterrupt:
+        logger.info("Sharded server is shutting down...")
+    finally:
+        if server is not None:
+            server.stop(0)
+        if router is not None:
+            router.close()
+        stop_workers(processes)
+
+
+if __name__ == '__main__':
+    serve_sharded(*parse_args())
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent import futures
+
+from lru import LRUCache
+from metrics import SIGNATURE_VERIFY_SECONDS
+from signing import SCHEMES, pss_padding, scheme_for_key
+
+# Кэш разобранных ключей внутри процесса-воркера
+_worker_keys = {}
+
+
+# cryptography загружается при первой проверке подписи, а не при импорте модуля:
+# так сервер быстрее начинает принимать вызовы после запуска. Параметры RSA-PSS - signing.pss_padding()
+def public_key_der(public_key):
+    from cryptography.hazmat.primitives import serialization
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def verify_signature(public_key, signature, message):
+    """
+    Проверка подписи по схеме, которую задает тип ключа (RSA-PSS/SHA-256 или Ed25519).
+    :return: True, если подпись верна, иначе False.
+    :raises ValueError: Если тип ключа не поддерживается.
+    """
+    return scheme_for_key(public_key).verify(public_key, signature, message)
+
+
+def _import_crypto():
+    from cryptography.exceptions import InvalidSignature  # noqa: F401
+    from cryptography.hazmat.primitives import serialization  # noqa: F401
+    pss_padding()
+    for scheme in SCHEMES.values():
+        scheme.key_types()
+
+
+def _timed_verify(public_key, signature, message):
+    start = time.perf_counter()
+    try:
+        return verify_signature(public_key, signature, message)
+    finally:
+        SIGNATURE_VERIFY_SECONDS.observe(time.perf_counter() - start)
+
+
+def _verify_in_worker(key_der, signature, message):
+    # Ключи передаются в процесс в виде DER и разбираются один раз
+    public_key = _worker_keys.get(key_der)
+    if public_key is None:
+        from cryptography.hazmat.primitives import serialization
+        public_key = serialization.load_der_public_key(key_der)
+        _worker_keys[key_der] = public_key
+    return verify_signature(public_key, signature, message)
+
+
+class SignatureVerifier:
+    """
+    Движок проверки подписей: пул потоков или процессов и LRU-кэш результатов,
+    чтобы повторные и дублирующиеся запросы не проверялись заново.
+    """
+
+    def __init__(self, max_workers=None, use_processes=False, cache_size=65536, fingerprint_cache_size=16384):
+        """
+        :param max_workers: Количество воркеров (по умолчанию по числу ядер).
+        :param use_processes: Проверять подписи в пуле процессов вместо пула потоков.
+        :param cache_size: Максимальное число результатов в кэше (0 отключает кэш).
+        :param fingerprint_cache_size: Сколько отпечатков ключей держать в памяти.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        if use_processes:
+            self._pool = futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._pool = futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="verify")
+        self.cache = LRUCache(cache_size) if cache_size > 0 else None
+        self._fingerprints = LRUCache(fingerprint_cache_size)  # id(ключа) -> (ключ, DER, отпечаток)
+
+    def _key_info(self, public_key):
+        info = self._fingerprints.get(id(public_key))
+        if info is None or info[0] is not public_key:
+            der = public_key_der(public_key)
+            info = (public_key, der, hashlib.sha256(der).digest())
+            self._fingerprints.put(id(public_key), info)
+        return info
+
+    def submit(self, public_key, signature, message):
+        """
+        Асинхронная проверка подписи.
+        :return: Future с результатом True/False.
+        """
+        _, der, fingerprint = self._key_info(public_key)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = (fingerprint, hashlib.sha256(message).digest(), signature)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                future = futures.Future()
+                future.set_result(cached)
+                return future
+
+        if self.use_processes:
+            # Метрики внутри процесса-воркера недоступны, поэтому время считается от постановки в пул
+            start = time.perf_counter()
+            future = self._pool.submit(_verify_in_worker, der, signature, message)
+            future.add_done_callback(lambda f: SIGNATURE_VERIFY_SECONDS.observe(time.perf_counter() - start))
+        else:
+            future = self._pool.submit(_timed_verify, public_key, signature, message)
+        if cache_key is not None:
+            future.add_done_callback(
+                lambda f: f.exception() is None and self.cache.put(cache_key, f.result()))
+        return future
+
+    def verify(self, public_key, signature, message):
+        """
+        Синхронная проверка подписи через пул.
+        :return: True, если подпись верна, иначе False.
+        """
+        return self.submit(public_key, signature, message).result()
+
+    def warm_up(self):
+        """
+        Загрузка cryptography в фоне, чтобы первая транзакция не ждала импорт.
+        Вызывается после того, как сервер начал принимать вызовы.
+        """
+        threading.Thread(target=_import_crypto, name="crypto-warmup", daemon=True).start()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,185 @@
+import functools
+import struct
+import time
+
+# Версии подписываемых данных транзакции (поле payload_version в TransactionRequest)
+LEGACY_PAYLOAD_VERSION = 0  # Строка "<sender_id><receiver_id><amount>" для старых клиентов
+PAYLOAD_VERSION = 1         # Двоичные данные transaction_payload()
+
+_PAYLOAD_HEADER = b"PTX" + bytes([PAYLOAD_VERSION])
+_FUEL_SESSION_HEADER = b"PFS" + bytes([PAYLOAD_VERSION])
+_LENGTH = struct.Struct(">I")
+_AMOUNT = struct.Struct(">d")
+_TIMESTAMP = struct.Struct(">Q")
+
+
+def _field(value):
+    data = value.encode()
+    return _LENGTH.pack(len(data)) + data
+
+
+def transaction_payload(request):
+    """
+    Каноническое двоичное представление транзакции для подписи: заголовок с версией,
+    строковые поля с длиной (их нельзя сдвинуть на границе соседнего поля) и сумма
+    восемью байтами IEEE 754, как в protobuf, без форматирования float в строку.
+    :param request: TransactionRequest.
+    :return: Байты для подписи.
+    """
+    return b"".join((_PAYLOAD_HEADER, _field(request.sender_id), _field(request.receiver_id),
+                     _AMOUNT.pack(request.amount), _field(request.idempotency_key)))
+
+
+def legacy_payload(request):
+    return f"{request.sender_id}{request.receiver_id}{request.amount}".encode()
+
+
+_PAYLOADS = {LEGACY_PAYLOAD_VERSION: legacy_payload, PAYLOAD_VERSION: transaction_payload}
+
+
+def signed_payload(request):
+    """
+    Данные, которые клиент подписал, по версии из запроса.
+    :raises ValueError: Если версия неизвестна.
+    """
+    build = _PAYLOADS.get(request.payload_version)
+    if build is None:
+        raise ValueError(f"unsupported payload version {request.payload_version}")
+    return build(request)
+
+
+def fuel_session_payload(session_id, account_id, opened_at):
+    """
+    Данные открытия сессии заправки для подписи плательщиком: холд на счете
+    может выставить только владелец ключа счета. Заголовок отличается от транзакции,
+    поэтому подпись одного нельзя выдать за подпись другого.
+    :param opened_at: Время открытия сессии в миллисекундах Unix.
+    :return: Байты для подписи.
+    """
+    return b"".join((_FUEL_SESSION_HEADER, _field(session_id), _field(account_id), _TIMESTAMP.pack(opened_at)))
+
+
+# cryptography загружается при первой подписи или проверке, а не при импорте модуля
+@functools.cache
+def pss_padding():
+    """
+    :return: Параметры подписи RSA-PSS, которыми клиенты подписывают транзакции.
+    """
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    return padding.PSS(
+        mgf=padding.MGF1(hashes.SHA256()),
+        salt_length=padding.PSS.MAX_LENGTH
+    )
+
+
+class RsaPssScheme:
+    """
+    RSA-PSS/SHA-256: ключи клиентов по умолчанию.
+    """
+    name = "rsa-pss"
+    private_format = "TraditionalOpenSSL"
+
+    @staticmethod
+    def key_types():
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        return rsa.RSAPublicKey, rsa.RSAPrivateKey
+
+    @staticmethod
+    def generate(key_size=2048):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+
+    @staticmethod
+    def sign(private_key, message):
+        from cryptography.hazmat.primitives import hashes
+        return private_key.sign(message, pss_padding(), hashes.SHA256())
+
+    @staticmethod
+    def verify(public_key, signature, message):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        try:
+            public_key.verify(signature, message, pss_padding(), hashes.SHA256())
+            return True
+        except InvalidSignature:
+            return False
+
+
+class Ed25519Scheme:
+    """
+    Ed25519: подпись 64 байта вместо 256, ключ 32 байта, подпись в несколько раз быстрее RSA,
+    генерация ключа - на порядки. Проверка одной подписи медленнее, чем у RSA-2048 с экспонентой 65537.
+    """
+    name = "ed25519"
+    private_format = "PKCS8"  # Ключи Ed25519 не записываются в формате TraditionalOpenSSL
+
+    @staticmethod
+    def key_types():
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+        return ed25519.Ed25519PublicKey, ed25519.Ed25519PrivateKey
+
+    @staticmethod
+    def generate(key_size=None):
+        # Размер ключа у Ed25519 фиксирован
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+        return ed25519.Ed25519PrivateKey.generate()
+
+    @staticmethod
+    def sign(private_key, message):
+        return private_key.sign(message)
+
+    @staticmethod
+    def verify(public_key, signature, message):
+        from cryptography.exceptions import InvalidSignature
+        try:
+            public_key.verify(signature, message)
+            return True
+        except InvalidSignature:
+            return False
+
+
+SCHEMES = {scheme.name: scheme for scheme in (RsaPssScheme, Ed25519Scheme)}
+DEFAULT_SCHEME = RsaPssScheme.name
+
+# Тип объекта ключа -> схема; алгоритм определяется ключом отправителя, а не полем запроса
+_schemes_by_type = {}
+
+
+def scheme_for_key(key):
+    """
+    Схема подписи для открытого или закрытого ключа.
+    :raises ValueError: Если тип ключа не поддерживается.
+    """
+    scheme = _schemes_by_type.get(type(key))
+    if scheme is None:
+        scheme = next((candidate for candidate in SCHEMES.values() if isinstance(key, candidate.key_types())),
+                      None)
+        if scheme is None:
+            raise ValueError(f"unsupported key type {type(key).__name__}")
+        _schemes_by_type[type(key)] = scheme
+    return scheme
+
+
+def sign_request(private_key, request, payload_version=PAYLOAD_VERSION):
+    """
+    Подпись TransactionRequest: заполняет payload_version и signature.
+    :param private_key: Закрытый ключ отправителя (RSA или Ed25519).
+    :return: Тот же запрос.
+    """
+    request.payload_version = payload_version
+    request.signature = scheme_for_key(private_key).sign(private_key, signed_payload(request))
+    return request
+
+
+def sign_fuel_session(private_key, session_id, account_id, opened_at=None):
+    """
+    Подпись открытия сессии заправки.
+    :param private_key: Закрытый ключ плательщика (RSA или Ed25519).
+    :param opened_at: Время открытия в миллисекундах Unix (по умолчанию текущее).
+    :return: Кортеж (opened_at, подпись) для полей кадров сессии.
+    """
+    if opened_at is None:
+        opened_at = time.time_ns() // 1_000_000
+    message = fuel_session_payload(session_id, account_id, opened_at)
+    return opened_at, scheme_for_key(private_key).sign(private_key, message)
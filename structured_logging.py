@@ -0,0 +1,133 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+# Стандартные атрибуты LogRecord; все остальные попадают в JSON как поля события
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирование записи в одну строку JSON.
+    Поля, переданные через extra, добавляются в объект как есть.
+    """
+
+    def format(self, record):
+        event = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                event[key] = value
+        if record.exc_info:
+            event["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не форматирует сообщение в вызывающем потоке:
+    подстановка аргументов и сериализация происходят в фоновом писателе.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничение частоты и сэмплирование по событиям.
+    Событием считается шаблон сообщения, поэтому один и тот же вызов логгера
+    ограничивается независимо от аргументов.
+    """
+
+    def __init__(self, rate=None, burst=None, sample_rates=None):
+        """
+        :param rate: Сколько записей одного события пропускать в секунду (None — без ограничения).
+        :param burst: Допустимый всплеск (по умолчанию равен rate).
+        :param sample_rates: Доля пропускаемых записей по шаблону сообщения, например {"Fuel ...": 0.01}.
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self.sample_rates = sample_rates or {}
+        self._buckets = {}  # Шаблон -> [токены, время последнего пополнения]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        sample_rate = self.sample_rates.get(record.msg)
+        if sample_rate is not None and random.random() >= sample_rate:
+            return False
+        if self.rate is None or record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.msg)
+            if bucket is None:
+                bucket = self._buckets[record.msg] = [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+
+def setup_logging(level="INFO", json_output=True, stream=None, rate=None, sample_rates=None):
+    """
+    Настройка логирования через очередь и фоновый поток-писатель.
+    :param level: Уровень логирования; на уровнях выше DEBUG вызовы горячих путей почти ничего не стоят.
+    :param json_output: Писать структурированный JSON вместо текста.
+    :param stream: Куда писать (по умолчанию stdout).
+    :param rate: Ограничение записей одного события в секунду.
+    :param sample_rates: Доли сэмплирования по шаблону сообщения.
+    :return: Запущенный QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if json_output:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    if rate is not None or sample_rates:
+        handler.addFilter(RateLimitFilter(rate=rate, sample_rates=sample_rates))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """
+    Дописывание очереди и остановка фонового писателя.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import grpc
+
+from admission import AdmissionController, AsyncAdmissionInterceptor, default_lanes
+
+FUEL_METHOD = "/payment.PaymentService/ProcessFuelPayment"
+FUEL_STREAM_METHOD = "/payment.PaymentService/FuelSession"
+
+
+async def lane_behavior(interceptor, method, handler):
+    async def continuation(details):
+        return handler
+
+    handler = await interceptor.intercept_service(continuation, SimpleNamespace(method=method))
+    return handler.unary_unary or handler.stream_stream
+
+
+def test_cancelled_call_leaves_lane_queue():
+    controller = AdmissionController(default_lanes(fuel_workers=1, fuel_stream_workers=1))
+    fuel, transactions = controller.lanes[0], controller.lanes[1]
+    interceptor = AsyncAdmissionInterceptor(controller)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def unary(request, context):
+            await release.wait()
+
+        async def stream(requests, context):
+            await release.wait()
+            yield None
+
+        call = await lane_behavior(interceptor, FUEL_METHOD, grpc.unary_unary_rpc_method_handler(unary))
+        session = await lane_behavior(interceptor, FUEL_STREAM_METHOD, grpc.stream_stream_rpc_method_handler(stream))
+
+        async def consume():
+            async for _ in session(None, None):
+                pass
+
+        busy = [asyncio.create_task(call(None, None)), asyncio.create_task(consume())]
+        await asyncio.sleep(0)
+        # Единственные слоты заняты: следующие вызовы ждут их и отменяются клиентом
+        waiting = [asyncio.create_task(call(None, None)), asyncio.create_task(consume())]
+        await asyncio.sleep(0)
+        assert (fuel.waiting, fuel.streams_waiting) == (1, 1)
+        assert controller.check(transactions) == "priority"
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        assert (fuel.waiting, fuel.streams_waiting) == (0, 0)
+        assert controller.check(transactions) is None
+
+        release.set()
+        await asyncio.gather(*busy)
+        assert (fuel.running, fuel.streams_running) == (0, 0)
+        # Слоты освобождены: следующий вызов получает слот без ожидания
+        await asyncio.wait_for(call(None, None), 1)
+
+    asyncio.run(scenario())
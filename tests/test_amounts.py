@@ -0,0 +1,40 @@
+import math
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+import payment_pb2
+from key_registry import KeyRegistry
+from server import PaymentService
+from signature_verifier import SignatureVerifier
+from signing import sign_fuel_session, sign_request
+
+INVALID_AMOUNTS = [math.nan, math.inf, -math.inf, -5.0, 0.0, 0.001, 1e300]
+
+
+@pytest.fixture
+def service(tmp_path):
+    keys = KeyRegistry(str(tmp_path), reload_interval=0)
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    keys.register("alice", private_key.public_key())
+    service = PaymentService(verifier=SignatureVerifier(max_workers=1), keys=keys)
+    service.private_key = private_key
+    return service
+
+
+@pytest.mark.parametrize("amount", INVALID_AMOUNTS)
+def test_invalid_transaction_amount_is_rejected(service, amount):
+    request = sign_request(service.private_key, payment_pb2.TransactionRequest(
+        sender_id="alice", receiver_id="bob", amount=amount))
+    assert not service.CreateTransaction(request, None).success
+    assert len(service.transactions) == 0
+
+
+@pytest.mark.parametrize("price, liters", [(math.nan, 1.0), (50.0, math.inf), (1e200, 1e200), (1e307, 10.0)])
+def test_invalid_fuel_frame_is_rejected(service, price, liters):
+    opened_at, signature = sign_fuel_session(service.private_key, "pump-1", "alice")
+    frame = payment_pb2.FuelFrame(session_id="pump-1", sequence=1, fuel_price_per_liter=price, liters=liters,
+                                  account_id="alice", opened_at=opened_at, signature=signature)
+    ack = service.process_frame(frame)
+    assert not ack.success
+    assert "pump-1" not in service.fuel_sessions
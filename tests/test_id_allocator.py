@@ -0,0 +1,38 @@
+import time
+
+from id_allocator import IdAllocator
+from ledger_log import LedgerLog
+from transaction_store import TransactionStore
+
+HOUR_NS = 3600 * 10 ** 9
+
+
+def open_store(data_dir, wall_clock_ns):
+    log = LedgerLog(str(data_dir), commit_delay=0, snapshot_interval=0)
+    store = TransactionStore(log, IdAllocator(3, "s1-", wall_clock_ns=wall_clock_ns))
+    log.recover(store)
+    return log, store
+
+
+def test_allocator_continues_past_recovered_ids(tmp_path):
+    log, store = open_store(tmp_path, time.time_ns)
+    issued = [store.append("alice", "bob", 1.0, b"") for _ in range(3)]
+    log.close()
+
+    # После перезапуска стенные часы отстают на час
+    log, store = open_store(tmp_path, lambda: time.time_ns() - HOUR_NS)
+    try:
+        resumed = store.append("alice", "bob", 1.0, b"")
+        assert resumed > max(issued)
+        assert resumed.startswith("s1-txn_")
+    finally:
+        log.close()
+
+
+def test_advance_past_skips_foreign_ids():
+    allocator = IdAllocator(0, wall_clock_ns=lambda: time.time_ns() - HOUR_NS)
+    assert not allocator.advance_past("txn_42")
+    assert not allocator.advance_past("s2-txn_" + "f" * 16)
+    issued = IdAllocator(0).next_id()
+    assert allocator.advance_past(issued)
+    assert allocator.next_id() > issued
@@ -0,0 +1,75 @@
+import threading
+from concurrent import futures
+
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+import payment_pb2
+from key_registry import KeyRegistry
+from server import PaymentService
+from signature_verifier import SignatureVerifier
+from signing import sign_request
+
+
+class HeldVerifier(SignatureVerifier):
+    """
+    Проверка подписей, которая задерживает результат для подписи forged, пока тест его не отпустит.
+    """
+
+    def __init__(self, forged):
+        super().__init__(max_workers=1)
+        self.forged = forged
+        self.submitted = threading.Event()
+        self.held = futures.Future()
+
+    def submit(self, public_key, signature, message):
+        if signature == self.forged:
+            self.submitted.set()
+            return self.held
+        return super().submit(public_key, signature, message)
+
+
+def new_service(tmp_path, verifier):
+    keys = KeyRegistry(str(tmp_path), reload_interval=0)
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    keys.register("alice", private_key.public_key())
+    return PaymentService(verifier=verifier, keys=keys), private_key
+
+
+def test_unsigned_request_does_not_claim_idempotency_key(tmp_path):
+    verifier = HeldVerifier(b"forged")
+    service, private_key = new_service(tmp_path, verifier)
+    forged = payment_pb2.TransactionRequest(sender_id="alice", receiver_id="mallory", amount=5.0,
+                                            signature=b"forged", idempotency_key="k1", payload_version=1)
+    outcome = []
+    attacker = threading.Thread(target=lambda: outcome.append(service.CreateTransaction(forged, None)))
+    attacker.start()
+    try:
+        assert verifier.submitted.wait(5)
+        # Пока подпись чужого запроса проверяется, ключ отправителя свободен
+        request = sign_request(private_key, payment_pb2.TransactionRequest(
+            sender_id="alice", receiver_id="bob", amount=10.0, idempotency_key="k1"))
+        first = service.CreateTransaction(request, None)
+        assert first.success
+    finally:
+        verifier.held.set_result(False)
+        attacker.join()
+    assert not outcome[0].success
+
+    retry = sign_request(private_key, payment_pb2.TransactionRequest(
+        sender_id="alice", receiver_id="bob", amount=10.0, idempotency_key="k1"))
+    assert service.CreateTransaction(retry, None).transaction_id == first.transaction_id
+    assert len(service.transactions) == 1
+    # Неподписанный повтор не получает ответ на запрос отправителя
+    replay = payment_pb2.TransactionRequest(sender_id="alice", receiver_id="bob", amount=10.0,
+                                            signature=b"bad", idempotency_key="k1", payload_version=1)
+    assert service.CreateTransaction(replay, None) == payment_pb2.TransactionResponse(success=False)
+
+
+def test_batch_rejects_keyed_requests(tmp_path):
+    service, private_key = new_service(tmp_path, SignatureVerifier(max_workers=1))
+    keyed = sign_request(private_key, payment_pb2.TransactionRequest(
+        sender_id="alice", receiver_id="bob", amount=1.0, idempotency_key="k2"))
+    plain = sign_request(private_key, payment_pb2.TransactionRequest(sender_id="alice", receiver_id="bob", amount=2.0))
+    response = service.CreateTransactionBatch(payment_pb2.TransactionBatchRequest(transactions=[keyed, plain]), None)
+    assert [result.success for result in response.results] == [False, True]
+    assert len(service.transactions) == 1
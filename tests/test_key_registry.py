@@ -0,0 +1,46 @@
+import base64
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from key_registry import KeyRegistry
+
+
+def new_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=1024).public_key()
+
+
+def der(public_key):
+    return public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def keystore_line(user_id, public_key):
+    return f"{user_id} {base64.b64encode(der(public_key)).decode()}\n"
+
+
+def test_keystore_rewrite_never_returns_another_users_key(tmp_path):
+    alice, bob, mallory = new_key(), new_key(), new_key()
+    keystore = tmp_path / "keystore"
+    keystore.write_text(keystore_line("alice", alice) + keystore_line("bob", bob))
+    registry = KeyRegistry(str(tmp_path), keystore=str(keystore), reload_interval=0)
+    try:
+        assert der(registry.get("alice")) == der(alice)
+        # Перезапись до того, как реестр заметил изменение: по старому смещению bob теперь строка mallory
+        keystore.write_text(keystore_line("alice", alice) + keystore_line("mallory", mallory)
+                            + keystore_line("bob", bob))
+        assert der(registry.get("bob")) == der(bob)
+        assert der(registry.get("mallory")) == der(mallory)
+    finally:
+        registry.close()
+
+
+def test_corrupt_keystore_entry_is_unknown_user(tmp_path):
+    keystore = tmp_path / "keystore"
+    keystore.write_text("eve not-base64!\ntrent " + base64.b64encode(b"not a key").decode() + "\n")
+    registry = KeyRegistry(str(tmp_path), keystore=str(keystore), reload_interval=0)
+    try:
+        assert registry.get("eve") is None
+        assert registry.get("trent") is None
+        assert "eve" not in registry
+    finally:
+        registry.close()
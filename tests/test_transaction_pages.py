@@ -0,0 +1,32 @@
+import pytest
+
+import payment_pb2
+from server import PaymentService
+from signature_verifier import SignatureVerifier
+
+
+@pytest.fixture
+def service():
+    service = PaymentService(verifier=SignatureVerifier(max_workers=1))
+    for amount in range(1, 5):
+        service.transactions.append("alice", "bob", float(amount), b"")
+    return service
+
+
+def pages(service, **fields):
+    request = payment_pb2.ListTransactionsRequest(**fields)
+    return [([t.amount for t in page.transactions], page.cursor) for page in service.transaction_pages(request, 0)]
+
+
+def test_exactly_filled_last_page_carries_end_marker(service):
+    assert pages(service, page_size=2) == [([1.0, 2.0], "2"), ([3.0, 4.0], "")]
+    assert pages(service, page_size=4) == [([1.0, 2.0, 3.0, 4.0], "")]
+
+
+def test_partial_last_page_and_empty_result(service):
+    assert pages(service, page_size=3) == [([1.0, 2.0, 3.0], "3"), ([4.0], "")]
+    assert pages(service, sender_id="carol") == [([], "")]
+
+
+def test_limit_ends_with_cursor(service):
+    assert pages(service, page_size=2, limit=3) == [([1.0, 2.0], "2"), ([3.0], "3")]
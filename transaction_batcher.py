@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from concurrent import futures
+
+import payment_pb2
+
+
+class TransactionBatcher:
+    """
+    Клиентский помощник, который собирает отдельные вызовы CreateTransaction
+    в пачки CreateTransactionBatch в пределах окна ожидания.
+    Запросы с ключом идемпотентности сервер в пачках не принимает, они отправляются отдельным вызовом.
+    """
+
+    def __init__(self, stub, linger=0.005, max_batch_size=500, timeout=None):
+        """
+        :param stub: PaymentServiceStub.
+        :param linger: Сколько секунд ждать попутные запросы после первого.
+        :param max_batch_size: Максимальный размер пачки.
+        :param timeout: Таймаут вызова CreateTransactionBatch.
+        """
+        self.stub = stub
+        self.linger = linger
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="transaction-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        """
+        Постановка транзакции в очередь.
+        :return: Future с TransactionResponse.
+        """
+        if self._closed:
+            raise RuntimeError("TransactionBatcher is closed")
+        if request.idempotency_key:
+            return self.stub.CreateTransaction.future(request, timeout=self.timeout)
+        future = futures.Future()
+        self._queue.put((request, future))
+        return future
+
+    def create_transaction(self, request):
+        """
+        Блокирующий аналог PaymentServiceStub.CreateTransaction.
+        """
+        return self.submit(request).result()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Сигнал закрытия возвращаем в очередь, чтобы отправить текущую пачку
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                response = self.stub.CreateTransactionBatch(
+                    payment_pb2.TransactionBatchRequest(transactions=[request for request, _ in batch]),
+                    timeout=self.timeout
+                )
+                for (_, future), result in zip(batch, response.results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def close(self):
+        """
+        Отправка накопленных запросов и остановка фонового потока.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
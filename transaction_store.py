@@ -0,0 +1,461 @@
+import bisect
+import threading
+import time
+from array import array
+
+from balance_engine import to_minor
+from id_allocator import IdAllocator
+from ledger_log import encode_batch, encode_record
+from metrics import LEDGER_APPEND_SECONDS
+
+
+def _id_prefix(transaction_id):
+    # ID одного префикса (шарда) выдаются по возрастанию времени, между префиксами порядка нет
+    head, separator, _ = transaction_id.rpartition("txn_")
+    return head + separator
+
+
+class Transaction:
+    """
+    Легковесное представление одной записи леджера.
+    Создается только при чтении, само хранилище держит данные в колонках.
+    """
+    __slots__ = ("id", "sender_id", "receiver_id", "amount", "signature")
+
+    def __init__(self, transaction_id, sender_id, receiver_id, amount, signature):
+        self.id = transaction_id
+        self.sender_id = sender_id
+        self.receiver_id = receiver_id
+        self.amount = amount
+        self.signature = signature
+
+    def __repr__(self):
+        return (f"Transaction(id={self.id}, sender_id={self.sender_id}, "
+                f"receiver_id={self.receiver_id}, amount={self.amount})")
+
+
+class AccountTotals:
+    """
+    Итоги по счету в леджере: суммы в копейках и количество транзакций.
+    """
+    __slots__ = ("account_id", "sent_total", "sent_count", "received_total", "received_count")
+
+    def __init__(self, account_id, sent_total, sent_count, received_total, received_count):
+        self.account_id = account_id
+        self.sent_total = sent_total
+        self.sent_count = sent_count
+        self.received_total = received_total
+        self.received_count = received_count
+
+    def __repr__(self):
+        return (f"AccountTotals(account_id={self.account_id}, sent={self.sent_total}/{self.sent_count}, "
+                f"received={self.received_total}/{self.received_count})")
+
+
+class TransactionStore:
+    """
+    Колоночное хранилище транзакций с хэш-индексом по ID
+    и вторичными индексами по отправителю и получателю.
+    Итоги по счетам обновляются при каждом добавлении, поэтому для сверки леджер не перечитывается.
+    Строки с журналом видны читателям только после fsync их группы: до этого они есть
+    в колонках, но отсекаются границей _visible, а при сбое записи удаляются.
+    """
+
+    def __init__(self, log=None, id_allocator=None):
+        """
+        :param log: LedgerLog для durable-записи (по умолчанию транзакции хранятся только в памяти).
+        :param id_allocator: IdAllocator для ID новых транзакций.
+        """
+        self._log = log
+        # ID выдаются до захвата блокировки и не зависят от числа строк
+        self.id_allocator = id_allocator if id_allocator is not None else IdAllocator()
+        self._lock = threading.Lock()  # Защищает только добавление, чтение идет без блокировок
+        self._ids = []                 # ID транзакций в порядке добавления
+        self._senders = array("I")     # Коды отправителей
+        self._receivers = array("I")   # Коды получателей
+        self._amounts = array("d")     # Суммы
+        self._signatures = []          # Подписи (байты как в запросе)
+        self._parties = []             # Код участника -> идентификатор пользователя
+        self._party_codes = {}         # Идентификатор пользователя -> код участника
+        self._by_id = {}               # ID транзакции -> номер строки
+        self._by_sender = {}           # Код отправителя -> номера строк
+        self._by_receiver = {}         # Код получателя -> номера строк
+        # Префикс ID -> (отсортированные ID, их номера строк) для выборок по диапазону ID. ID выдаются почти
+        # по порядку, поэтому вставка идет у конца списка
+        self._by_prefix = {}
+        # Итоги по коду участника: суммы в копейках и количество транзакций
+        self._sent_totals = array("q")
+        self._sent_counts = array("Q")
+        self._received_totals = array("q")
+        self._received_counts = array("Q")
+        self._visible = 0              # Строки до этой durable и видны читателям, итоги учитывают только их
+        self._unpublished = {}         # CommitGroup -> [первая строка, конец, число счетов до нее]
+        self._last_group = None        # Группа последней добавленной строки
+
+    def __len__(self):
+        return self._visible
+
+    @property
+    def durable(self):
+        """
+        True, если добавление ждет fsync журнала и может блокировать поток.
+        """
+        return self._log is not None
+
+    def __contains__(self, transaction_id):
+        row = self._by_id.get(transaction_id)
+        return row is not None and row < self._visible
+
+    def __iter__(self):
+        # Транзакции в порядке добавления; строки, ставшие видимыми во время обхода, тоже попадут в него
+        row = 0
+        while row < self._visible:
+            yield self._row(row)
+            row += 1
+
+    def _party_code(self, user_id):
+        code = self._party_codes.get(user_id)
+        if code is None:
+            code = len(self._parties)
+            self._parties.append(user_id)
+            for totals in (self._sent_totals, self._sent_counts, self._received_totals, self._received_counts):
+                totals.append(0)
+            self._party_codes[user_id] = code
+        return code
+
+    def _add_totals(self, sender, receiver, amount):
+        amount = to_minor(amount)
+        self._sent_totals[sender] += amount
+        self._sent_counts[sender] += 1
+        self._received_totals[receiver] += amount
+        self._received_counts[receiver] += 1
+
+    def _append_locked(self, transaction_id, sender_id, receiver_id, amount, signature, logged=True):
+        # Запись сначала ставится в журнал, чтобы порядок в нем совпадал с порядком строк
+        group = None
+        if logged and self._log is not None:
+            group = self._log.submit(encode_record(transaction_id, sender_id, receiver_id, amount, signature))
+        self._add_row_locked(group, transaction_id, sender_id, receiver_id, amount, signature)
+        return group
+
+    def _add_row_locked(self, group, transaction_id, sender_id, receiver_id, amount, signature):
+        row = len(self._ids)
+        parties = len(self._parties)
+        sender = self._party_code(sender_id)
+        receiver = self._party_code(receiver_id)
+        self._senders.append(sender)
+        self._receivers.append(receiver)
+        self._amounts.append(amount)
+        self._signatures.append(signature)
+        self._ids.append(transaction_id)
+        self._by_id[transaction_id] = row
+        self._by_sender.setdefault(sender, array("Q")).append(row)
+        self._by_receiver.setdefault(receiver, array("Q")).append(row)
+        ids, rows = self._by_prefix.setdefault(_id_prefix(transaction_id), ([], array("Q")))
+        position = bisect.bisect_right(ids, transaction_id)
+        ids.insert(position, transaction_id)
+        rows.insert(position, row)
+        if group is None:
+            self._publish_locked(row + 1)
+        else:
+            self._unpublished.setdefault(group, [row, row, parties])[1] = row + 1
+            self._last_group = group
+
+    def _publish_locked(self, end):
+        # Итоги учитывают строку, когда она становится видимой, в порядке строк
+        for row in range(self._visible, end):
+            self._add_totals(self._senders[row], self._receivers[row], self._amounts[row])
+        self._visible = max(self._visible, end)
+
+    def _discard_locked(self, group):
+        # Журнал после сбоя записи отклоняет и все следующие группы, поэтому удаляется весь хвост с первой
+        # строки группы; строки раньше нее уже на диске, даже если их еще не успели опубликовать
+        rows = self._unpublished.get(group)
+        if rows is None:
+            return
+        first, _, parties = rows
+        for row in range(len(self._ids) - 1, first - 1, -1):
+            transaction_id = self._ids[row]
+            del self._by_id[transaction_id]
+            ids, rows = self._by_prefix[_id_prefix(transaction_id)]
+            position = bisect.bisect_left(ids, transaction_id)
+            del ids[position]
+            del rows[position]
+            self._by_sender[self._senders[row]].pop()
+            self._by_receiver[self._receivers[row]].pop()
+        for column in (self._ids, self._senders, self._receivers, self._amounts, self._signatures):
+            del column[first:]
+        # Счета, впервые появившиеся в удаленных строках, теряют коды, как и после перезапуска
+        for code in range(parties, len(self._parties)):
+            del self._party_codes[self._parties[code]]
+            self._by_sender.pop(code, None)
+            self._by_receiver.pop(code, None)
+        for column in (self._parties, self._sent_totals, self._sent_counts, self._received_totals,
+                       self._received_counts):
+            del column[parties:]
+        self._unpublished = {other: span for other, span in self._unpublished.items() if span[0] < first}
+
+    def _commit(self, group, before, after, start):
+        # Ожидание fsync идет вне блокировки, чтобы одна группа покрывала много транзакций
+        if group is not None:
+            try:
+                group.wait()
+            except Exception:
+                with self._lock:
+                    self._discard_locked(group)
+                raise
+            with self._lock:
+                rows = self._unpublished.pop(group, None)
+                if rows is not None:
+                    self._publish_locked(rows[1])
+        if self._log is not None:
+            self._log.maybe_snapshot(self, before, after)
+        LEDGER_APPEND_SECONDS.observe(time.perf_counter() - start)
+
+    def append(self, sender_id, receiver_id, amount, signature):
+        """
+        Добавление транзакции в хранилище.
+        При наличии журнала возвращает управление только после записи на диск.
+        :return: ID новой транзакции.
+        """
+        start = time.perf_counter()
+        transaction_id = self.id_allocator.next_id()
+        with self._lock:
+            before = len(self._ids)
+            group = self._append_locked(transaction_id, sender_id, receiver_id, amount, signature)
+        self._commit(group, before, before + 1, start)
+        return transaction_id
+
+    def append_foreign(self, transaction_id, sender_id, receiver_id, amount, signature):
+        """
+        Добавление транзакции с готовым ID, созданной другим шардом.
+        Повторная запись с тем же ID пропускается, поэтому повтор вызова безопасен.
+        :return: True, если транзакция добавлена, False, если она уже была.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if transaction_id in self._by_id:
+                return False
+            before = len(self._ids)
+            group = self._append_locked(transaction_id, sender_id, receiver_id, amount, signature)
+        self._commit(group, before, before + 1, start)
+        return True
+
+    def append_many(self, transactions):
+        """
+        Добавление пачки транзакций одним блоком: другие записи не вклиниваются между ними.
+        В журнал пачка пишется одним кадром, поэтому после сбоя она восстанавливается целиком или никак.
+        :param transactions: Кортежи (sender_id, receiver_id, amount, signature).
+        :return: Список ID в порядке добавления.
+        """
+        transactions = list(transactions)
+        group = None
+        start = time.perf_counter()
+        transaction_ids = self.id_allocator.take(len(transactions))
+        with self._lock:
+            before = len(self._ids)
+            if self._log is not None and transactions:
+                group = self._log.submit(encode_batch(
+                    [encode_record(transaction_id, *transaction)
+                     for transaction_id, transaction in zip(transaction_ids, transactions)]))
+            for transaction_id, transaction in zip(transaction_ids, transactions):
+                self._add_row_locked(group, transaction_id, *transaction)
+        self._commit(group, before, before + len(transaction_ids), start)
+        return transaction_ids
+
+    def restore(self, transaction_id, sender_id, receiver_id, amount, signature):
+        """
+        Добавление транзакции из журнала при восстановлении (без повторной записи в журнал).
+        """
+        with self._lock:
+            self._append_locked(transaction_id, sender_id, receiver_id, amount, signature, logged=False)
+
+    def resume_ids(self):
+        """
+        Продолжение выдачи ID после восстановленных транзакций этого префикса.
+        """
+        entry = self._by_prefix.get(self.id_allocator.prefix)
+        if entry is None:
+            return
+        # ID генератора фиксированной ширины, старые ID другого формата могут оказаться в конце сортировки
+        for transaction_id in reversed(entry[0]):
+            if self.id_allocator.advance_past(transaction_id):
+                return
+
+    def load(self, ids, parties, senders, receivers, amounts, signatures):
+        """
+        Загрузка колонок из снимка с перестроением индексов.
+        """
+        with self._lock:
+            self._ids = list(ids)
+            self._parties = list(parties)
+            self._party_codes = {user_id: code for code, user_id in enumerate(self._parties)}
+            self._senders = senders
+            self._receivers = receivers
+            self._amounts = amounts
+            self._signatures = list(signatures)
+            self._by_id = dict(zip(self._ids, range(len(self._ids))))
+            self._by_sender = {}
+            self._by_receiver = {}
+            self._by_prefix = {}
+            prefixes = {}
+            for row, transaction_id in enumerate(self._ids):
+                prefixes.setdefault(_id_prefix(transaction_id), []).append((transaction_id, row))
+            for prefix, entries in prefixes.items():
+                entries.sort()
+                self._by_prefix[prefix] = ([entry[0] for entry in entries], array("Q", (entry[1] for entry in entries)))
+            for totals in (self._sent_totals, self._sent_counts, self._received_totals, self._received_counts):
+                del totals[:]
+                totals.extend([0] * len(self._parties))
+            for row, (sender, receiver, amount) in enumerate(zip(senders, receivers, amounts)):
+                self._by_sender.setdefault(sender, array("Q")).append(row)
+                self._by_receiver.setdefault(receiver, array("Q")).append(row)
+                self._add_totals(sender, receiver, amount)
+            self._visible = len(self._ids)
+
+    def capture(self, rotate):
+        """
+        Согласованная копия колонок для снимка.
+        Возвращается, когда все скопированные строки записаны на диск.
+        :param rotate: Функция переключения сегмента журнала, вызывается под той же блокировкой.
+        :return: Кортеж (номер сегмента, колонки).
+        :raises Exception: Ошибка записи группы последней строки: снимок с такими строками делать нельзя.
+        """
+        with self._lock:
+            segment = rotate()
+            columns = (list(self._ids), list(self._parties), array("I", self._senders),
+                       array("I", self._receivers), array("d", self._amounts), list(self._signatures))
+            group = self._last_group if self._unpublished else None
+        if group is not None:
+            group.wait()
+        return segment, columns
+
+    def _row(self, row):
+        return Transaction(
+            self._ids[row],
+            self._parties[self._senders[row]],
+            self._parties[self._receivers[row]],
+            self._amounts[row],
+            self._signatures[row],
+        )
+
+    def get(self, transaction_id):
+        """
+        Поиск транзакции по ID за O(1).
+        :return: Transaction или None, если транзакция не найдена.
+        """
+        row = self._by_id.get(transaction_id)
+        if row is None or row >= self._visible:
+            return None
+        return self._row(row)
+
+    def by_sender(self, sender_id):
+        """
+        Транзакции отправителя в порядке добавления.
+        """
+        code = self._party_codes.get(sender_id)
+        if code is None:
+            return
+        for row in self._by_sender.get(code, ()):
+            if row >= self._visible:
+                return
+            yield self._row(row)
+
+    def by_receiver(self, receiver_id):
+        """
+        Транзакции получателя в порядке добавления.
+        """
+        code = self._party_codes.get(receiver_id)
+        if code is None:
+            return
+        for row in self._by_receiver.get(code, ()):
+            if row >= self._visible:
+                return
+            yield self._row(row)
+
+    def query(self, sender_id="", receiver_id="", start_id="", end_id="", start_row=0):
+        """
+        Выборка транзакций в порядке добавления без копирования колонок.
+        Номера строк не меняются после перезапуска (леджер восстанавливается в том же порядке),
+        поэтому номер следующей строки служит курсором для продолжения выборки.
+        :param sender_id: Только транзакции этого отправителя.
+        :param receiver_id: Только транзакции этого получателя.
+        :param start_id: Нижняя граница ID включительно.
+        :param end_id: Верхняя граница ID не включительно.
+        :param start_row: Номер строки, с которой начинается выборка.
+        :return: Генератор кортежей (номер строки, Transaction).
+        """
+        rows = None
+        if start_id or end_id:
+            rows = self._id_range_rows(start_id, end_id)
+        # Обход идет по меньшему из индексов, остальные фильтры проверяются по колонкам
+        for party_id, index in ((sender_id, self._by_sender), (receiver_id, self._by_receiver)):
+            if party_id:
+                code = self._party_codes.get(party_id)
+                if code is None:
+                    return
+                candidate = index.get(code, ())
+                if rows is None or len(candidate) < len(rows):
+                    rows = candidate
+        sender = self._party_codes.get(sender_id) if sender_id else None
+        receiver = self._party_codes.get(receiver_id) if receiver_id else None
+        # Как и в __iter__, строки, ставшие видимыми во время выборки, тоже попадут в нее
+        if rows is None:
+            rows = self._ids
+            position = start_row
+        else:
+            position = bisect.bisect_left(rows, start_row)
+        while position < len(rows):
+            row = position if rows is self._ids else rows[position]
+            if row >= self._visible:
+                return
+            position += 1
+            if sender is not None and self._senders[row] != sender:
+                continue
+            if receiver is not None and self._receivers[row] != receiver:
+                continue
+            transaction_id = self._ids[row]
+            if transaction_id < start_id or (end_id and transaction_id >= end_id):
+                continue
+            yield row, self._row(row)
+
+    def _id_range_rows(self, start_id, end_id):
+        """
+        Номера строк с ID в диапазоне по возрастанию или None, если диапазон покрывает почти весь леджер
+        и дешевле обойти строки подряд.
+        """
+        with self._lock:
+            spans = []
+            for ids, rows in self._by_prefix.values():
+                low = bisect.bisect_left(ids, start_id) if start_id else 0
+                high = bisect.bisect_left(ids, end_id) if end_id else len(ids)
+                if low < high:
+                    spans.append(rows[low:high])
+        if sum(map(len, spans)) * 2 > len(self._ids):
+            return None
+        if len(spans) == 1:
+            return sorted(spans[0])
+        return sorted(row for span in spans for row in span)
+
+    def party_codes(self, account_ids=None, start_code=0):
+        """
+        Коды счетов по возрастанию, то есть в порядке первого появления счета в леджере.
+        Код не меняется после перезапуска и служит курсором для итогов по счетам.
+        :param account_ids: Только эти счета; неизвестные пропускаются (по умолчанию все счета на момент вызова).
+        :param start_code: Наименьший код в выборке.
+        """
+        if account_ids is None:
+            return range(start_code, len(self._parties))
+        return sorted(code for code in map(self._party_codes.get, set(account_ids))
+                      if code is not None and code >= start_code)
+
+    def account_totals(self, codes):
+        """
+        Итоги по счетам. Читаются под блокировкой, поэтому суммы и количества согласованы между собой.
+        :param codes: Коды счетов из party_codes().
+        :return: Список AccountTotals в порядке кодов.
+        """
+        with self._lock:
+            return [AccountTotals(self._parties[code], self._sent_totals[code], self._sent_counts[code],
+                                  self._received_totals[code], self._received_counts[code])
+                    for code in codes]